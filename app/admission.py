@@ -0,0 +1,227 @@
+"""
+准入控制 - 账号池饱和时按 API Key 加权公平地分配上游并发
+- 并发上限为每个已认证账号 per_account_concurrency 个（或 max_concurrent），有空位时直接放行
+- 没有空位时排队：先按 Key 的优先级，同优先级按虚拟完成时间（start-time fair queuing，
+  每个 Key 按 1/weight 推进）出队，排队多的 Key 不能挤占其他 Key 的份额
+- 队列有总长度和单 Key 长度上限，满时立即拒绝；排队超过 queue_timeout 秒同样拒绝，由调用方返回 503
+acquire 返回的凭据交给 release：只有真正占用了名额（SLOT）的调用才归还，运行中重新加载配置开关准入控制不会泄漏名额
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+
+# acquire 的返回值：占用了并发名额 / 准入控制未开启，未占用名额；被拒绝时返回 False
+SLOT = "slot"
+BYPASS = "bypass"
+
+
+class _Waiter:
+    """一个排队中的请求，grant 在获得名额时调用"""
+
+    __slots__ = ("key", "grant", "granted", "cancelled")
+
+    def __init__(self, key, grant):
+        self.key = key
+        self.grant = grant
+        self.granted = False
+        self.cancelled = False
+
+
+class AdmissionController:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.per_account_concurrency = 4
+        self.max_concurrent = 0
+        self.max_queue = 256
+        self.max_queue_per_key = 64
+        self.queue_timeout = 5.0
+        self.in_flight = 0
+        self._heap = []
+        self._seq = itertools.count()
+        self._queued = 0
+        self._queued_by_key = {}
+        self._finish = {}
+        self._vtime = 0.0
+        self._capacity = 1
+        self._capacity_at = 0.0
+        self.admitted = 0
+        self.waited = 0
+        self.shed = 0
+        self.timeouts = 0
+
+    def load_from_config(self):
+        """从 config.yaml 加载准入控制配置"""
+        from app.config import config
+
+        cfg = config.admission
+        self.enabled = cfg.get("enabled", False)
+        self.per_account_concurrency = cfg.get("per_account_concurrency", self.per_account_concurrency)
+        self.max_concurrent = cfg.get("max_concurrent", self.max_concurrent)
+        self.max_queue = cfg.get("max_queue", self.max_queue)
+        self.max_queue_per_key = cfg.get("max_queue_per_key", self.max_queue_per_key)
+        self.queue_timeout = cfg.get("queue_timeout", self.queue_timeout)
+        self._capacity_at = 0.0
+        # 关闭后不再排队：已在队列中的请求全部放行；开启或容量变化时按新容量出队
+        with self.lock:
+            grants = self._dispatch(unlimited=not self.enabled)
+        for grant in grants:
+            grant()
+        if self.enabled:
+            print(f"[Admission] Fair queuing enabled, max_queue: {self.max_queue}, "
+                  f"queue_timeout: {self.queue_timeout}s")
+
+    def capacity(self):
+        """当前并发上限，每秒按已认证账号数重新计算一次"""
+        now = time.monotonic()
+        if now - self._capacity_at >= 1.0:
+            if self.max_concurrent:
+                capacity = self.max_concurrent
+            else:
+                from app.pool import pool
+                capacity = self.per_account_concurrency * sum(1 for a in pool.accounts if a.authenticated)
+            self._capacity = max(1, capacity)
+            self._capacity_at = now
+        return self._capacity
+
+    # ---------- 排队（均在 self.lock 内调用） ----------
+
+    def _admit_now(self):
+        if self._queued == 0 and self.in_flight < self.capacity():
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        return False
+
+    def _enqueue(self, key, weight, priority, grant):
+        """加入队列，队列已满时返回 None"""
+        queued = self._queued_by_key.get(key, 0)
+        if self._queued >= self.max_queue or queued >= self.max_queue_per_key:
+            self.shed += 1
+            return None
+        # 空闲后重新到来的 Key 从当前虚拟时间开始，不累积份额
+        finish = max(self._vtime, self._finish.get(key, 0.0)) + 1.0 / max(weight, 0.01)
+        self._finish[key] = finish
+        waiter = _Waiter(key, grant)
+        heapq.heappush(self._heap, (-priority, finish, next(self._seq), waiter))
+        self._queued += 1
+        self._queued_by_key[key] = queued + 1
+        self.waited += 1
+        return waiter
+
+    def _dequeued(self, waiter):
+        self._queued -= 1
+        remaining = self._queued_by_key[waiter.key] - 1
+        if remaining:
+            self._queued_by_key[waiter.key] = remaining
+        else:
+            del self._queued_by_key[waiter.key]
+
+    def _cancel(self, waiter):
+        """等待超时或调用方取消，队列中的条目在出队时跳过"""
+        waiter.cancelled = True
+        self._dequeued(waiter)
+        self.timeouts += 1
+
+    def _dispatch(self, unlimited=False):
+        """把空出的名额分给队首，返回需要在锁外调用的 grant；unlimited 时不受容量限制"""
+        grants = []
+        while self._heap and (unlimited or self.in_flight < self.capacity()):
+            _, finish, _, waiter = heapq.heappop(self._heap)
+            if waiter.cancelled:
+                continue
+            self._dequeued(waiter)
+            self._vtime = finish
+            self.in_flight += 1
+            self.admitted += 1
+            waiter.granted = True
+            grants.append(waiter.grant)
+        return grants
+
+    # ---------- 获取 / 释放 ----------
+
+    def acquire(self, key="", weight=1.0, priority=0):
+        """获取一个上游并发名额，返回交给 release 的凭据；被拒绝（队列满或等待超时）时返回 False"""
+        if not self.enabled:
+            return BYPASS
+        event = threading.Event()
+        with self.lock:
+            if self._admit_now():
+                return SLOT
+            waiter = self._enqueue(key, weight, priority, event.set)
+            if waiter is None:
+                return False
+        if event.wait(self.queue_timeout):
+            return SLOT
+        with self.lock:
+            # 超时的同时可能刚好获得名额
+            if waiter.granted:
+                return SLOT
+            self._cancel(waiter)
+        return False
+
+    async def acquire_async(self, key="", weight=1.0, priority=0):
+        """acquire 的 asyncio 版本，等待期间不占用线程"""
+        if not self.enabled:
+            return BYPASS
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(True))
+
+        with self.lock:
+            if self._admit_now():
+                return SLOT
+            waiter = self._enqueue(key, weight, priority, grant)
+            if waiter is None:
+                return False
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+            return SLOT
+        except asyncio.TimeoutError:
+            with self.lock:
+                if waiter.granted:
+                    return SLOT
+                self._cancel(waiter)
+            return False
+        except asyncio.CancelledError:
+            # 客户端断开：已获得的名额要归还
+            with self.lock:
+                granted = waiter.granted
+                if not granted:
+                    self._cancel(waiter)
+            if granted:
+                self.release(SLOT)
+            raise
+
+    def release(self, ticket):
+        """归还 acquire 获得的名额（无论当前是否开启），未占用名额的凭据直接忽略"""
+        if ticket != SLOT:
+            return
+        with self.lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            grants = self._dispatch()
+        for grant in grants:
+            grant()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "capacity": self._capacity,
+                "in_flight": self.in_flight,
+                "queued": self._queued,
+                "queued_by_key": dict(self._queued_by_key),
+                "admitted": self.admitted,
+                "waited": self.waited,
+                "shed": self.shed,
+                "timeouts": self.timeouts,
+            }
+
+
+admission = AdmissionController()
@@ -0,0 +1,338 @@
+"""
+ASGI 应用 - 可选的 asyncio 服务模式（server.mode: asgi）
+插画、用户、搜索、排行、推荐和图片下载等上游请求在事件循环中异步处理，
+鉴权、API Key 权限、池限制、缓存和负载均衡与 Flask 路由完全一致；
+其余路径（管理接口、UI、缓存命中的图片等）转交给 Flask 应用处理
+"""
+import asyncio
+import math
+import mimetypes
+import os
+import re
+import time
+from urllib.parse import parse_qs, urlparse, quote
+from app.auth import authorize_api_key, check_key_limits
+from app.async_client import async_client
+from app.cache import response_cache, serialize_json
+from app.encoding import compressor
+from app.image_cache import image_cache
+from app.metrics import metrics
+from app.timing import record_phase, timing
+from app.pagination import wants_all
+from app.projection import parse_fields, project
+from app.admission import admission
+from app.upstream import UpstreamUnavailable, admit_async, choose_account
+from app.routes.illust import DOWNLOAD_REFERER, DOWNLOAD_CHUNK_SIZE, DOWNLOAD_PASSTHROUGH_HEADERS
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    WSGIMiddleware = None
+
+
+class Request:
+    """ASGI 请求的最小封装"""
+
+    __slots__ = ("scope", "path", "args", "headers", "key_value", "started")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.path = scope["path"]
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)
+        self.args = {k: v[0] for k, v in query.items()}
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        self.key_value = None
+        self.started = False  # 响应头已发送（流式下载），之后出错只能中断连接
+
+    def arg(self, name, default=None, type=None):
+        """与 Flask request.args.get 相同：转换失败时返回默认值"""
+        value = self.args.get(name)
+        if value is None:
+            return default
+        if type is not None:
+            try:
+                return type(value)
+            except ValueError:
+                return default
+        return value
+
+
+class AsgiApp:
+    """按路径分发：上游数据接口走异步处理，其余交给 Flask（WSGI）"""
+
+    def __init__(self, flask_app, wsgi_threads=16):
+        self.flask_app = flask_app
+        if WSGIMiddleware is not None:
+            self.wsgi = WSGIMiddleware(flask_app, workers=wsgi_threads)
+        else:
+            from uvicorn.middleware.wsgi import WSGIMiddleware as UvicornWSGIMiddleware
+            self.wsgi = UvicornWSGIMiddleware(flask_app, workers=wsgi_threads)
+        # (路径模式, 处理函数, 指标中的路由名，与 Flask 路由规则一致)
+        self.routes = [
+            (re.compile(r"/api/illust/(\d+)"), self.illust_detail, "/api/illust/<int:illust_id>"),
+            (re.compile(r"/api/search"), self.search, "/api/search"),
+            (re.compile(r"/api/ranking"), self.ranking, "/api/ranking"),
+            (re.compile(r"/api/recommended"), self.recommended, "/api/recommended"),
+            (re.compile(r"/api/user/(\d+)"), self.user_detail, "/api/user/<int:user_id>"),
+            (re.compile(r"/api/user/(\d+)/illusts"), self.user_illusts, "/api/user/<int:user_id>/illusts"),
+            (re.compile(r"/api/download"), self.download, "/api/download"),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] == "http" and scope["method"] == "GET":
+            for pattern, handler, route in self.routes:
+                match = pattern.fullmatch(scope["path"])
+                if match:
+                    request = Request(scope)
+                    # 缓存命中的图片由 Flask 的 send_file 发送（支持 Range 与条件请求）；
+                    # 这里只判断是否存在，命中统计由 Flask 的查找记录，磁盘访问不阻塞事件循环
+                    if (handler == self.download and image_cache.enabled
+                            and await asyncio.to_thread(image_cache.exists, request.arg("url", ""))):
+                        break
+                    # ?all=true 的分页遍历由 Flask 流式输出
+                    if wants_all(request.arg("all")):
+                        break
+                    return await self.timed(route, handler, request, match.groups(), send)
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                async_client.load_from_config()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await async_client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def timed(self, route, handler, request, path_args, send):
+        """记录请求耗时（到响应结束），与 Flask 请求使用同一直方图；Server-Timing 为发送响应头时的耗时分解"""
+        start = time.perf_counter()
+        status = [500]
+        token = timing.begin()
+        current = timing.current()
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if current is not None and timing.server_timing:
+                    message = dict(message, headers=list(message.get("headers", []))
+                                   + [(b"server-timing", current.header().encode("latin-1"))])
+            await send(message)
+
+        try:
+            await self.dispatch(handler, request, path_args, send_with_status)
+        finally:
+            metrics.observe("pixiv_http_request_duration_seconds", (route, "GET", str(status[0])),
+                            time.perf_counter() - start)
+            if current is not None:
+                query = request.scope.get("query_string", b"").decode("latin-1")
+                timing.finish(current, "GET", request.path + ("?" + query if query else ""), status[0],
+                              request.key_value)
+            timing.end(token)
+
+    async def dispatch(self, handler, request, path_args, send):
+        start = time.perf_counter()
+        key_value, error, status = authorize_api_key(request.headers.get("authorization", ""), request.path)
+        if error:
+            return await self.send_json(send, {"error": error}, status)
+        limited = check_key_limits(key_value)
+        record_phase("auth", time.perf_counter() - start)
+        if limited:
+            error, status, headers = limited
+            return await self.send_json(send, {"error": error}, status, headers)
+        request.key_value = key_value
+        try:
+            await handler(request, send, *path_args)
+        except UpstreamUnavailable as e:
+            headers = {"Retry-After": str(int(math.ceil(e.retry_after)))} if e.retry_after else None
+            await self.send_json(send, {"error": str(e)}, e.status, headers)
+        except Exception as e:
+            if request.started:
+                raise
+            await self.send_json(send, {"error": str(e)}, 500)
+
+    # ---------- 响应 ----------
+
+    async def send_body(self, send, status, body, headers):
+        raw = [(k.lower().encode("latin-1"), str(v).encode("latin-1")) for k, v in headers.items()]
+        raw.append((b"content-length", str(len(body)).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": raw})
+        await send({"type": "http.response.body", "body": body})
+
+    async def send_json(self, send, value, status=200, headers=None, request=None):
+        with self.flask_app.app_context():
+            body = serialize_json(value)
+        await self.send_json_body(send, request, body, headers or {}, status)
+
+    async def send_json_body(self, send, request, body, headers, status=200, memo=None):
+        """发送 JSON 响应体，与 Flask 路由相同地按 Accept-Encoding 压缩（memo 为缓存条目的压缩结果）"""
+        headers = {"Content-Type": "application/json", **headers}
+        if request is not None:
+            body, encoding = compressor.encode(body, request.headers.get("accept-encoding", ""), memo)
+            if encoding:
+                headers["Content-Encoding"] = encoding
+            headers["Vary"] = "Accept-Encoding"
+        await self.send_body(send, status, body, headers)
+
+    async def cached_json(self, send, request, name, params, fetch):
+        """与 app.cache.cached_json 相同的缓存语义、字段投影和响应体"""
+        key, ttl = response_cache.key_for(name, params, request.key_value)
+        fields = parse_fields(request.arg("fields"))
+        status = "HIT"
+        if fields is None:
+            entry = response_cache.get(key) if ttl > 0 else None
+            if entry is None:
+                value = await fetch()
+                with self.flask_app.app_context():
+                    entry = response_cache.store(key, value, ttl)
+                status = "MISS"
+        else:
+            # 先查投影视图，未命中时才查找完整结果
+            entry = response_cache.lookup_view(key, ttl, fields)
+            if entry is None:
+                full = response_cache.get(key) if ttl > 0 else None
+                if full is not None:
+                    with self.flask_app.app_context():
+                        entry = response_cache.store_projected(key, ttl, fields, entry=full)
+                else:
+                    value = await fetch()
+                    with self.flask_app.app_context():
+                        entry = response_cache.store_projected(key, ttl, fields, value=value)
+                    status = "MISS"
+        await self.send_json_body(send, request, entry.body, {"X-Cache": status}, memo=entry.encoded)
+
+    def call(self, request, method, *args, **kwargs):
+        return async_client.call_api(request.key_value, request.arg("lb"), method, *args, **kwargs)
+
+    # ---------- 路由 ----------
+
+    async def illust_detail(self, request, send, illust_id):
+        illust_id = int(illust_id)
+        await self.cached_json(send, request, "illust_detail", {"illust_id": illust_id},
+                               lambda: self.call(request, "illust_detail", illust_id))
+
+    async def search(self, request, send):
+        word = request.arg("word", "")
+        offset = request.arg("offset", 0, type=int)
+        await self.cached_json(send, request, "search", {"word": word, "offset": offset},
+                               lambda: self.call(request, "search_illust", word, offset=offset))
+
+    async def ranking(self, request, send):
+        mode = request.arg("mode", "day")
+        offset = request.arg("offset", 0, type=int)
+        await self.cached_json(send, request, "ranking", {"mode": mode, "offset": offset},
+                               lambda: self.call(request, "illust_ranking", mode=mode, offset=offset))
+
+    async def recommended(self, request, send):
+        offset = request.arg("offset", 0, type=int)
+        result = await self.call(request, "illust_recommended", offset=offset)
+        await self.send_json(send, project(result, parse_fields(request.arg("fields"))), request=request)
+
+    async def user_detail(self, request, send, user_id):
+        user_id = int(user_id)
+        await self.cached_json(send, request, "user_detail", {"user_id": user_id},
+                               lambda: self.call(request, "user_detail", user_id))
+
+    async def user_illusts(self, request, send, user_id):
+        offset = request.arg("offset", 0, type=int)
+        result = await self.call(request, "user_illusts", int(user_id), offset=offset)
+        await self.send_json(send, project(result, parse_fields(request.arg("fields"))), request=request)
+
+    async def download(self, request, send):
+        """流式转发图片，与 Flask 版本相同的头部处理和磁盘缓存写入"""
+        url = request.arg("url", "")
+        if not url:
+            return await self.send_json(send, {"error": "url required"}, 400)
+        filename = os.path.basename(urlparse(url).path)
+
+        # 与 API 调用一样经过准入控制，名额在转发结束（或客户端断开）时归还
+        ticket = await admit_async(request.key_value)
+        try:
+            await self.stream_download(request, send, url, filename)
+        finally:
+            admission.release(ticket)
+
+    async def stream_download(self, request, send, url, filename):
+        """选择账号并流式转发上游图片"""
+        account = choose_account(request.key_value, request.arg("lb"))
+        if not account:
+            return await self.send_json(send, {"error": "No available account"}, 503)
+        headers = {"Referer": DOWNLOAD_REFERER}
+        for name in ("Range", "If-Range", "If-None-Match", "If-Modified-Since"):
+            if name.lower() in request.headers:
+                headers[name] = request.headers[name.lower()]
+        # 计入账号的进行中请求数、延迟和熔断器，归还选中时占用的半开探测名额
+        account.begin_request()
+        start = time.perf_counter()
+        upstream = None
+        try:
+            upstream = await async_client.open_stream(url, headers)
+        finally:
+            account.end_request(time.perf_counter() - start, upstream is not None and upstream.status_code < 500)
+
+        try:
+            if upstream.status_code >= 400:
+                return await self.send_json(
+                    send, {"error": f"upstream returned HTTP {upstream.status_code}"}, upstream.status_code)
+
+            response_headers = {
+                name: upstream.headers[name]
+                for name in DOWNLOAD_PASSTHROUGH_HEADERS
+                if name in upstream.headers
+            }
+            if "Content-Type" not in response_headers:
+                response_headers["Content-Type"] = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            response_headers["Content-Disposition"] = f"inline; filename={quote(filename)}"
+
+            cache_path = None
+            if (image_cache.enabled and upstream.status_code == 200
+                    and "Content-Encoding" not in upstream.headers):
+                cache_path = image_cache.new_temp_path()
+                response_headers["X-Cache"] = "MISS"
+
+            request.started = True
+            await send({
+                "type": "http.response.start",
+                "status": upstream.status_code,
+                "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in response_headers.items()],
+            })
+            # 缓存文件的写入、提交（索引事务与淘汰）都是阻塞的磁盘操作，放到线程池执行
+            cache_file = await asyncio.to_thread(open, cache_path, "wb") if cache_path else None
+            complete = False
+            try:
+                # aiter_raw 不解码 Content-Encoding，按原样转发
+                async for chunk in upstream.aiter_raw(DOWNLOAD_CHUNK_SIZE):
+                    if cache_file:
+                        await asyncio.to_thread(cache_file.write, chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                await send({"type": "http.response.body", "body": b""})
+                complete = True
+            finally:
+                if cache_file:
+                    await asyncio.to_thread(
+                        self.finish_cache_file, cache_file, complete, upstream.headers.get("Content-Length"),
+                        url, cache_path, response_headers["Content-Type"])
+        finally:
+            await upstream.aclose()
+
+    @staticmethod
+    def finish_cache_file(cache_file, complete, expected, url, cache_path, content_type):
+        """关闭缓存文件，完整下载时提交到磁盘缓存，否则删除（在线程池中执行）"""
+        cache_file.close()
+        if complete and (expected is None or int(expected) == os.path.getsize(cache_path)):
+            image_cache.commit(url, cache_path, content_type)
+        else:
+            image_cache.discard(cache_path)
+
+
+def create_asgi_app(flask_app):
+    from app.serving import serving_settings
+    from app.profiler import profiler
+
+    # 异步路由不经过 Flask 的请求钩子，按请求的 cProfile 分析只能看到转交给 Flask 的请求
+    profiler.requests_supported = False
+    return AsgiApp(flask_app, wsgi_threads=serving_settings()["threads"])
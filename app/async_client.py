@@ -0,0 +1,172 @@
+"""
+异步 Pixiv 客户端 - ASGI 模式下用 httpx 直接调用 Pixiv App API
+等待上游时不占用线程，单个进程可以同时保持大量上游请求
+token 仍由 pixivpy3 账号对象管理（认证与后台刷新不变），这里只读取 access_token
+"""
+import time
+from pixivpy3.utils import PixivError
+from app.pool import ProxiedAppPixivAPI, get_proxy_settings
+from app.transport import transport_settings
+from app.singleflight import async_singleflight
+from app.admission import admission
+from app.timing import record_phase
+from app.upstream import Attempts, flight_key, admit_async
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+API_HOST = "https://app-api.pixiv.net"
+# 与 pixivpy3 相同的客户端标识
+API_HEADERS = {
+    "app-os": "ios",
+    "app-os-version": "14.6",
+    "user-agent": "PixivIOSApp/7.13.3 (iOS 14.6; iPhone13,2)",
+}
+
+
+# 各方法构造的请求与 pixivpy3 同名方法一致（只包含路由用到的参数）
+def _illust_detail(illust_id):
+    return "/v1/illust/detail", {"illust_id": illust_id}
+
+
+def _search_illust(word, offset=None):
+    params = {"word": word, "search_target": "partial_match_for_tags", "sort": "date_desc", "filter": "for_ios"}
+    if offset:
+        params["offset"] = offset
+    return "/v1/search/illust", params
+
+
+def _illust_ranking(mode="day", offset=None):
+    params = {"mode": mode, "filter": "for_ios"}
+    if offset:
+        params["offset"] = offset
+    return "/v1/illust/ranking", params
+
+
+def _illust_recommended(offset=None):
+    params = {"content_type": "illust", "include_ranking_label": "true", "filter": "for_ios"}
+    if offset:
+        params["offset"] = offset
+    return "/v1/illust/recommended", params
+
+
+def _user_detail(user_id):
+    return "/v1/user/detail", {"user_id": user_id, "filter": "for_ios"}
+
+
+def _user_illusts(user_id, offset=None):
+    params = {"user_id": user_id, "filter": "for_ios", "type": "illust"}
+    if offset:
+        params["offset"] = offset
+    return "/v1/user/illusts", params
+
+
+ENDPOINTS = {
+    "illust_detail": _illust_detail,
+    "search_illust": _search_illust,
+    "illust_ranking": _illust_ranking,
+    "illust_recommended": _illust_recommended,
+    "user_detail": _user_detail,
+    "user_illusts": _user_illusts,
+}
+
+
+class AsyncPixivClient:
+    """
+    所有账号共用一个 httpx.AsyncClient 连接池（账号之间只有 Authorization 头不同）
+    超时、重试沿用 http 配置，TLS 沿用 pixivpy3 (cloudscraper) 的加密套件设置
+    """
+
+    def __init__(self):
+        self.max_connections = 1000
+        self.max_keepalive = 100
+        self._client = None
+
+    def load_from_config(self):
+        """从 config.yaml 加载 ASGI 模式的上游连接配置"""
+        from app.config import config
+
+        cfg = config.asgi
+        self.max_connections = cfg.get("max_connections", self.max_connections)
+        self.max_keepalive = cfg.get("max_keepalive", self.max_keepalive)
+
+    def _get_client(self):
+        # 在事件循环中首次使用时创建，fork 出的 worker 各自拥有连接池
+        if self._client is None:
+            settings = transport_settings()
+            proxies = get_proxy_settings()
+            ssl_context = ProxiedAppPixivAPI().requests.adapters["https://"].ssl_context
+            transport = httpx.AsyncHTTPTransport(
+                verify=ssl_context,
+                proxy=proxies["https"] if proxies else None,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                ),
+                retries=settings["retries"],
+            )
+            self._client = httpx.AsyncClient(
+                transport=transport,
+                timeout=httpx.Timeout(settings["read_timeout"], connect=settings["connect_timeout"]),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(self, account, method, *args, **kwargs):
+        """以账号身份调用 Pixiv App API，返回解析后的 JSON"""
+        path, params = ENDPOINTS[method](*args, **kwargs)
+        headers = dict(API_HEADERS)
+        headers.update(account.api.additional_headers)
+        headers["Authorization"] = f"Bearer {account.api.access_token}"
+        r = await self._get_client().get(API_HOST + path, params=params, headers=headers)
+        try:
+            return r.json()
+        except ValueError as e:
+            raise PixivError(f"HTTP {r.status_code} parse_json() error: {e}", header=r.headers, body=r.text)
+
+    async def call_api(self, key_value, strategy, method, *args, **kwargs):
+        """upstream.call_api 的异步版本：同样的账号选择、重试、限流冷却、熔断和请求合并"""
+
+        async def fetch():
+            executed.append(True)
+            ticket = await admit_async(key_value)
+            try:
+                return await fetch_with_retries()
+            finally:
+                admission.release(ticket)
+
+        async def fetch_with_retries():
+            attempts = Attempts(key_value, strategy, method)
+            for account in attempts:
+                result = error = None
+                try:
+                    result = await self.request(account, method, *args, **kwargs)
+                except Exception as e:
+                    error = e
+                if attempts.record(account, result, error):
+                    return result
+            raise attempts.exhausted()
+
+        executed = []
+        start = time.perf_counter()
+        try:
+            return await async_singleflight.do(flight_key(key_value, method, args, kwargs), fetch)
+        finally:
+            if not executed:
+                record_phase("coalesced", time.perf_counter() - start)
+
+    async def open_stream(self, url, headers):
+        """发起流式 GET（图片下载），调用方负责 aclose()"""
+        client = self._get_client()
+        request = client.build_request("GET", url, headers={**API_HEADERS, **headers})
+        return await client.send(request, stream=True)
+
+
+async_client = AsyncPixivClient()
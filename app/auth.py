@@ -1,6 +1,10 @@
+import math
+import time
 from functools import wraps
 from flask import request, jsonify, g
 from app.config import config
+from app.metrics import metrics
+from app.timing import record_phase
 
 
 def require_auth(f):
@@ -14,28 +18,61 @@ def require_auth(f):
     return decorated
 
 
+def authorize_api_key(auth_header, endpoint):
+    """
+    校验 API Key 及其对 endpoint 的访问权限（不依赖请求上下文，ASGI 模式共用）
+    返回 (key_value, None, None)，失败时返回 (None, 错误信息, 状态码)
+    """
+    from app.key_manager import key_manager
+    
+    # 提取 API Key
+    if not auth_header.startswith("Bearer "):
+        return None, "API key required", 401
+    
+    key_value = auth_header[7:]  # 移除 "Bearer " 前缀
+    
+    # 检查访问权限
+    start = time.perf_counter()
+    allowed, error = key_manager.check_access(key_value, endpoint)
+    metrics.observe("pixiv_key_check_duration_seconds", ("allowed" if allowed else "denied",),
+                    time.perf_counter() - start)
+    if not allowed:
+        if error in ("Invalid API key", "API key is disabled"):
+            return None, error, 401
+        return None, error, 403
+    return key_value, None, None
+
+
+def check_key_limits(key_value, cost=1):
+    """
+    API Key 的每秒请求数和每日配额，计入 cost 次上游调用（不依赖请求上下文，ASGI 模式共用）
+    鉴权时每个请求计 1 次；批量等一个请求触发多次上游调用的路由再为额外的调用计费
+    未超出时返回 None，否则返回 (错误信息, 状态码, 响应头)
+    """
+    from app.key_manager import key_manager
+    from app.key_limits import key_limiter
+
+    limited = key_limiter.check(key_manager.get_key(key_value), cost)
+    if limited is None:
+        return None
+    error, retry_after = limited
+    return error, 429, {"Retry-After": str(max(1, int(math.ceil(retry_after))))}
+
+
 def require_api_key(f):
     """API Key 鉴权装饰器 - 用于 API 调用"""
     @wraps(f)
     def decorated(*args, **kwargs):
-        from app.key_manager import key_manager
-        
-        auth_header = request.headers.get("Authorization", "")
-        
-        # 提取 API Key
-        if not auth_header.startswith("Bearer "):
-            return jsonify({"error": "API key required"}), 401
-        
-        key_value = auth_header[7:]  # 移除 "Bearer " 前缀
-        
-        # 检查访问权限
-        endpoint = request.path
-        allowed, error = key_manager.check_access(key_value, endpoint)
+        start = time.perf_counter()
+        key_value, error, status = authorize_api_key(request.headers.get("Authorization", ""), request.path)
+        if error:
+            return jsonify({"error": error}), status
         
-        if not allowed:
-            if error in ("Invalid API key", "API key is disabled"):
-                return jsonify({"error": error}), 401
-            return jsonify({"error": error}), 403
+        limited = check_key_limits(key_value)
+        record_phase("auth", time.perf_counter() - start)
+        if limited:
+            error, status, headers = limited
+            return jsonify({"error": error}), status, headers
         
         # 将 API Key 值存储到请求上下文，供后续使用
         g.api_key_value = key_value
@@ -0,0 +1,104 @@
+"""
+批量请求 - 一次请求获取多个插画详情
+ID 去重后先读响应缓存，未命中的并发调用上游，每次调用独立选择账号，请求自然分散到多个账号
+"""
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+
+
+def batch_settings():
+    """batch 配置：单次最多 ID 数、单个请求的并发上限和全局工作线程数"""
+    from app.config import config
+
+    cfg = config.batch
+    return {
+        "max_ids": cfg.get("max_ids", 100),
+        "concurrency": max(1, cfg.get("concurrency", 8)),
+        "workers": max(1, cfg.get("workers", 32)),
+    }
+
+
+def parse_ids(raw, max_ids):
+    """
+    解析 ID 列表（逗号分隔的字符串或 JSON 数组），按首次出现的顺序去重
+    格式错误、为空或超过 max_ids 时抛出 ValueError
+    """
+    if isinstance(raw, str):
+        parts = [part.strip() for part in raw.split(",") if part.strip()]
+    elif isinstance(raw, list):
+        parts = raw
+    else:
+        raise ValueError("ids must be a list or a comma-separated string")
+
+    ids = []
+    seen = set()
+    for part in parts:
+        try:
+            if isinstance(part, bool):
+                raise ValueError
+            value = int(part)
+        except (TypeError, ValueError):
+            raise ValueError(f"invalid illust id: {part!r}")
+        if value <= 0:
+            raise ValueError(f"invalid illust id: {part!r}")
+        if value not in seen:
+            seen.add(value)
+            ids.append(value)
+
+    if not ids:
+        raise ValueError("ids required")
+    if len(ids) > max_ids:
+        raise ValueError(f"too many ids (max {max_ids})")
+    return ids
+
+
+class BatchExecutor:
+    """
+    所有批量请求共用一个线程池（workers 为全局上限）
+    单个请求最多占用 concurrency 个并发，调用线程本身也参与执行，线程池排队时不会阻塞进度
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self, workers):
+        # 首次使用时创建，fork 出的 worker 各自拥有线程池
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+            return self._executor
+
+    def map(self, items, fn, concurrency, workers=32):
+        """并发执行 fn(item)，返回 {item: 结果或异常}"""
+        results = {}
+        iterator = iter(items)
+        lock = threading.Lock()
+
+        def lane():
+            while True:
+                with lock:
+                    item = next(iterator, _DONE)
+                if item is _DONE:
+                    return
+                try:
+                    results[item] = fn(item)
+                except Exception as e:
+                    results[item] = e
+
+        lanes = min(concurrency, len(items))
+        futures = []
+        if lanes > 1:
+            executor = self._get_executor(workers)
+            # 工作线程沿用调用方的上下文，上游调用的耗时记入所属请求
+            futures = [executor.submit(contextvars.copy_context().run, lane) for _ in range(lanes - 1)]
+        lane()
+        for future in futures:
+            future.result()
+        return results
+
+
+batch_executor = BatchExecutor()
@@ -0,0 +1,247 @@
+"""
+响应缓存 - 为热点 Pixiv API 结果提供带 TTL 的 LRU 缓存
+"""
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from flask import current_app, request, g
+
+from app.encoding import compressor
+from app.timing import record_phase
+
+
+class CacheEntry:
+    """缓存条目：原始结果、序列化后的响应体和按编码记住的压缩结果"""
+
+    __slots__ = ("value", "body", "expires_at", "encoded")
+
+    def __init__(self, value, body, expires_at):
+        self.value = value
+        self.body = body
+        self.expires_at = expires_at
+        self.encoded = {}
+
+
+class MemoryCacheBackend:
+    """进程内 LRU 缓存后端，按条目数限制大小"""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, count_miss=True):
+        """count_miss 为 False 时未命中不计入统计（之后还会查找其他键的探测）"""
+        now = time.time()
+        with self.lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += count_miss
+                return None
+            if entry.expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += count_miss
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self.lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self._data.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "memory",
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class ResponseCache:
+    """
+    响应缓存
+    - 每个端点的 TTL 在 config.yaml 的 cache.ttl 中配置，TTL <= 0 表示不缓存
+    - 与 single-flight 一样按池限制区分：限定账号（specific）的 API Key 只共享同一组账号取得的结果，
+      不会读到其他账号（可能有不同的浏览设置）取得的缓存
+    - 缓存后端可替换，只需实现 get(key, count_miss)/set/delete/clear/stats
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryCacheBackend()
+        self.enabled = True
+        self.ttls = {}
+
+    def load_from_config(self):
+        """从 config.yaml 加载缓存配置"""
+        from app.config import config
+
+        cache_cfg = config.cache
+        self.enabled = cache_cfg.get("enabled", True)
+        self.ttls = dict(cache_cfg.get("ttl", {}) or {})
+        max_entries = cache_cfg.get("max_entries", 2048)
+        if isinstance(self.backend, MemoryCacheBackend):
+            self.backend.max_entries = max_entries
+        print(f"[Cache] Response cache {'enabled' if self.enabled else 'disabled'}, "
+              f"max_entries: {max_entries}, ttl: {self.ttls}")
+
+    def ttl_for(self, name):
+        if not self.enabled:
+            return 0
+        return self.ttls.get(name, 0) or 0
+
+    @staticmethod
+    def make_key(name, params=None, scope=None):
+        """由端点名、规范化（排序）后的参数和账号池范围构造缓存键"""
+        key = name
+        if params:
+            items = sorted((k, str(v)) for k, v in params.items() if v is not None)
+            key = f"{name}?{urlencode(items)}"
+        return f"{key}@{scope}" if scope else key
+
+    @staticmethod
+    def scope_for(key_value):
+        """API Key 的账号池范围，使用全部账号时为 None（与 flight_key 的划分一致）"""
+        from app.upstream import pool_restriction
+
+        pool_mode, allowed_accounts = pool_restriction(key_value)
+        if pool_mode == "specific":
+            return "accounts=" + ",".join(sorted(allowed_accounts))
+        return None
+
+    def get(self, key, count_miss=True):
+        return self.backend.get(key, count_miss)
+
+    def key_for(self, name, params, key_value=None):
+        """返回 (缓存键, TTL)，key_value 为发起请求的 API Key"""
+        ttl = self.ttl_for(name)
+        return self.make_key(name, params, self.scope_for(key_value) if ttl > 0 else None), ttl
+
+    def lookup(self, name, params, key_value=None):
+        """返回 (缓存键, TTL, 命中的条目或 None)"""
+        key, ttl = self.key_for(name, params, key_value)
+        return key, ttl, (self.get(key) if ttl > 0 else None)
+
+    def store(self, key, value, ttl):
+        """写入上游结果（Pixiv 错误结果不缓存），返回带序列化 body 的条目"""
+        return self.set(key, value, ttl if _is_cacheable(value) else 0)
+
+    @staticmethod
+    def view_key(key, fields):
+        """字段投影视图的缓存键"""
+        return f"{key}#fields={fields.key}"
+
+    def lookup_view(self, key, ttl, fields):
+        """
+        返回命中的投影视图条目或 None
+        视图未命中时调用方接着查找完整结果，未命中不计入统计，一次请求只计一次命中或未命中
+        """
+        return self.get(self.view_key(key, fields), count_miss=False) if ttl > 0 else None
+
+    def store_projected(self, key, ttl, fields, entry=None, value=None):
+        """
+        由完整结果投影出视图条目：entry 为命中的完整条目，否则 value 为上游新结果
+        完整结果照常写入缓存，不同字段组合都从它投影；视图与完整结果同时过期
+        """
+        if entry is None:
+            if ttl <= 0 or not _is_cacheable(value):
+                # 不缓存时只序列化投影后的结果
+                projected = fields.apply(value)
+                return CacheEntry(projected, serialize_json(projected), 0)
+            entry = self.store(key, value, ttl)
+        projected = fields.apply(entry.value)
+        view = CacheEntry(projected, serialize_json(projected), entry.expires_at)
+        self.backend.set(self.view_key(key, fields), view)
+        return view
+
+    def set(self, key, value, ttl):
+        entry = CacheEntry(value, serialize_json(value), time.time() + ttl)
+        if ttl > 0:
+            self.backend.set(key, entry)
+        return entry
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        stats = self.backend.stats()
+        stats["enabled"] = self.enabled
+        stats["ttl"] = self.ttls
+        return stats
+
+
+def serialize_json(value):
+    """按 Flask 的 JSON 设置序列化（与 jsonify 输出一致），需在应用上下文中调用"""
+    start = time.perf_counter()
+    body = current_app.json.dumps(value).encode("utf-8") + b"\n"
+    record_phase("serialize", time.perf_counter() - start)
+    return body
+
+
+def _is_cacheable(value):
+    """Pixiv 返回的错误结果不缓存"""
+    return not (isinstance(value, dict) and "error" in value)
+
+
+def cached_json(name, params, fetch, fields=None):
+    """
+    读取缓存，未命中时调用 fetch() 获取结果并写入缓存
+    fields 为字段投影（app.projection.Fields）时返回投影后的结果
+    返回带 X-Cache: HIT/MISS 头的 JSON 响应
+    """
+    key, ttl = response_cache.key_for(name, params, g.get("api_key_value"))
+    if fields is None:
+        entry = response_cache.get(key) if ttl > 0 else None
+        if entry is not None:
+            return _json_response(entry, "HIT")
+        entry = response_cache.store(key, fetch(), ttl)
+        return _json_response(entry, "MISS")
+
+    # 先查投影视图，未命中时才查找完整结果
+    view = response_cache.lookup_view(key, ttl, fields)
+    if view is not None:
+        return _json_response(view, "HIT")
+    entry = response_cache.get(key) if ttl > 0 else None
+    if entry is not None:
+        return _json_response(response_cache.store_projected(key, ttl, fields, entry=entry), "HIT")
+    return _json_response(response_cache.store_projected(key, ttl, fields, value=fetch()), "MISS")
+
+
+def _json_response(entry, cache_status):
+    # 压缩结果记在条目上，缓存命中时直接发送
+    body, encoding = compressor.encode(entry.body, request.headers.get("Accept-Encoding", ""), entry.encoded)
+    response = current_app.response_class(body, mimetype="application/json")
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.headers["X-Cache"] = cache_status
+    return response
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,127 @@
+"""
+熔断器 - 按错误率和连续失败次数将故障账号暂时移出轮换
+"""
+import threading
+import time
+from collections import deque
+
+
+class CircuitBreaker:
+    """
+    单账号熔断器
+    - closed: 正常；最近 window 次调用中错误率达到 error_rate（至少 min_requests 次样本），
+      或连续失败 consecutive_failures 次时转为 open
+    - open: 不参与选择；reset_timeout 秒后允许探测请求，转为 half_open
+    - half_open: 最多 probes 个探测请求，成功则恢复 closed，失败则重新 open
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name="", window=20, min_requests=10, error_rate=0.5,
+                 consecutive_failures=5, reset_timeout=30, probes=1):
+        self.name = name
+        self.min_requests = min_requests
+        self.error_rate_threshold = error_rate
+        self.consecutive_threshold = consecutive_failures
+        self.reset_timeout = reset_timeout
+        self.max_probes = probes
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.opened_at = 0
+        self.probes_inflight = 0
+        self.consecutive_failures = 0
+        self.outcomes = deque(maxlen=window)  # True 表示失败
+        self.failures = 0  # outcomes 中的失败数
+        self.transitions = 0
+
+    @classmethod
+    def from_config(cls, name):
+        from app.config import config
+
+        cfg = config.circuit_breaker
+        return cls(
+            name=name,
+            window=cfg.get("window", 20),
+            min_requests=cfg.get("min_requests", 10),
+            error_rate=cfg.get("error_rate", 0.5),
+            consecutive_failures=cfg.get("consecutive_failures", 5),
+            reset_timeout=cfg.get("reset_timeout", 30),
+            probes=cfg.get("probes", 1),
+        )
+
+    def available(self):
+        """是否可被选择（不占用探测名额）"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN:
+            return time.time() - self.opened_at >= self.reset_timeout
+        return self.probes_inflight < self.max_probes
+
+    def on_selected(self):
+        """账号被选中时调用；open 超时后转为 half_open 并占用探测名额"""
+        if self.state == self.CLOSED:
+            return
+        with self.lock:
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                self.probes_inflight += 1
+
+    def record(self, success):
+        """记录一次调用结果"""
+        with self.lock:
+            failed = not success
+            if len(self.outcomes) == self.outcomes.maxlen and self.outcomes[0]:
+                self.failures -= 1
+            self.outcomes.append(failed)
+            self.failures += failed
+            self.consecutive_failures = self.consecutive_failures + 1 if failed else 0
+
+            if self.state == self.HALF_OPEN:
+                self.probes_inflight = max(self.probes_inflight - 1, 0)
+                if failed:
+                    self._open()
+                else:
+                    self._transition(self.CLOSED)
+                    self.outcomes.clear()
+                    self.failures = 0
+            elif self.state == self.CLOSED and failed:
+                samples = len(self.outcomes)
+                if (self.consecutive_failures >= self.consecutive_threshold
+                        or (samples >= self.min_requests
+                            and self.failures / samples >= self.error_rate_threshold)):
+                    self._open()
+
+    def _open(self):
+        self.opened_at = time.time()
+        self._transition(self.OPEN)
+
+    def _transition(self, state):
+        if state != self.state:
+            print(f"[Circuit] Account [{self.name}] {self.state} -> {state}")
+            self.state = state
+            self.transitions += 1
+
+    def error_rate(self):
+        return self.failures / len(self.outcomes) if self.outcomes else 0.0
+
+    def health(self):
+        """健康分 0~1：open 为 0，half_open 为 0.25，closed 为 1 - 近期错误率"""
+        if self.state == self.OPEN:
+            return 0.0
+        if self.state == self.HALF_OPEN:
+            return 0.25
+        return 1.0 - self.error_rate()
+
+    def status(self):
+        return {
+            "state": self.state,
+            "health": round(self.health(), 3),
+            "error_rate": round(self.error_rate(), 3),
+            "consecutive_failures": self.consecutive_failures,
+            "opened_at": self.opened_at,
+            "transitions": self.transitions,
+        }
@@ -40,6 +40,14 @@ class Config:
     def reload(self):
         self._load()
     
+    def file_signature(self):
+        """返回配置文件的 (mtime_ns, size)，用于低成本检测文件是否变化"""
+        try:
+            st = os.stat(self._config_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+    
     @property
     def server(self):
         return self._data.get("server", {})
@@ -52,6 +60,101 @@ class Config:
     def lb_strategy(self):
         return self._data.get("load_balance", {}).get("strategy", "round_robin")
     
+    @property
+    def lb_ewma_alpha(self):
+        """ewma 策略的平滑系数，越大越偏重最近的延迟"""
+        return self._data.get("load_balance", {}).get("ewma_alpha", 0.3)
+    
+    @property
+    def lb_default_latency(self):
+        """ewma 策略中池内还没有任何延迟样本时假定的延迟（秒）"""
+        return (self._data.get("load_balance", {}).get("default_latency_ms", 500) or 500) / 1000.0
+    
+    @property
+    def rate_limit(self):
+        """单账号限流与 Pixiv 限流后的冷却/重试配置"""
+        return self._data.get("rate_limit", {}) or {}
+    
+    @property
+    def circuit_breaker(self):
+        """单账号熔断器配置"""
+        return self._data.get("circuit_breaker", {}) or {}
+    
+    @property
+    def http(self):
+        """上游 HTTP 连接池、超时与重试配置"""
+        return self._data.get("http", {}) or {}
+    
+    @property
+    def shared_state(self):
+        """多 worker 共享状态配置"""
+        return self._data.get("shared_state", {}) or {}
+    
+    @property
+    def asgi(self):
+        """ASGI 模式的异步上游连接配置"""
+        return self._data.get("asgi", {}) or {}
+    
+    @property
+    def batch(self):
+        """批量接口配置"""
+        return self._data.get("batch", {}) or {}
+    
+    @property
+    def pagination(self):
+        """?all=true 分页遍历配置"""
+        return self._data.get("pagination", {}) or {}
+    
+    @property
+    def response(self):
+        """JSON 序列化与响应压缩配置"""
+        return self._data.get("response", {}) or {}
+    
+    @property
+    def key_limits(self):
+        """API Key 限流用量持久化配置"""
+        return self._data.get("key_limits", {}) or {}
+    
+    @property
+    def admission(self):
+        """账号池饱和时的准入控制与公平排队配置"""
+        return self._data.get("admission", {}) or {}
+    
+    @property
+    def metrics(self):
+        """/metrics 指标配置"""
+        return self._data.get("metrics", {}) or {}
+    
+    @property
+    def timing(self):
+        """请求耗时分解（Server-Timing）与慢请求日志配置"""
+        return self._data.get("timing", {}) or {}
+    
+    @property
+    def profiling(self):
+        """按需性能分析接口配置"""
+        return self._data.get("profiling", {}) or {}
+    
+    @property
+    def startup(self):
+        """启动时账号认证配置"""
+        return self._data.get("startup", {}) or {}
+    
+    @property
+    def token_refresh(self):
+        """后台 token 刷新配置"""
+        return self._data.get("token_refresh", {}) or {}
+    
+    @property
+    def cache(self):
+        """响应缓存配置"""
+        return self._data.get("cache", {}) or {}
+    
+    @property
+    def image_cache(self):
+        """图片磁盘缓存配置"""
+        return self._data.get("image_cache", {}) or {}
+    
     @property
     def pixiv_accounts(self):
         return self._data.get("pixiv_accounts", []) or []
@@ -0,0 +1,195 @@
+"""
+响应编码 - JSON 序列化与压缩
+- 已安装 orjson 时使用 orjson 序列化（紧凑 JSON，非 ASCII 字符直接按 UTF-8 输出），否则使用 Flask 默认实现
+- /api/* 的 JSON 响应按 Accept-Encoding 协商 zstd / br / gzip 压缩，小于阈值的不压缩
+- 缓存条目按编码记住压缩结果，缓存命中不需要再序列化或压缩
+"""
+import gzip
+import time
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from app.timing import record_phase
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+COMPACT_SEPARATORS = (",", ":")
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """记录 jsonify 的序列化耗时（请求耗时分解的 serialize 阶段）"""
+
+    def response(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().response(*args, **kwargs)
+        finally:
+            record_phase("serialize", time.perf_counter() - start)
+
+
+class OrjsonProvider(TimedJSONProvider):
+    """
+    orjson 实现的 JSON provider，紧凑输出时使用 orjson，
+    需要缩进（debug 模式）或 orjson 不支持的值（超过 64 位的整数等）时回退到标准库
+    """
+
+    def dumps(self, obj, **kwargs):
+        if set(kwargs) - {"separators"} or kwargs.get("separators", COMPACT_SEPARATORS) != COMPACT_SEPARATORS:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode("utf-8")
+        except TypeError:
+            return super().dumps(obj, separators=COMPACT_SEPARATORS)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+def install_json_provider(app):
+    """按 response.json 配置（auto / orjson / stdlib）设置应用的 JSON provider"""
+    from app.config import config
+
+    engine = (config.response.get("json") or "auto").lower()
+    if engine == "stdlib":
+        app.json = TimedJSONProvider(app)
+        return
+    if not ORJSON_AVAILABLE:
+        if engine == "orjson":
+            print("[Encoding] orjson not installed (pip install orjson), using stdlib json")
+        app.json = TimedJSONProvider(app)
+        return
+    app.json = OrjsonProvider(app)
+
+
+def _compress_gzip(data, level):
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _compress_br(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def _compress_zstd(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+ENCODERS = {"gzip": _compress_gzip}
+if BROTLI_AVAILABLE:
+    ENCODERS["br"] = _compress_br
+if ZSTD_AVAILABLE:
+    ENCODERS["zstd"] = _compress_zstd
+
+DEFAULT_LEVELS = {"gzip": 6, "br": 4, "zstd": 3}
+
+
+def parse_accept_encoding(header):
+    """解析 Accept-Encoding，返回 {编码: q 值}"""
+    accepted = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+class Compressor:
+    """JSON 响应压缩，按客户端 q 值和服务端偏好顺序选择编码"""
+
+    def __init__(self):
+        self.enabled = True
+        self.min_size = 1024
+        self.preference = ["zstd", "br", "gzip"]
+        self.levels = dict(DEFAULT_LEVELS)
+
+    def load_from_config(self):
+        """从 config.yaml 加载压缩配置"""
+        from app.config import config
+
+        cfg = config.response.get("compression", {}) or {}
+        self.enabled = cfg.get("enabled", True)
+        self.min_size = cfg.get("min_size", 1024)
+        self.preference = list(cfg.get("algorithms") or ["zstd", "br", "gzip"])
+        self.levels = {**DEFAULT_LEVELS, **(cfg.get("levels", {}) or {})}
+        available = [name for name in self.preference if name in ENCODERS]
+        print(f"[Encoding] JSON compression {'enabled' if self.enabled else 'disabled'}, "
+              f"min_size: {self.min_size}, algorithms: {available}")
+
+    def negotiate(self, accept_encoding):
+        """选择编码，客户端不接受任何可用编码时返回 None"""
+        accepted = parse_accept_encoding(accept_encoding)
+        best, best_q = None, 0.0
+        for name in self.preference:
+            if name not in ENCODERS:
+                continue
+            q = accepted.get(name, accepted.get("*", 0.0))
+            if q > best_q:
+                best, best_q = name, q
+        return best
+
+    def encode(self, body, accept_encoding, memo=None):
+        """
+        按需压缩响应体，返回 (body, 编码或 None)
+        memo 为缓存条目的压缩结果字典，同一条目同一编码只压缩一次
+        """
+        if not self.enabled or len(body) < self.min_size:
+            return body, None
+        encoding = self.negotiate(accept_encoding)
+        if encoding is None:
+            return body, None
+        if memo is not None:
+            compressed = memo.get(encoding)
+            if compressed is None:
+                compressed = memo[encoding] = self._compress(encoding, body)
+            return compressed, encoding
+        return self._compress(encoding, body), encoding
+
+    def _compress(self, encoding, body):
+        start = time.perf_counter()
+        compressed = ENCODERS[encoding](body, self.levels[encoding])
+        record_phase("compress", time.perf_counter() - start)
+        return compressed
+
+
+compressor = Compressor()
+
+
+def compress_response(response):
+    """after_request：压缩未编码的 JSON 响应（流式响应和文件下载不处理）"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.mimetype != "application/json" or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    body, encoding = compressor.encode(response.get_data(), request.headers.get("Accept-Encoding", ""))
+    if encoding:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+    return response
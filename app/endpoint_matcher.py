@@ -0,0 +1,53 @@
+"""
+端点匹配引擎 - 将 API Key 的白名单/黑名单规则预编译为哈希查找结构
+"""
+import re
+from functools import lru_cache
+from typing import Iterable
+
+_ID_SEGMENT = re.compile(r"/\d+")
+
+
+@lru_cache(maxsize=4096)
+def normalize_endpoint(endpoint: str) -> str:
+    """规范化端点路径，移除动态参数（结果带 LRU 缓存）"""
+    normalized = _ID_SEGMENT.sub("/<id>", endpoint)
+    normalized = normalized.split("?")[0]
+    return normalized
+
+
+class EndpointMatcher:
+    """
+    预编译的端点匹配器
+    - 精确模式放入集合，O(1) 查找
+    - "/*" 通配模式去掉 "*" 后的前缀必以 "/" 结尾，
+      因此只需检查端点中每个以 "/" 结尾的前缀是否在前缀集合中，
+      匹配耗时只与路径段数有关，与模式数量无关
+    """
+
+    __slots__ = ("exact", "prefixes")
+
+    def __init__(self, patterns: Iterable[str] = ()):
+        self.exact = set()
+        self.prefixes = set()
+        for pattern in patterns:
+            if pattern.endswith("/*"):
+                self.prefixes.add(pattern[:-1])
+            else:
+                self.exact.add(pattern)
+
+    def __bool__(self):
+        return bool(self.exact or self.prefixes)
+
+    def match(self, endpoint: str) -> bool:
+        """检查端点是否匹配任一模式"""
+        if endpoint in self.exact:
+            return True
+        if self.prefixes:
+            prefixes = self.prefixes
+            pos = endpoint.find("/")
+            while pos != -1:
+                if endpoint[:pos + 1] in prefixes:
+                    return True
+                pos = endpoint.find("/", pos + 1)
+        return False
@@ -0,0 +1,282 @@
+"""
+图片磁盘缓存 - 按 URL 哈希分片存储下载过的原图，LRU 淘汰，索引持久化（多 worker 共用）
+"""
+import atexit
+import hashlib
+import json
+import mimetypes
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from urllib.parse import urlparse
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    content_type TEXT NOT NULL,
+    atime REAL NOT NULL
+)
+"""
+
+
+class ImageCache:
+    """
+    内容寻址的图片缓存
+    - 文件路径: <dir>/<hash[:2]>/<hash[2:4]>/<hash><ext>
+    - 索引 index.db（SQLite，WAL 模式）记录大小、类型与最近访问时间，重启后恢复 LRU 顺序；
+      多 worker 共用同一个索引，容量上限按整个缓存目录计算，不会互相覆盖
+    - 命中时返回文件路径，由 send_file 直接发送，工作线程不读取图片内容
+    - 命中 / 未命中 / 淘汰次数为当前进程的计数
+    """
+
+    INDEX_FILE = "index.db"
+    LEGACY_INDEX_FILE = "index.json"
+    INDEX_SAVE_INTERVAL = 5
+
+    def __init__(self):
+        self.enabled = False
+        self.root = None
+        self.max_bytes = 0
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self._touched = {}  # hash -> 最近访问时间，批量写入索引
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._last_save = 0
+
+    def load_from_config(self):
+        """从 config.yaml 加载缓存配置并恢复索引"""
+        from app.config import config
+
+        cfg = config.image_cache
+        self.enabled = cfg.get("enabled", False)
+        if not self.enabled:
+            return
+        self.root = Path(cfg.get("dir", "./cache/images"))
+        self.max_bytes = int(cfg.get("max_size_mb", 1024)) * 1024 * 1024
+        (self.root / "tmp").mkdir(parents=True, exist_ok=True)
+        # 清理上次运行遗留的未完成下载
+        for leftover in (self.root / "tmp").iterdir():
+            self.discard(leftover)
+        self._load_index()
+        atexit.register(self.save_index, force=True)
+        stats = self.stats()
+        print(f"[ImageCache] {stats['entries']} images, "
+              f"{stats['bytes_stored'] / 1024 / 1024:.1f}/{self.max_bytes / 1024 / 1024:.0f} MB in {self.root}")
+        # 主进程在 fork 前调用，不把连接留给子进程
+        self._close()
+
+    @staticmethod
+    def key_for(url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _relpath(self, key, url):
+        ext = os.path.splitext(urlparse(url).path)[1][:8]
+        return f"{key[:2]}/{key[2:4]}/{key}{ext}"
+
+    def _conn(self):
+        """每个线程一个连接；fork 后的子进程或缓存目录变化时重新连接（SQLite 连接不能跨进程使用）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid() or self._local.root != self.root:
+            conn = sqlite3.connect(str(self.root / self.INDEX_FILE), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.root = self.root
+        return conn
+
+    def _close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local = threading.local()
+
+    @property
+    def total_bytes(self):
+        return self._conn().execute("SELECT COALESCE(SUM(size), 0) FROM images").fetchone()[0]
+
+    def lookup(self, url):
+        """查找缓存，命中返回 (文件路径, content_type)，未命中返回 None"""
+        key = self.key_for(url)
+        row = self._conn().execute(
+            "SELECT path, content_type FROM images WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            path = self.root / row[0]
+            if not path.exists():
+                # 文件被外部删除
+                self._conn().execute("DELETE FROM images WHERE key = ?", (key,))
+                row = None
+        with self.lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self._touched[key] = time.time()
+            self.hits += 1
+        self.save_index()
+        return path, row[1]
+
+    def exists(self, url):
+        """只检查是否已缓存，不计入命中统计、不更新访问时间"""
+        row = self._conn().execute(
+            "SELECT path FROM images WHERE key = ?", (self.key_for(url),)).fetchone()
+        return row is not None and (self.root / row[0]).exists()
+
+    def new_temp_path(self):
+        """返回一个临时文件路径，下载完成后交给 commit()"""
+        return self.root / "tmp" / f"{uuid.uuid4().hex}.part"
+
+    def commit(self, url, tmp_path, content_type):
+        """将下载完成的临时文件移入缓存，超出容量时按最近访问时间淘汰（所有 worker 共用上限）"""
+        size = os.path.getsize(tmp_path)
+        if size > self.max_bytes:
+            self.discard(tmp_path)
+            return
+        key = self.key_for(url)
+        relpath = self._relpath(key, url)
+        path = self.root / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            touched, self._touched = self._touched, {}
+        conn = self._conn()
+        evicted = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 先写入访问时间，避免刚命中的图片被当作最久未使用淘汰
+            conn.executemany("UPDATE images SET atime = ? WHERE key = ?",
+                             [(atime, k) for k, atime in touched.items()])
+            conn.execute(
+                "INSERT OR REPLACE INTO images (key, path, size, content_type, atime) VALUES (?, ?, ?, ?, ?)",
+                (key, relpath, size, content_type, time.time()))
+            total = conn.execute("SELECT SUM(size) FROM images").fetchone()[0]
+            if total > self.max_bytes:
+                for old_key, old_path, old_size in conn.execute(
+                        "SELECT key, path, size FROM images WHERE key != ? ORDER BY atime", (key,)):
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((old_key, old_path))
+                    total -= old_size
+                conn.executemany("DELETE FROM images WHERE key = ?", [(k,) for k, _ in evicted])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        for _, old_path in evicted:
+            self._remove_file(old_path)
+        with self.lock:
+            self.evictions += len(evicted)
+            self._last_save = time.time()
+
+    @staticmethod
+    def discard(tmp_path):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    def _remove_file(self, relpath):
+        try:
+            os.remove(self.root / relpath)
+        except OSError:
+            pass
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            paths = [row[0] for row in conn.execute("SELECT path FROM images")]
+            conn.execute("DELETE FROM images")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self.lock:
+            self._touched.clear()
+        for relpath in paths:
+            self._remove_file(relpath)
+
+    def stats(self):
+        entries, stored = (0, 0)
+        if self.enabled and self.root is not None:
+            entries, stored = self._conn().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM images").fetchone()
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "dir": str(self.root) if self.root else None,
+                "entries": entries,
+                "bytes_stored": stored,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def save_index(self, force=False):
+        """把命中时记录的访问时间写入索引；非强制时最多每 INDEX_SAVE_INTERVAL 秒写一次"""
+        if not self.enabled:
+            return
+        now = time.time()
+        with self.lock:
+            if not self._touched or (not force and now - self._last_save < self.INDEX_SAVE_INTERVAL):
+                return
+            touched, self._touched = self._touched, {}
+            self._last_save = now
+        try:
+            self._conn().executemany("UPDATE images SET atime = MAX(atime, ?) WHERE key = ?",
+                                     [(atime, key) for key, atime in touched.items()])
+        except sqlite3.Error as e:
+            print(f"[ImageCache] Index update failed: {e}")
+
+    def _load_index(self):
+        """打开索引并去掉文件已不存在的记录；索引为空时从旧版 index.json 迁移或扫描缓存目录重建"""
+        conn = self._conn()
+        if conn.execute("SELECT COUNT(*) FROM images").fetchone()[0] == 0:
+            entries = None
+            legacy = self.root / self.LEGACY_INDEX_FILE
+            if legacy.exists():
+                try:
+                    with open(legacy, "r", encoding="utf-8") as f:
+                        entries = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"[ImageCache] Legacy index unreadable, rebuilding: {e}")
+            if entries is None:
+                entries = self._scan()
+            conn.executemany(
+                "INSERT OR REPLACE INTO images (key, path, size, content_type, atime) VALUES (?, ?, ?, ?, ?)",
+                [(key, e["path"], e["size"], e["content_type"], e["atime"]) for key, e in entries])
+            if legacy.exists():
+                self.discard(legacy)
+
+        missing = [(key,) for key, relpath in conn.execute("SELECT key, path FROM images")
+                   if not (self.root / relpath).exists()]
+        conn.executemany("DELETE FROM images WHERE key = ?", missing)
+
+    def _scan(self):
+        """索引丢失时扫描缓存目录重建"""
+        entries = []
+        for path in self.root.glob("??/??/*"):
+            if not path.is_file():
+                continue
+            st = path.stat()
+            entries.append((path.stem, {
+                "path": path.relative_to(self.root).as_posix(),
+                "size": st.st_size,
+                "content_type": mimetypes.guess_type(path.name)[0] or "application/octet-stream",
+                "atime": st.st_mtime,
+            }))
+        return entries
+
+
+image_cache = ImageCache()
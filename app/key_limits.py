@@ -0,0 +1,196 @@
+"""
+API Key 限流与配额 - 每个 Key 的每秒请求数（令牌桶，允许突发）和每日请求配额
+按上游调用次数计数：请求本身计 1 次，批量接口的未命中 ID、分页遍历的后续页另外计入
+请求路径只访问内存（O(1)），每日用量由后台线程批量写入 SQLite，并读回所有 worker 的合计
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.ratelimit import TokenBucket
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS key_usage (
+    name TEXT NOT NULL,
+    day TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (name, day)
+)
+"""
+
+
+RATE_LIMIT_EXCEEDED = "API key rate limit exceeded"
+QUOTA_EXCEEDED = "API key daily quota exceeded"
+
+
+class KeyLimitExceeded(Exception):
+    """后台线程中的上游调用超出 API Key 的每日配额"""
+
+
+def _today():
+    """配额按 UTC 自然日计算"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def _seconds_until_tomorrow():
+    now = datetime.now(timezone.utc)
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (tomorrow - now).total_seconds()
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(SCHEMA)
+    return conn
+
+
+class KeyUsage:
+    """一个 Key 当天的用量：count 为已知的全局总数（含本地未写入部分），pending 为尚未写入的本地增量"""
+
+    __slots__ = ("day", "count", "pending")
+
+    def __init__(self, day, count=0):
+        self.day = day
+        self.count = count
+        self.pending = 0
+
+
+class KeyLimiter:
+    """
+    - 每秒请求数：每个 Key 一个令牌桶；多 worker 部署时每个 worker 分得 1/workers 的速率和突发
+    - 每日配额：用量计数在内存中检查和累加，flush_interval 秒批量写入一次
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.usage = {}
+        self.path = None
+        self.flush_interval = 5.0
+        self.workers = 1
+        self._thread = None
+
+    def check(self, api_key, cost=1):
+        """
+        检查并记录 cost 次上游调用，剩余额度不足时返回 (错误信息, Retry-After 秒数)，否则返回 None
+        cost 超过突发容量时要求令牌桶已满，超出部分透支，之后的请求等待补充
+        """
+        if api_key is None or cost <= 0:
+            return None
+        if api_key.rate_limit:
+            bucket = self._bucket(api_key)
+            need = min(cost, bucket.burst)
+            if not bucket.try_acquire(need):
+                return RATE_LIMIT_EXCEEDED, bucket.retry_after(need)
+            if cost > need:
+                bucket.consume(cost - need)
+
+        today = _today()
+        with self.lock:
+            usage = self.usage.get(api_key.name)
+            if usage is None or usage.day != today:
+                usage = self.usage[api_key.name] = KeyUsage(today)
+            if api_key.daily_quota and usage.count + cost > api_key.daily_quota:
+                return QUOTA_EXCEEDED, _seconds_until_tomorrow()
+            usage.count += cost
+            usage.pending += cost
+        return None
+
+    def charge_blocking(self, api_key, cost=1):
+        """后台线程使用：超出每秒请求数时等待令牌补充，超出每日配额时抛出 KeyLimitExceeded"""
+        while True:
+            limited = self.check(api_key, cost)
+            if limited is None:
+                return
+            error, retry_after = limited
+            if error != RATE_LIMIT_EXCEEDED:
+                raise KeyLimitExceeded(error)
+            time.sleep(retry_after)
+
+    def _bucket(self, api_key):
+        rate = api_key.rate_limit / self.workers
+        burst = max(1.0, (api_key.burst or api_key.rate_limit) / self.workers)
+        entry = self.buckets.get(api_key.name)
+        # 限制被修改（配置重新加载）时重建令牌桶
+        if entry is None or entry[0] != (rate, burst):
+            with self.lock:
+                entry = self.buckets.get(api_key.name)
+                if entry is None or entry[0] != (rate, burst):
+                    entry = self.buckets[api_key.name] = ((rate, burst), TokenBucket(rate, burst))
+        return entry[1]
+
+    def usage_today(self, name):
+        usage = self.usage.get(name)
+        return usage.count if usage is not None and usage.day == _today() else 0
+
+    # ---------- 持久化 ----------
+
+    def start(self, workers=1):
+        """在 worker 进程中启动用量写入线程（fork 之后调用）"""
+        from app.config import config
+
+        cfg = config.key_limits
+        self.path = cfg.get("usage_db", "./run/key_usage.db")
+        self.flush_interval = cfg.get("flush_interval", self.flush_interval)
+        self.workers = max(1, workers)
+        self.buckets = {}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while True:
+                try:
+                    self.flush()
+                except sqlite3.Error as e:
+                    print(f"[KeyLimits] Usage flush failed: {e}")
+                time.sleep(self.flush_interval)
+
+        self._thread = threading.Thread(target=run, name="key-usage-flush", daemon=True)
+        self._thread.start()
+
+    def flush(self):
+        """把本地新增用量写入数据库，并将当天计数更新为全局总数"""
+        if self.path is None:
+            return
+        today = _today()
+        with self.lock:
+            deltas = [(name, usage.day, usage.pending) for name, usage in self.usage.items() if usage.pending]
+            for usage in self.usage.values():
+                usage.pending = 0
+
+        conn = _connect(self.path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO key_usage (name, day, count) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name, day) DO UPDATE SET count = count + excluded.count",
+                    deltas,
+                )
+                totals = dict(conn.execute("SELECT name, count FROM key_usage WHERE day = ?", (today,)))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                with self.lock:
+                    # 写入失败的增量留到下次
+                    for name, day, delta in deltas:
+                        usage = self.usage.get(name)
+                        if usage is not None and usage.day == day:
+                            usage.pending += delta
+                raise
+        finally:
+            conn.close()
+
+        with self.lock:
+            for name, total in totals.items():
+                usage = self.usage.get(name)
+                if usage is None or usage.day != today:
+                    usage = self.usage[name] = KeyUsage(today)
+                usage.count = total + usage.pending
+
+
+key_limiter = KeyLimiter()
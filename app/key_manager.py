@@ -2,10 +2,13 @@
 API Key Manager - 管理 API 密钥的创建、验证和访问控制
 """
 import secrets
-import re
+import threading
+import time
 from dataclasses import dataclass, field, asdict
 from datetime import datetime, timezone
-from typing import List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.endpoint_matcher import EndpointMatcher, normalize_endpoint
 
 
 @dataclass
@@ -43,6 +46,27 @@ class APIKey:
     created_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"))
     enabled: bool = True
     pool_restriction: PoolRestriction = field(default_factory=PoolRestriction)
+    rate_limit: float = 0  # 每秒请求数，0 表示不限制
+    burst: int = 0  # 令牌桶容量，0 表示与 rate_limit 相同
+    daily_quota: int = 0  # 每日（UTC）请求数上限，0 表示不限制
+    weight: float = 1.0  # 账号池饱和时的公平份额权重
+    priority: int = 0  # 排队时优先级高的 Key 先获得名额
+    allowed_matcher: EndpointMatcher = field(init=False, repr=False, compare=False)
+    denied_matcher: EndpointMatcher = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.compile_rules()
+
+    def compile_rules(self):
+        """将端点规则预编译为匹配器，在加载或更新端点列表后调用"""
+        self.allowed_matcher = EndpointMatcher(self.allowed_endpoints)
+        self.denied_matcher = EndpointMatcher(self.denied_endpoints)
+
+    def can_access(self, endpoint: str) -> bool:
+        """端点规则是否允许访问（endpoint 需已规范化）"""
+        if self.access_mode == "whitelist":
+            return self.allowed_matcher.match(endpoint)
+        return not self.denied_matcher.match(endpoint)
 
     def to_dict(self) -> dict:
         """转换为字典用于序列化"""
@@ -54,7 +78,12 @@ class APIKey:
             "denied_endpoints": self.denied_endpoints,
             "created_at": self.created_at,
             "enabled": self.enabled,
-            "pool_restriction": self.pool_restriction.to_dict()
+            "pool_restriction": self.pool_restriction.to_dict(),
+            "rate_limit": self.rate_limit,
+            "burst": self.burst,
+            "daily_quota": self.daily_quota,
+            "weight": self.weight,
+            "priority": self.priority,
         }
 
     @classmethod
@@ -69,6 +98,11 @@ class APIKey:
             created_at=data.get("created_at", datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")),
             enabled=data.get("enabled", True),
             pool_restriction=PoolRestriction.from_dict(data.get("pool_restriction")),
+            rate_limit=data.get("rate_limit", 0) or 0,
+            burst=data.get("burst", 0) or 0,
+            daily_quota=data.get("daily_quota", 0) or 0,
+            weight=data.get("weight", 1.0) or 1.0,
+            priority=data.get("priority", 0) or 0,
         )
 
 
@@ -81,6 +115,12 @@ class KeyManager:
         if cls._instance is None:
             cls._instance = super().__new__(cls)
             cls._instance._keys: List[APIKey] = []
+            cls._instance._by_key: Dict[str, APIKey] = {}
+            cls._instance._by_name: Dict[str, APIKey] = {}
+            cls._instance._config_signature = None
+            cls._instance._reload_lock = threading.Lock()
+            cls._instance.reload_count = 0
+            cls._instance.last_reload_at = None
         return cls._instance
 
     @staticmethod
@@ -91,7 +131,33 @@ class KeyManager:
 
     def load_from_config(self, api_keys_data: List[dict]):
         """从配置数据加载 API Keys"""
-        self._keys = [APIKey.from_dict(k) for k in (api_keys_data or [])]
+        from app.config import config
+
+        self._set_keys(APIKey.from_dict(k) for k in (api_keys_data or []))
+        self._config_signature = config.file_signature()
+
+    def _set_keys(self, keys: Iterable[APIKey]):
+        """替换全部 Key 并重建索引"""
+        keys = list(keys)
+        self._by_key = {k.key: k for k in keys}
+        self._by_name = {k.name: k for k in keys}
+        self._keys = keys
+
+    def _index_key(self, api_key: APIKey):
+        self._by_key[api_key.key] = api_key
+        self._by_name[api_key.name] = api_key
+
+    def _unindex_key(self, api_key: APIKey):
+        self._by_key.pop(api_key.key, None)
+        self._by_name.pop(api_key.name, None)
+
+    def reload_stats(self) -> dict:
+        """配置文件热加载的次数和最近一次的时间（Unix 时间戳，未发生过时为 None）"""
+        return {"count": self.reload_count, "last_reload_at": self.last_reload_at}
+
+    def invalidate(self):
+        """标记索引失效，下次访问检查时强制从配置文件重新加载"""
+        self._config_signature = None
 
     def list_keys(self) -> List[APIKey]:
         """列出所有 API Keys"""
@@ -99,17 +165,11 @@ class KeyManager:
 
     def get_key(self, key_value: str) -> Optional[APIKey]:
         """根据 key 值获取 APIKey"""
-        for k in self._keys:
-            if k.key == key_value:
-                return k
-        return None
+        return self._by_key.get(key_value)
 
     def get_key_by_name(self, name: str) -> Optional[APIKey]:
         """根据名称获取 APIKey"""
-        for k in self._keys:
-            if k.name == name:
-                return k
-        return None
+        return self._by_name.get(name)
 
     def create_key(
         self,
@@ -119,11 +179,20 @@ class KeyManager:
         denied_endpoints: List[str] = None,
         pool_mode: str = "all",
         allowed_accounts: List[str] = None,
+        rate_limit: float = 0,
+        burst: int = 0,
+        daily_quota: int = 0,
+        weight: float = 1.0,
+        priority: int = 0,
     ) -> Tuple[Optional[APIKey], str]:
         """创建新的 API Key，返回 (api_key, error_message)"""
         if self.get_key_by_name(name):
             return None, "Key name already exists"
 
+        error = self._validate_limits(rate_limit, burst, daily_quota, weight, priority)
+        if error:
+            return None, error
+
         if access_mode not in ("whitelist", "blacklist"):
             return None, "Invalid access mode"
 
@@ -146,8 +215,14 @@ class KeyManager:
             allowed_endpoints=allowed_endpoints or [],
             denied_endpoints=denied_endpoints or [],
             pool_restriction=pool_restriction,
+            rate_limit=rate_limit or 0,
+            burst=burst or 0,
+            daily_quota=daily_quota or 0,
+            weight=weight or 1.0,
+            priority=priority or 0,
         )
         self._keys.append(api_key)
+        self._index_key(api_key)
         self._save_to_config()
         return api_key, ""
 
@@ -160,12 +235,21 @@ class KeyManager:
         enabled: bool = None,
         pool_mode: str = None,
         allowed_accounts: List[str] = None,
+        rate_limit: float = None,
+        burst: int = None,
+        daily_quota: int = None,
+        weight: float = None,
+        priority: int = None,
     ) -> Tuple[bool, str]:
         """更新 API Key 配置，返回 (success, error_message)"""
         api_key = self.get_key_by_name(name)
         if not api_key:
             return False, "Key not found"
 
+        error = self._validate_limits(rate_limit, burst, daily_quota, weight, priority)
+        if error:
+            return False, error
+
         if access_mode is not None:
             if access_mode not in ("whitelist", "blacklist"):
                 return False, "Invalid access mode"
@@ -177,6 +261,9 @@ class KeyManager:
         if denied_endpoints is not None:
             api_key.denied_endpoints = denied_endpoints
 
+        if allowed_endpoints is not None or denied_endpoints is not None:
+            api_key.compile_rules()
+
         if enabled is not None:
             api_key.enabled = enabled
 
@@ -199,9 +286,33 @@ class KeyManager:
                 return False, "At least one account must be selected for specific mode"
             api_key.pool_restriction.allowed_accounts = allowed_accounts
 
+        if rate_limit is not None:
+            api_key.rate_limit = rate_limit
+        if burst is not None:
+            api_key.burst = burst
+        if daily_quota is not None:
+            api_key.daily_quota = daily_quota
+        if weight is not None:
+            api_key.weight = weight
+        if priority is not None:
+            api_key.priority = priority
+
         self._save_to_config()
         return True, ""
 
+    @staticmethod
+    def _validate_limits(rate_limit, burst, daily_quota, weight=None, priority=None) -> str:
+        """校验限流与公平调度参数（None 表示不修改），返回错误信息"""
+        for label, value in (("rate_limit", rate_limit), ("burst", burst), ("daily_quota", daily_quota),
+                             ("weight", weight), ("priority", priority)):
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return f"Invalid {label}"
+            if (label == "weight" and value <= 0) or (label != "priority" and value < 0):
+                return f"Invalid {label}"
+        return ""
+
     def delete_key(self, name: str) -> bool:
         """删除 API Key"""
         api_key = self.get_key_by_name(name)
@@ -209,6 +320,7 @@ class KeyManager:
             return False
 
         self._keys.remove(api_key)
+        self._unindex_key(api_key)
         self._save_to_config()
         return True
 
@@ -228,7 +340,7 @@ class KeyManager:
 
     def check_access(self, key_value: str, endpoint: str) -> Tuple[bool, str]:
         """检查 API Key 是否有权访问指定端点"""
-        # 每次检查时从配置重新加载，确保配置变更立即生效
+        # 配置文件发生变化时才重新加载，确保配置变更生效且不在每次请求时解析 YAML
         self._reload_from_config()
         
         api_key = self.get_key(key_value)
@@ -239,45 +351,37 @@ class KeyManager:
         if not api_key.enabled:
             return False, "API key is disabled"
 
-        normalized_endpoint = self._normalize_endpoint(endpoint)
-
-        if api_key.access_mode == "whitelist":
-            if self._match_endpoint(normalized_endpoint, api_key.allowed_endpoints):
-                return True, ""
-            return False, "Access denied to this endpoint"
-        else:
-            if self._match_endpoint(normalized_endpoint, api_key.denied_endpoints):
-                return False, "Access denied to this endpoint"
+        if api_key.can_access(normalize_endpoint(endpoint)):
             return True, ""
+        return False, "Access denied to this endpoint"
     
-    def _reload_from_config(self):
-        """从配置文件重新加载 API Keys"""
+    def _reload_from_config(self) -> bool:
+        """配置文件的 mtime/size 变化（或被标记失效）时从配置重新加载 API Keys"""
         from app.config import config
-        config.reload()
-        self._keys = [APIKey.from_dict(k) for k in (config.api_keys or [])]
-
-    def _normalize_endpoint(self, endpoint: str) -> str:
-        """规范化端点路径，移除动态参数"""
-        normalized = re.sub(r"/\d+", "/<id>", endpoint)
-        normalized = normalized.split("?")[0]
-        return normalized
-
-    def _match_endpoint(self, endpoint: str, patterns: List[str]) -> bool:
-        """检查端点是否匹配任一模式"""
-        for pattern in patterns:
-            if pattern.endswith("/*"):
-                prefix = pattern[:-1]
-                if endpoint.startswith(prefix):
-                    return True
-            elif pattern == endpoint:
-                return True
-        return False
+
+        signature = config.file_signature()
+        if signature is None or signature == self._config_signature:
+            return False
+
+        with self._reload_lock:
+            # 等待锁期间可能已被其他线程重新加载
+            if signature == self._config_signature:
+                return False
+            config.reload()
+            self._set_keys(APIKey.from_dict(k) for k in (config.api_keys or []))
+            self._config_signature = signature
+            self.reload_count += 1
+            self.last_reload_at = time.time()
+        print(f"[KeyManager] Reloaded {len(self._keys)} keys from config (reload #{self.reload_count})")
+        return True
 
     def _save_to_config(self):
         """保存到配置文件"""
         from app.config import config
 
         config.set_api_keys([k.to_dict() for k in self._keys])
+        # 自身写入的变更无需再触发重新加载
+        self._config_signature = config.file_signature()
 
 
 key_manager = KeyManager()
@@ -0,0 +1,301 @@
+"""
+Prometheus 指标 - /metrics 以文本格式（text/plain; version=0.0.4）输出
+- 耗时直方图按线程分片：记录时只写当前线程自己的分片（不加锁，约 1 微秒），抓取时汇总所有分片
+- 账号、缓存、请求合并和准入控制的状态在抓取时直接读取，不在请求路径上额外计数
+多 worker 部署时各 worker 定期把自己的指标写入 <state_dir>/metrics/<pid>.json，抓取时由处理请求的 worker 合并：
+直方图在所有 worker 间相加（已退出 worker 的数据保留，计数保持单调），状态值带 worker 标签按进程输出
+（共享状态下账号请求数已是全局总数，各 worker 输出的值相同）
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HISTOGRAMS = {
+    "pixiv_http_request_duration_seconds": (
+        "Time spent handling HTTP requests", ("route", "method", "status")),
+    "pixiv_upstream_request_duration_seconds": (
+        "Time spent in upstream pixivpy3 calls, per attempt", ("method", "outcome")),
+    "pixiv_key_check_duration_seconds": (
+        "Time spent authorizing API keys", ("result",)),
+    "pixiv_token_refresh_duration_seconds": (
+        "Time spent refreshing account tokens", ("account", "outcome")),
+}
+
+
+class Metrics:
+    """按线程分片的直方图集合"""
+
+    def __init__(self):
+        self.enabled = True
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        # 已退出线程的数据合并到这里，避免短生命周期线程的分片无限增长
+        self._retired = {}
+        # 多 worker 部署时各 worker 指标文件所在目录
+        self.multiprocess_dir = None
+
+    def _shard(self):
+        shard = {}
+        with self.lock:
+            self._shards.append((threading.current_thread(), shard))
+        self._local.shard = shard
+        return shard
+
+    def observe(self, name, labels, value):
+        """记录一次耗时（秒），labels 为与 HISTOGRAMS 中标签名对应的元组"""
+        if not self.enabled:
+            return
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._shard()
+        key = (name, labels)
+        series = shard.get(key)
+        if series is None:
+            # [各桶计数..., +Inf 桶计数, 总和]
+            series = shard[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        series[bisect_left(BUCKETS, value)] += 1
+        series[-1] += value
+
+    def snapshot(self):
+        """汇总所有分片，返回 {(name, labels): [各桶计数..., 总和]}"""
+        with self.lock:
+            merged = {key: list(series) for key, series in self._retired.items()}
+            alive = []
+            for thread, shard in self._shards:
+                # dict.copy 在 GIL 下一次完成，不会与所属线程插入新序列冲突
+                for key, series in shard.copy().items():
+                    total = merged.get(key)
+                    if total is None:
+                        merged[key] = list(series)
+                    else:
+                        for i, value in enumerate(series):
+                            total[i] += value
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    for key, series in shard.items():
+                        retired = self._retired.setdefault(key, [0] * len(series))
+                        for i, value in enumerate(series):
+                            retired[i] += value
+            self._shards = alive
+        return merged
+
+    # ---------- 多 worker ----------
+
+    def start_multiprocess(self, path, interval=5.0):
+        """在 worker 进程中调用：每 interval 秒把本进程的指标写入 path/<pid>.json，抓取时合并所有 worker"""
+        if not self.enabled:
+            return
+        os.makedirs(path, exist_ok=True)
+        self.multiprocess_dir = path
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except OSError as e:
+                    print(f"[Metrics] Flush failed: {e}")
+
+        threading.Thread(target=run, name="metrics-flush", daemon=True).start()
+
+    @staticmethod
+    def reset_multiprocess(path):
+        """新一轮部署开始时由主进程调用：删除上一轮 worker 的指标文件"""
+        if not os.path.isdir(path):
+            return
+        for name in os.listdir(path):
+            if name.endswith(".json"):
+                os.remove(os.path.join(path, name))
+
+    def flush(self):
+        """原子写入本进程的直方图和状态值"""
+        data = {
+            "pid": os.getpid(),
+            "histograms": [[name, list(labels), series] for (name, labels), series in self.snapshot().items()],
+            "state": collect_state(),
+        }
+        path = os.path.join(self.multiprocess_dir, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def collect(self):
+        """返回 (直方图 {(name, labels): series}, [(worker, 状态值列表), ...])，单进程时 worker 为 None"""
+        if not self.multiprocess_dir:
+            return self.snapshot(), [(None, collect_state())]
+        # 先写入本进程的最新数据，其他 worker 的数据最多滞后一个写入间隔
+        self.flush()
+        merged = {}
+        states = []
+        for name in sorted(os.listdir(self.multiprocess_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.multiprocess_dir, name), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for series_name, labels, series in data["histograms"]:
+                key = (series_name, tuple(labels))
+                total = merged.get(key)
+                if total is None:
+                    merged[key] = series
+                else:
+                    for i, value in enumerate(series):
+                        total[i] += value
+            if _alive(data["pid"]):
+                states.append((str(data["pid"]), data["state"]))
+        return merged, states
+
+    def render(self):
+        """输出 Prometheus 文本格式"""
+        lines = []
+        merged, states = self.collect()
+        for name, (help_text, label_names) in HISTOGRAMS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (series_name, labels), series in sorted(merged.items()):
+                if series_name != name:
+                    continue
+                base = list(zip(label_names, labels))
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), series[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(base + [('le', str(bound))])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(base)} {series[-1]}")
+                lines.append(f"{name}_count{_labels(base)} {cumulative}")
+        # 同名状态值合并到一组 HELP / TYPE 之下
+        grouped = {}
+        for worker, state in states:
+            for name, kind, help_text, samples in state:
+                entry = grouped.setdefault(name, (kind, help_text, []))
+                for labels, value in samples:
+                    labels = list(labels) if worker is None else [("worker", worker)] + list(labels)
+                    entry[2].append((labels, value))
+        for name, (kind, help_text, samples) in grouped.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def collect_state():
+    """抓取时读取的计数器和状态值，返回 [(指标名, 类型, 说明, [(标签, 值), ...]), ...]"""
+    from app.pool import pool
+    from app.cache import response_cache
+    from app.image_cache import image_cache
+    from app.singleflight import singleflight
+    from app.admission import admission
+
+    accounts = list(pool.accounts)
+
+    def per_account(value):
+        return [([("account", a.name)], value(a)) for a in accounts]
+
+    response_stats = response_cache.stats()
+    image_stats = image_cache.stats()
+    flight_stats = singleflight.stats()
+    admission_stats = admission.stats()
+    return [
+        ("pixiv_account_authenticated", "gauge", "Whether the account is authenticated",
+         per_account(lambda a: int(a.authenticated))),
+        ("pixiv_account_inflight", "gauge", "Upstream requests in flight per account",
+         per_account(lambda a: a.inflight)),
+        ("pixiv_account_requests_total", "counter", "Requests routed to each account",
+         per_account(lambda a: a.request_count)),
+        ("pixiv_account_errors_total", "counter", "Failed upstream calls per account",
+         per_account(lambda a: a.error_count)),
+        ("pixiv_account_throttled_total", "counter", "Times each account was rate limited by Pixiv",
+         per_account(lambda a: a.throttle_count)),
+        ("pixiv_account_circuit_open", "gauge", "Whether the account circuit breaker is not closed",
+         per_account(lambda a: int(a.breaker.state != a.breaker.CLOSED))),
+        ("pixiv_cache_hits_total", "counter", "Cache hits", [
+            ([("cache", "response")], response_stats.get("hits", 0)),
+            ([("cache", "image")], image_stats.get("hits", 0)),
+        ]),
+        ("pixiv_cache_misses_total", "counter", "Cache misses", [
+            ([("cache", "response")], response_stats.get("misses", 0)),
+            ([("cache", "image")], image_stats.get("misses", 0)),
+        ]),
+        ("pixiv_cache_hit_ratio", "gauge", "Cache hit ratio since start", [
+            ([("cache", "response")], response_stats.get("hit_ratio", 0.0)),
+            ([("cache", "image")], image_stats.get("hit_ratio", 0.0)),
+        ]),
+        ("pixiv_cache_entries", "gauge", "Entries held by each cache", [
+            ([("cache", "response")], response_stats.get("entries", 0)),
+            ([("cache", "image")], image_stats.get("entries", 0)),
+        ]),
+        ("pixiv_singleflight_coalesced_total", "counter", "Upstream calls coalesced into an in-flight call",
+         [([], flight_stats["coalesced"])]),
+        ("pixiv_admission_in_flight", "gauge", "Upstream calls admitted and running",
+         [([], admission_stats["in_flight"])]),
+        ("pixiv_admission_queued", "gauge", "Upstream calls waiting for admission",
+         [([], admission_stats["queued"])]),
+        ("pixiv_admission_rejected_total", "counter", "Upstream calls shed by admission control",
+         [([], admission_stats["shed"] + admission_stats["timeouts"])]),
+    ]
+
+
+def install_metrics(app):
+    """记录 Flask 请求耗时并注册 /metrics（metrics.require_auth 时需要管理 Token）"""
+    from flask import g, request
+    from app.auth import require_auth
+    from app.config import config
+
+    cfg = config.metrics
+    metrics.enabled = cfg.get("enabled", True)
+    if not metrics.enabled:
+        return
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            metrics.observe("pixiv_http_request_duration_seconds",
+                            (route, request.method, str(response.status_code)),
+                            time.perf_counter() - start)
+        return response
+
+    def metrics_view():
+        return app.response_class(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+    if cfg.get("require_auth", True):
+        metrics_view = require_auth(metrics_view)
+    app.add_url_rule("/metrics", "metrics", metrics_view, methods=["GET"])
+
+
+metrics = Metrics()
@@ -0,0 +1,128 @@
+"""
+分页遍历 - ?all=true 时在服务端沿 next_url 逐页获取，以 NDJSON 流式输出每个条目
+后台线程预取下一页，与当前页的输出重叠；队列最多缓存一页，内存占用与遍历的页数无关
+"""
+import queue
+import threading
+from flask import request, g, current_app, Response, stream_with_context
+from pixivpy3 import AppPixivAPI
+from app.key_limits import key_limiter
+from app.key_manager import key_manager
+from app.projection import request_fields
+from app.upstream import call_upstream
+
+ITEMS_KEY = "illusts"
+_END = object()
+
+
+def wants_all(value):
+    """?all= 参数是否开启遍历模式"""
+    return (value or "").lower() in ("1", "true", "yes")
+
+
+def pagination_settings():
+    """未指定 limit 时的默认条目数和 limit 上限"""
+    from app.config import config
+
+    cfg = config.pagination
+    return {
+        "default_limit": cfg.get("default_limit", 300),
+        "max_limit": cfg.get("max_limit", 3000),
+    }
+
+
+def walk(first_page, fetch, limit):
+    """
+    产出 first_page 及后续各页的条目，最多 limit 个
+    fetch(kwargs) 获取下一页（kwargs 由 next_url 解析）；后续页出错时产出 {"error": ...} 并结束
+    """
+    pages = queue.Queue(maxsize=1)
+    stop = threading.Event()
+
+    def put(page):
+        # 消费端提前结束（客户端断开或达到 limit）时放弃等待
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def prefetch():
+        next_url = first_page.get("next_url")
+        remaining = limit - len(first_page[ITEMS_KEY])
+        try:
+            while next_url and remaining > 0 and not stop.is_set():
+                page = fetch(AppPixivAPI.parse_qs(next_url))
+                if not put(page) or not isinstance(page, dict) or ITEMS_KEY not in page:
+                    return
+                remaining -= len(page[ITEMS_KEY])
+                next_url = page.get("next_url")
+        except Exception as e:
+            put(e)
+            return
+        put(_END)
+
+    threading.Thread(target=prefetch, daemon=True, name="page-prefetch").start()
+    count = 0
+    page = first_page
+    try:
+        while True:
+            for item in page[ITEMS_KEY]:
+                if count >= limit:
+                    return
+                yield item
+                count += 1
+            if count >= limit:
+                return
+            page = pages.get()
+            if page is _END:
+                return
+            if isinstance(page, Exception):
+                yield {"error": str(page)}
+                return
+            if not isinstance(page, dict) or ITEMS_KEY not in page:
+                # Pixiv 返回的错误结果
+                yield {"error": page.get("error") if isinstance(page, dict) else page}
+                return
+    finally:
+        stop.set()
+
+
+def stream_pages(method, *args, **kwargs):
+    """
+    ?all=true&limit=N：第一页同步获取（失败时由路由按普通错误响应返回），
+    之后每个条目一行 JSON（application/x-ndjson）边获取边输出
+    """
+    settings = pagination_settings()
+    limit = request.args.get("limit", settings["default_limit"], type=int)
+    limit = max(1, min(limit, settings["max_limit"]))
+
+    # 预取线程没有请求上下文，API Key 和负载均衡策略显式传入
+    key_value = getattr(g, 'api_key_value', None)
+    strategy = request.args.get("lb")
+    first = call_upstream(key_value, strategy, method, *args, **kwargs)
+    if not isinstance(first, dict) or ITEMS_KEY not in first:
+        return current_app.json.response(first)
+
+    # 后续每一页都是一次上游调用，计入 API Key 的限流与配额（第一页已在鉴权时计入）：
+    # 超出每秒请求数时按 Key 的速率等待，超出每日配额时输出错误行并结束
+    api_key = key_manager.get_key(key_value) if key_value else None
+
+    def fetch(next_kwargs):
+        key_limiter.charge_blocking(api_key)
+        return call_upstream(key_value, strategy, method, **next_kwargs)
+
+    fields = request_fields()
+
+    def generate():
+        for item in walk(first, fetch, limit):
+            if fields is not None and "error" not in item:
+                item = fields.record(item)
+            yield current_app.json.dumps(item) + "\n"
+
+    response = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    # 反向代理不要缓冲整个响应
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
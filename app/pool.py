@@ -1,9 +1,17 @@
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from pixivpy3 import AppPixivAPI
 from app.config import config
 from app.gppt_auth import gppt_auth, GPPT_AVAILABLE
+from app.refresher import refresher
+from app.selector import AccountSelector
+from app.ratelimit import TokenBucket
+from app.circuit import CircuitBreaker
+from app.metrics import metrics
+from app.timing import record_phase
+from app.transport import transport_settings, configure_session, connection_stats
 
 
 def get_proxy_settings():
@@ -27,12 +35,12 @@ class ProxiedAppPixivAPI(AppPixivAPI):
     """支持代理的 AppPixivAPI"""
     
     def set_proxy(self, proxies):
-        """设置代理"""
+        """设置代理（保留超时等其他请求参数）"""
         if proxies:
-            self.requests_kwargs = {"proxies": proxies}
+            self.requests_kwargs["proxies"] = proxies
             print(f"[Pixiv] Proxy set: {proxies}")
         else:
-            self.requests_kwargs = {}
+            self.requests_kwargs.pop("proxies", None)
 
 
 class PixivAccount:
@@ -43,12 +51,29 @@ class PixivAccount:
         self.username = username
         self.password = password
         self.api = ProxiedAppPixivAPI()
+        # 连接池、超时与重试，可在 pixiv_accounts 中按账号覆盖
+        configure_session(self.api, transport_settings(name))
         # 设置代理
         self.api.set_proxy(get_proxy_settings())
         self.request_count = 0
+        self.synced_count = 0  # 多 worker 时上次与共享状态同步的全局计数
         self.last_request_time = 0
+        self.inflight = 0  # 进行中的上游请求数
+        self.ewma_latency = 0.0  # 上游延迟 EWMA（秒）
+        # 单账号限流：令牌桶 + 被 Pixiv 限流后的冷却
+        rate_cfg = config.rate_limit
+        rps = rate_cfg.get("per_account_rps", 0)
+        self.bucket = TokenBucket(rps, rate_cfg.get("per_account_burst")) if rps else None
+        self.cooldown_until = 0
+        self.throttle_count = 0
+        self.error_count = 0  # 计入熔断器的失败调用数
+        # 熔断器：持续出错（网络、代理、token 失效）的账号暂时移出轮换
+        self.breaker = CircuitBreaker.from_config(name)
         self.last_refresh_time = 0  # 上次刷新 token 的时间
+        self.next_refresh_time = 0  # 后台调度的下次刷新时间
+        self.refreshing = False
         self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
         self.authenticated = False
     
     def auth(self, auto_gppt=False):
@@ -107,7 +132,21 @@ class PixivAccount:
         return False
     
     def refresh(self):
-        """刷新 token"""
+        """刷新 token，刷新期间账号标记为 refreshing，选择账号时会跳过"""
+        with self.refresh_lock:
+            self.refreshing = True
+            start = time.perf_counter()
+            ok = False
+            try:
+                ok = self._refresh()
+                return ok
+            finally:
+                self.refreshing = False
+                latency = time.perf_counter() - start
+                metrics.observe("pixiv_token_refresh_duration_seconds", (self.name, "ok" if ok else "failed"), latency)
+                record_phase("refresh", latency, self.name)
+    
+    def _refresh(self):
         # 先尝试用 pixivpy3 自带的刷新
         if self.refresh_token:
             if self._auth_with_token(self.refresh_token):
@@ -131,10 +170,72 @@ class PixivAccount:
             return self.refresh()
         return True
     
+    def apply_tokens(self, access_token, refresh_token, refreshed_at):
+        """采用其他 worker 刷新得到的 token，不再请求 Pixiv"""
+        with self.refresh_lock:
+            self.api.set_auth(access_token, refresh_token)
+            self.refresh_token = refresh_token
+            self.last_refresh_time = refreshed_at
+            self.authenticated = True
+    
+    def reset_connections(self):
+        """丢弃连接池中的连接（fork 后子进程不能与父进程共用连接）"""
+        configure_session(self.api, transport_settings(self.name))
+    
+    def can_serve(self):
+        """账号可以处理请求：已认证、熔断器未断开、不在限流冷却期、令牌桶有余量"""
+        if not self.authenticated or not self.breaker.available():
+            return False
+        if self.cooldown_until and time.time() < self.cooldown_until:
+            return False
+        return self.bucket is None or self.bucket.available()
+    
+    def is_available(self):
+        """账号可立即处理请求（可以处理且未在刷新 token）"""
+        return self.can_serve() and not self.refreshing
+    
+    def mark_throttled(self, cooldown):
+        """被 Pixiv 限流，进入冷却期，期间选择账号时跳过"""
+        with self.lock:
+            self.cooldown_until = time.time() + cooldown
+            self.throttle_count += 1
+        print(f"[Pool] Account [{self.name}] rate limited, cooling down for {cooldown}s")
+    
     def record_request(self):
         with self.lock:
             self.request_count += 1
             self.last_request_time = time.time()
+        self.breaker.on_selected()
+        if self.bucket is not None:
+            self.bucket.consume()
+    
+    def begin_request(self):
+        """上游调用开始"""
+        with self.lock:
+            self.inflight += 1
+    
+    def end_request(self, latency, success=True):
+        """上游调用结束，更新延迟的指数加权移动平均 (EWMA)，并将结果计入熔断器"""
+        self.breaker.record(success)
+        with self.lock:
+            self.inflight -= 1
+            if not success:
+                self.error_count += 1
+            if self.ewma_latency:
+                alpha = config.lb_ewma_alpha
+                self.ewma_latency = alpha * latency + (1 - alpha) * self.ewma_latency
+            else:
+                self.ewma_latency = latency
+    
+    def expected_cost(self):
+        """
+        预期开销：EWMA 延迟 x (进行中请求数 + 1) / 健康分，单位始终为秒
+        尚无延迟样本的账号使用池的延迟估计（pool.latency_prior），与已有样本的账号按同一尺度比较
+        近期错误率高的账号开销升高，分到的请求随之减少
+        """
+        health = max(self.breaker.health(), 0.05)
+        latency = self.ewma_latency or pool.latency_prior()
+        return latency * (self.inflight + 1) / health
 
 class AccountPool:
     """多账号负载均衡池"""
@@ -149,10 +250,17 @@ class AccountPool:
     def _init_pool(self):
         self.accounts = []
         self.lock = threading.Lock()
-        self.index = 0
+        self.selector = AccountSelector()
+        self.startup = {}
+        self.startup_done = threading.Event()
+        # (计算时间, 延迟估计)
+        self._latency_prior = None
 
-    def load_from_config(self):
-        """从 config.yaml 加载账号"""
+    def load_from_config(self, saved_tokens=None):
+        """
+        从 config.yaml 加载账号
+        saved_tokens: {账号名: refresh_token}，多 worker 部署时共享状态中保存的 token，优先于 config.yaml
+        """
         # 初始化 gppt 缓存目录
         gppt_config = config._data.get("gppt", {})
         if gppt_config.get("enabled", False):
@@ -160,18 +268,117 @@ class AccountPool:
             gppt_auth.cache_dir = Path(cache_dir)
             gppt_auth.cache_dir.mkdir(exist_ok=True)
         
-        # 从 config.yaml 加载
-        for acc in config.pixiv_accounts:
-            if acc.get("enabled", True):
-                self.add_account(
-                    refresh_token=acc.get("refresh_token"),
-                    name=acc.get("name"),
-                    username=acc.get("username"),
-                    password=acc.get("password"),
-                    save=False  # 启动时不重复保存
-                )
+        # 从 config.yaml 加载，并发认证
+        entries = [acc for acc in config.pixiv_accounts if acc.get("enabled", True)]
+        startup_cfg = config.startup
+        workers = max(1, int(startup_cfg.get("auth_workers", 8)))
+        # ready_accounts: 认证成功 N 个账号后即开始服务，其余在后台继续认证；0 表示等待全部完成
+        ready_target = int(startup_cfg.get("ready_accounts", 0) or 0)
+        ready_target = min(ready_target, len(entries)) if ready_target > 0 else len(entries)
+        
+        self.startup = {
+            "total": len(entries),
+            "ready": 0,
+            "failed": 0,
+            "done": not entries,
+            "started_at": time.time(),
+            "elapsed": 0.0,
+            "accounts": {},
+        }
+        ready_event = threading.Event()
+        self.startup_done.clear()
+        if not entries:
+            ready_event.set()
+            self.startup_done.set()
         
-        print(f"[Pool] Loaded {len(self.accounts)} accounts from config.yaml")
+        # 名称和位置在提交前按配置顺序确定：认证并发进行，完成顺序不固定
+        base = len(self.accounts)
+        names = [acc.get("name") or f"account_{base + i}" for i, acc in enumerate(entries)]
+        saved_tokens = saved_tokens or {}
+        order = {}
+        
+        def insert(account, index):
+            """按配置顺序插入：放在配置中排在它之后的第一个已就绪账号之前"""
+            with self.lock:
+                order[account] = index
+                position = len(self.accounts)
+                for i, existing in enumerate(self.accounts):
+                    if order.get(existing, -1) > index:
+                        position = i
+                        break
+                self.accounts.insert(position, account)
+            self.selector.invalidate()
+            refresher.wakeup()
+        
+        def auth_one(index, acc):
+            name = names[index]
+            start = time.time()
+            try:
+                token = saved_tokens.get(name) or acc.get("refresh_token")
+                account = PixivAccount(name, token, acc.get("username"), acc.get("password"))
+                ok = account.auth()
+                if ok:
+                    insert(account, index)
+            except Exception as e:
+                print(f"[Pool] Account [{name}] auth error: {e}")
+                ok = False
+            duration = time.time() - start
+            print(f"[Pool] Account [{name}] startup auth {'ok' if ok else 'failed'} in {duration:.2f}s")
+            
+            with self.lock:
+                self.startup["accounts"][name] = {"ok": ok, "duration": round(duration, 3)}
+                self.startup["ready" if ok else "failed"] += 1
+                finished = self.startup["ready"] + self.startup["failed"]
+                self.startup["elapsed"] = round(time.time() - self.startup["started_at"], 3)
+                if finished == len(entries):
+                    self.startup["done"] = True
+                    self.startup_done.set()
+                if self.startup["ready"] >= ready_target or self.startup["done"]:
+                    ready_event.set()
+            if finished == len(entries):
+                print(f"[Pool] Startup auth finished: {self.startup['ready']}/{len(entries)} accounts "
+                      f"in {self.startup['elapsed']:.2f}s")
+        
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pool-auth")
+        for index, acc in enumerate(entries):
+            executor.submit(auth_one, index, acc)
+        ready_event.wait()
+        # 剩余账号在后台继续认证
+        executor.shutdown(wait=False)
+        
+        pending = len(entries) - self.startup["ready"] - self.startup["failed"]
+        print(f"[Pool] Loaded {len(self.accounts)} accounts from config.yaml"
+              + (f", {pending} still authenticating in background" if pending else ""))
+    
+    def latency_prior(self):
+        """
+        尚无延迟样本的账号的延迟估计（秒）：池内各账号 EWMA 延迟的中位数，每秒最多重算一次；
+        池内都没有样本时使用 load_balance.default_latency_ms
+        """
+        now = time.monotonic()
+        cached = self._latency_prior
+        if cached is not None and now - cached[0] < 1.0:
+            return cached[1]
+        samples = sorted(a.ewma_latency for a in self.accounts if a.ewma_latency)
+        prior = samples[len(samples) // 2] if samples else config.lb_default_latency
+        self._latency_prior = (now, prior)
+        return prior
+    
+    def wait_startup(self, timeout=None):
+        """等待启动时的账号认证全部完成（包括 ready_accounts 之后在后台继续认证的账号）"""
+        return self.startup_done.wait(timeout)
+    
+    def startup_status(self):
+        """启动认证进度与每个账号的认证耗时"""
+        with self.lock:
+            if not self.startup:
+                # 尚未从配置加载账号（测试或嵌入使用）
+                return {}
+            status = dict(self.startup)
+            status["accounts"] = dict(self.startup["accounts"])
+            if not status["done"]:
+                status["elapsed"] = round(time.time() - status["started_at"], 3)
+        return status
     
     def add_account(self, refresh_token=None, name=None, username=None, password=None, auto_gppt=False, save=True):
         """
@@ -182,12 +389,20 @@ class AccountPool:
         name = name or f"account_{len(self.accounts)}"
         account = PixivAccount(name, refresh_token, username, password)
         if account.auth(auto_gppt=auto_gppt):
-            self.accounts.append(account)
+            with self.lock:
+                self.accounts.append(account)
+            self.selector.invalidate()
             if save:
                 config.add_account(name, account.refresh_token, username)
+            refresher.wakeup()
             return True
         return False
     
+    def reset_connections(self):
+        """fork 出的 worker 进程中调用，丢弃从父进程继承的上游连接"""
+        for acc in self.accounts:
+            acc.reset_connections()
+    
     def update_proxy(self):
         """更新所有账号的代理设置"""
         proxies = get_proxy_settings()
@@ -198,6 +413,7 @@ class AccountPool:
     def remove_account(self, name):
         with self.lock:
             self.accounts = [a for a in self.accounts if a.name != name]
+        self.selector.invalidate()
         config.remove_account(name)
         # 从所有 API Key 的 allowed_accounts 中移除该账号
         from app.key_manager import key_manager
@@ -211,12 +427,7 @@ class AccountPool:
         """获取账号（支持多种策略）"""
         if not self.accounts:
             return None
-        
-        strategy = strategy or config.lb_strategy
-        
-        if strategy == "least_used":
-            return self._get_least_used()
-        return self._get_round_robin()
+        return self._select(self.selector.view(self.accounts), strategy)
 
     def get_account_for_key(self, pool_mode, allowed_accounts, strategy=None):
         """
@@ -225,55 +436,39 @@ class AccountPool:
         allowed_accounts: 允许的账号名称列表（仅 specific 模式有效）
         strategy: 负载均衡策略
         """
-        # 获取可用账号列表
         if pool_mode == "all":
-            available = [a for a in self.accounts if a.authenticated]
+            view = self.selector.view(self.accounts)
         else:
             # specific 模式：仅使用允许的账号
-            available = [a for a in self.accounts if a.authenticated and a.name in allowed_accounts]
-        
-        if not available:
-            return None
-        
+            view = self.selector.view(self.accounts, allowed_accounts)
+        return self._select(view, strategy)
+
+    def _select(self, view, strategy):
+        """
+        从账号视图中选择账号，跳过未认证和正在刷新 token 的账号
+        token 由后台调度器刷新，这里不再同步刷新
+        """
         strategy = strategy or config.lb_strategy
-        
         if strategy == "least_used":
-            return self._get_least_used_from(available)
-        return self._get_round_robin_from(available)
-
-    def _get_round_robin_from(self, accounts):
-        """从指定账号列表中轮询获取"""
-        with self.lock:
-            account = accounts[self.index % len(accounts)]
-            self.index += 1
-        account.check_and_refresh()
-        account.record_request()
-        return account
-
-    def _get_least_used_from(self, accounts):
-        """从指定账号列表中获取最少使用的"""
-        with self.lock:
-            account = min(accounts, key=lambda a: a.request_count)
-        account.check_and_refresh()
-        account.record_request()
-        return account
+            return view.least_used()
+        if strategy == "ewma":
+            return view.least_cost()
+        return view.round_robin()
     
-    def _get_round_robin(self):
-        with self.lock:
-            account = self.accounts[self.index % len(self.accounts)]
-            self.index += 1
-        # 检查并刷新 token
-        account.check_and_refresh()
-        account.record_request()
-        return account
-    
-    def _get_least_used(self):
-        with self.lock:
-            account = min(self.accounts, key=lambda a: a.request_count)
-        # 检查并刷新 token
-        account.check_and_refresh()
-        account.record_request()
-        return account
+    def cooldown_remaining(self):
+        """
+        距离最早一个被限流的账号恢复还需的秒数：取 Pixiv 限流冷却期与本地令牌桶等待时间中较长者，
+        没有被限流的账号时返回 0
+        """
+        now = time.time()
+        remaining = []
+        for a in self.accounts:
+            if not a.authenticated:
+                continue
+            wait = max(a.cooldown_until - now, a.bucket.retry_after() if a.bucket is not None else 0)
+            if wait > 0:
+                remaining.append(wait)
+        return min(remaining) if remaining else 0
     
     def status(self):
         return [{
@@ -281,7 +476,15 @@ class AccountPool:
             "authenticated": a.authenticated,
             "request_count": a.request_count,
             "last_request": a.last_request_time,
-            "has_credentials": bool(a.username)
+            "has_credentials": bool(a.username),
+            "refreshing": a.refreshing,
+            "next_refresh": a.next_refresh_time,
+            "inflight": a.inflight,
+            "ewma_latency_ms": round(a.ewma_latency * 1000, 1),
+            "throttle_count": a.throttle_count,
+            "cooldown_until": a.cooldown_until,
+            "circuit": a.breaker.status(),
+            "connections": connection_stats(a.api.requests)
         } for a in self.accounts]
     
     def refresh_account(self, name):
@@ -289,8 +492,8 @@ class AccountPool:
         for acc in self.accounts:
             if acc.name == name:
                 if acc.refresh():
-                    # 刷新成功后更新配置文件
-                    config.add_account(acc.name, acc.refresh_token, acc.username)
+                    # 刷新成功后更新配置文件并重新安排后台刷新
+                    refresher.refreshed(acc)
                     return True
         return False
     
@@ -299,26 +502,17 @@ class AccountPool:
         success = 0
         for acc in self.accounts:
             if acc.refresh():
-                config.add_account(acc.name, acc.refresh_token, acc.username)
+                refresher.refreshed(acc)
                 success += 1
         print(f"[Pool] Refreshed {success}/{len(self.accounts)} accounts")
         return success
     
-    def start_auto_refresh(self, interval=3000):
+    def start_auto_refresh(self, interval=None):
         """
-        启动自动刷新任务
-        interval: 刷新间隔（秒），默认50分钟
+        启动后台 token 刷新调度
+        interval: 刷新间隔（秒），默认读取 config.yaml 的 token_refresh.interval（50分钟）
+        每个账号在上次刷新后 interval 秒（减去随机抖动）刷新，请求路径不再同步刷新
         """
-        import threading
-        
-        def refresh_loop():
-            while True:
-                time.sleep(interval)
-                print(f"[Pool] Auto refresh triggered")
-                self.refresh_all()
-        
-        thread = threading.Thread(target=refresh_loop, daemon=True)
-        thread.start()
-        print(f"[Pool] Auto refresh started, interval: {interval}s")
+        refresher.start(self, interval)
 
 pool = AccountPool()
@@ -0,0 +1,205 @@
+"""
+按需性能分析 - 在线上服务中定位 CPU 热点（只分析处理管理请求的 worker 进程）
+- sample：在 N 秒内每隔 interval 读取所有线程的调用栈（sys._current_frames），输出折叠栈，
+  可直接交给 flamegraph.pl / speedscope 生成火焰图；不修改解释器状态，被分析的请求没有额外开销
+- requests：对接下来的 N 个 Flask 请求启用 cProfile，合并后输出 pstats 文本或二进制转储（pstats.Stats 可加载）；
+  ASGI 模式下异步路由不经过 Flask 请求钩子，且事件循环中交错执行的协程无法按请求区分，不支持此模式
+同一时间只进行一次分析，cProfile 同一时间只分析一个请求；空闲时请求路径上只有一次属性检查
+"""
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+
+
+class ProfilerBusy(Exception):
+    """已有分析正在进行"""
+
+
+def _short_path(filename):
+    """项目内文件用相对路径，第三方库从 site-packages 之后开始，其余只保留文件名"""
+    cwd = os.getcwd() + os.sep
+    if filename.startswith(cwd):
+        return filename[len(cwd):]
+    marker = "site-packages" + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    return os.path.basename(filename)
+
+
+class Profiler:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.enabled = True
+        self.max_seconds = 60
+        self.max_requests = 100
+        # ASGI 模式下由 create_asgi_app 置为 False
+        self.requests_supported = True
+        self.busy = False
+        # requests 模式等待请求时为 True，请求路径上只检查这一个属性
+        self.armed = False
+        self._session = 0
+        self._remaining = 0
+        self._profiled = 0
+        self._stats = None
+        self._done = threading.Event()
+        self._active = threading.Lock()
+
+    def load_from_config(self):
+        """从 config.yaml 加载性能分析配置"""
+        from app.config import config
+
+        cfg = config.profiling
+        self.enabled = cfg.get("enabled", True)
+        self.max_seconds = cfg.get("max_seconds", self.max_seconds)
+        self.max_requests = cfg.get("max_requests", self.max_requests)
+
+    def _claim(self):
+        with self.lock:
+            if self.busy:
+                raise ProfilerBusy("A profiling session is already running")
+            self.busy = True
+
+    # ---------- 采样 ----------
+
+    def sample(self, seconds, interval=0.01):
+        """采样 seconds 秒，返回 ({折叠栈: 次数}, 采样轮数)；在调用线程中执行，不分析调用线程本身"""
+        self._claim()
+        try:
+            return self._sample(seconds, interval)
+        finally:
+            self.busy = False
+
+    def _sample(self, seconds, interval):
+        counts = {}
+        labels = {}
+        me = threading.get_ident()
+        names = {}
+        names_at = 0.0
+        rounds = 0
+        deadline = time.monotonic() + seconds
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if now - names_at >= 1.0:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                names_at = now
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = (f"{code.co_name} ({_short_path(code.co_filename)}:"
+                                                f"{code.co_firstlineno})").replace(";", ",")
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                key = ";".join(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+            rounds += 1
+            time.sleep(interval)
+        return counts, rounds
+
+    # ---------- 请求分析 ----------
+
+    def profile_requests(self, count, timeout):
+        """等待接下来的 count 个请求分析完成（最多 timeout 秒），返回 (合并的 pstats.Stats 或 None, 已分析请求数)"""
+        self._claim()
+        try:
+            with self.lock:
+                self._session += 1
+                self._remaining = count
+                self._profiled = 0
+                self._stats = None
+                self._done.clear()
+                self.armed = True
+            self._done.wait(timeout)
+            with self.lock:
+                self.armed = False
+                # 超时后仍在进行的请求结束时会被丢弃
+                self._session += 1
+                return self._stats, self._profiled
+        finally:
+            self.busy = False
+
+    def begin_request(self):
+        """armed 时为当前请求启用 cProfile，返回 end_request 需要的句柄；另一个请求正在被分析时返回 None"""
+        if not self._active.acquire(blocking=False):
+            return None
+        with self.lock:
+            if not self.armed or self._remaining <= 0:
+                self._active.release()
+                return None
+            self._remaining -= 1
+            session = self._session
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 已有其他分析器（调试器等）在运行
+            with self.lock:
+                self._remaining += 1
+            self._active.release()
+            return None
+        return session, profile
+
+    def end_request(self, handle):
+        session, profile = handle
+        profile.disable()
+        self._active.release()
+        with self.lock:
+            if session != self._session:
+                return
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self._profiled += 1
+            if self._remaining <= 0:
+                self._done.set()
+
+
+def render_collapsed(counts):
+    """折叠栈文本：每行 "线程;外层函数;...;内层函数 次数\""""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+
+def render_stats(stats, sort="cumulative", limit=50):
+    """pstats 文本报告，按 sort 排序输出前 limit 行"""
+    buf = io.StringIO()
+    stats.stream = buf
+    stats.sort_stats(sort).print_stats(limit)
+    return buf.getvalue()
+
+
+def dump_stats(stats):
+    """与 pstats.Stats.dump_stats 相同的二进制格式"""
+    return marshal.dumps(stats.stats)
+
+
+def install_profiler(app):
+    """requests 模式的请求钩子：分析从 before_request 到 teardown_request（含序列化和压缩）"""
+    from flask import g
+
+    @app.before_request
+    def begin_profile():
+        if profiler.armed:
+            g.profile = profiler.begin_request()
+
+    @app.teardown_request
+    def end_profile(exc=None):
+        handle = g.pop("profile", None)
+        if handle is not None:
+            profiler.end_request(handle)
+
+
+profiler = Profiler()
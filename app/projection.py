@@ -0,0 +1,82 @@
+"""
+字段投影 - ?fields=id,title,image_urls.medium,user.id 只返回指定字段
+路径相对于结果中的每条记录（illust / illusts / user 下的对象），列表按元素逐个投影；
+顶层只保留 next_url 和 error，Pixiv 返回的错误结果原样返回
+"""
+from flask import request
+
+RECORD_KEYS = ("illust", "illusts", "user")
+KEEP_KEYS = ("next_url", "error")
+
+
+class Fields:
+    """解析后的字段集合：tree 为嵌套选择树（None 表示选中整个字段），key 为规范化后的字段串"""
+
+    __slots__ = ("tree", "key")
+
+    def __init__(self, paths):
+        tree = {}
+        for path in paths:
+            node = tree
+            parts = path.split(".")
+            for part in parts[:-1]:
+                child = node.get(part, {})
+                if child is None:
+                    # 已经选中了整个父字段
+                    break
+                node[part] = child
+                node = child
+            else:
+                node[parts[-1]] = None
+        self.tree = tree
+        self.key = ",".join(sorted(set(paths)))
+
+    def record(self, value):
+        """投影单条记录（如一个 illust）"""
+        return _select(value, self.tree)
+
+    def apply(self, result):
+        """投影一个接口结果"""
+        if not isinstance(result, dict) or "error" in result:
+            return result
+        if not any(k in result for k in RECORD_KEYS):
+            return result
+        projected = {}
+        for k, v in result.items():
+            if k in RECORD_KEYS:
+                projected[k] = _select(v, self.tree)
+            elif k in KEEP_KEYS:
+                projected[k] = v
+        return projected
+
+
+def _select(value, tree):
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [_select(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {k: _select(value[k], sub) for k, sub in tree.items() if k in value}
+
+
+def parse_fields(raw):
+    """解析 fields 参数，未指定或为空时返回 None（不投影）"""
+    if not raw:
+        return None
+    paths = []
+    for path in raw.split(","):
+        path = ".".join(part.strip() for part in path.split(".") if part.strip())
+        if path:
+            paths.append(path)
+    return Fields(paths) if paths else None
+
+
+def request_fields():
+    """当前请求的 ?fields= 参数"""
+    return parse_fields(request.args.get("fields"))
+
+
+def project(result, fields):
+    """fields 为 None 时原样返回"""
+    return fields.apply(result) if fields is not None else result
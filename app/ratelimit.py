@@ -0,0 +1,56 @@
+"""
+令牌桶限流器
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    令牌桶：以 rate 个/秒的速度补充令牌，最多累积 burst 个
+    令牌按需惰性补充，无需后台线程
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "lock")
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst else max(rate, 1))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def available(self):
+        """是否至少有一个令牌（不消耗）"""
+        with self.lock:
+            self._refill(time.monotonic())
+            return self.tokens >= 1
+
+    def try_acquire(self, n=1):
+        """尝试取出 n 个令牌，成功返回 True"""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= n:
+                self.tokens -= n
+                return True
+            return False
+
+    def consume(self, n=1):
+        """无条件取出 n 个令牌（可透支，透支部分需等待补充）"""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= n
+
+    def retry_after(self, n=1):
+        """距离有 n 个令牌还需等待的秒数"""
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= n or self.rate <= 0:
+                return 0.0
+            return (n - self.tokens) / self.rate
@@ -0,0 +1,176 @@
+"""
+后台 Token 刷新调度器 - 在 token 过期前刷新，请求路径不再包含刷新耗时
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.shared_state import shared_state
+
+
+class TokenRefresher:
+    """
+    为每个账号安排下一次刷新时间：
+    上次刷新时间 + interval - random(0, jitter)，避免所有账号同时刷新
+    刷新失败时在 retry_delay 秒后重试
+    到期的账号交给 workers 个线程并发刷新，一个慢账号不会推迟其他账号；
+    正在刷新（手动刷新或已派发）的账号不重复派发
+
+    多 worker 部署（启用 shared_state）时，账号到期后先采用其他 worker 已刷新的 token；
+    仍需刷新时获取该账号的刷新租约，拿不到租约说明其他 worker 正在刷新，lease_retry 秒后再采用其结果
+    """
+
+    def __init__(self):
+        self.interval = 3000
+        self.jitter = 300
+        self.retry_delay = 60
+        self.lease_retry = 15
+        self.workers = 4
+        self.pool = None
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._inflight = set()
+
+    def load_from_config(self):
+        """从 config.yaml 加载刷新配置"""
+        from app.config import config
+
+        cfg = config.token_refresh
+        self.interval = cfg.get("interval", self.interval)
+        self.jitter = cfg.get("jitter", self.jitter)
+        self.retry_delay = cfg.get("retry_delay", self.retry_delay)
+        self.workers = max(1, int(cfg.get("workers", self.workers)))
+
+    def start(self, pool, interval=None):
+        """启动调度线程（重复调用无副作用）"""
+        self.load_from_config()
+        if interval:
+            self.interval = interval
+        self.pool = pool
+        if self._thread and self._thread.is_alive():
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="token-refresh")
+        self._thread = threading.Thread(target=self._run, name="token-refresher", daemon=True)
+        self._thread.start()
+        print(f"[Refresher] Started, interval: {self.interval}s, jitter: {self.jitter}s, workers: {self.workers}")
+
+    @property
+    def role(self):
+        return "shared" if shared_state.enabled else "single"
+
+    def wakeup(self):
+        """有账号加入或需要立即重新调度时唤醒调度线程"""
+        self._wakeup.set()
+
+    def schedule(self, account, delay=None):
+        """安排账号的下一次刷新"""
+        if delay is None:
+            delay = self.interval - random.uniform(0, self.jitter)
+            base = account.last_refresh_time or time.time()
+        else:
+            base = time.time()
+        account.next_refresh_time = base + max(delay, 0)
+
+    def refreshed(self, account):
+        """
+        账号刷新成功后：保存 token 并重新安排
+        多 worker 时 token 只写入共享状态（发布给其他 worker，重启时优先使用），
+        不由各 worker 用各自可能过时的配置副本改写 config.yaml
+        """
+        from app.config import config
+
+        self.schedule(account)
+        if shared_state.enabled:
+            shared_state.store_tokens(account.name, account.api.access_token,
+                                      account.refresh_token, account.last_refresh_time)
+        else:
+            config.add_account(account.name, account.refresh_token, account.username)
+
+    def _run(self):
+        while True:
+            next_wake = self._tick()
+            self._wakeup.wait(max(next_wake - time.time(), 0.1))
+            self._wakeup.clear()
+
+    def _tick(self):
+        """派发到期的账号，返回下一次需要检查的时间"""
+        now = time.time()
+        next_wake = now + 60
+        for account in list(self.pool.accounts):
+            if not account.next_refresh_time:
+                self.schedule(account)
+            if account.next_refresh_time <= now:
+                with self._lock:
+                    busy = account.refreshing or account in self._inflight
+                if busy:
+                    # 派发的刷新完成时会唤醒调度线程；手动刷新完成后重新安排，稍后再检查
+                    next_wake = min(next_wake, now + 1)
+                    continue
+                self._dispatch(account)
+                continue
+            next_wake = min(next_wake, account.next_refresh_time)
+        return next_wake
+
+    def _dispatch(self, account):
+        with self._lock:
+            self._inflight.add(account)
+
+        def run():
+            try:
+                if shared_state.enabled:
+                    self._refresh_shared(account)
+                else:
+                    self._refresh(account)
+            except Exception as e:
+                print(f"[Refresher] Account [{account.name}] refresh error: {e}")
+                self.schedule(account, delay=self.retry_delay)
+            finally:
+                with self._lock:
+                    self._inflight.discard(account)
+                self.wakeup()
+
+        self._executor.submit(run)
+
+    def _adopt(self, account):
+        """采用其他 worker 刷新得到的更新 token，成功返回 True"""
+        row = shared_state.load_tokens(account.name)
+        if not row or row[2] <= account.last_refresh_time:
+            return False
+        account.apply_tokens(*row)
+        self.schedule(account)
+        print(f"[Refresher] Account [{account.name}] adopted token refreshed by another worker")
+        return True
+
+    def _refresh_shared(self, account):
+        if self._adopt(account):
+            return
+        if not shared_state.acquire_lease(account.name):
+            self.schedule(account, delay=self.lease_retry)
+            return
+        try:
+            # 拿到租约后再确认一次，前一个持有者可能刚完成刷新
+            if not self._adopt(account):
+                self._refresh(account)
+        finally:
+            shared_state.release_lease(account.name)
+
+    def _refresh(self, account):
+        print(f"[Refresher] Account [{account.name}] token expiring, refreshing...")
+        start = time.time()
+        try:
+            ok = account.refresh()
+        except Exception as e:
+            print(f"[Refresher] Account [{account.name}] refresh error: {e}")
+            ok = False
+
+        if ok:
+            self.refreshed(account)
+        else:
+            self.schedule(account, delay=self.retry_delay)
+        print(f"[Refresher] Account [{account.name}] refresh {'ok' if ok else 'failed'} "
+              f"in {time.time() - start:.2f}s, next at {time.strftime('%H:%M:%S', time.localtime(account.next_refresh_time))}")
+
+refresher = TokenRefresher()
@@ -1,5 +1,8 @@
 from flask import Blueprint
+from app.encoding import compress_response
 
 api_bp = Blueprint("api", __name__, url_prefix="/api")
+# /api/* 的 JSON 响应按 Accept-Encoding 压缩
+api_bp.after_request(compress_response)
 
-from app.routes import illust, user, pool_routes, key_routes
+from app.routes import illust, user, pool_routes, key_routes, cache_routes, profile_routes
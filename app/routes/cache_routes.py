@@ -0,0 +1,31 @@
+"""
+缓存管理路由 - 仅管理员可访问（使用 Token 认证）
+"""
+from flask import request, jsonify
+from app.routes import api_bp
+from app.auth import require_auth
+from app.cache import response_cache
+from app.image_cache import image_cache
+from app.singleflight import singleflight
+
+
+@api_bp.route("/cache/status", methods=["GET"])
+@require_auth
+def cache_status():
+    """查看响应缓存、图片缓存与请求合并统计"""
+    return jsonify({
+        "response": response_cache.stats(),
+        "images": image_cache.stats(),
+        "singleflight": singleflight.stats()
+    })
+
+
+@api_bp.route("/cache/clear", methods=["POST"])
+@require_auth
+def clear_cache():
+    """清空响应缓存，body 中 images=true 时同时清空图片磁盘缓存"""
+    data = request.get_json(silent=True) or {}
+    response_cache.clear()
+    if data.get("images") and image_cache.enabled:
+        image_cache.clear()
+    return jsonify({"success": True})
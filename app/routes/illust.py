@@ -1,59 +1,138 @@
-from flask import request, jsonify, send_file, g
+from flask import request, jsonify, send_file, make_response, Response, stream_with_context, g
 from app.routes import api_bp
-from app.auth import require_api_key
-from app.pool import pool
+from app.auth import require_api_key, check_key_limits
+from app.batch import batch_settings, batch_executor, parse_ids
+from app.cache import cached_json, response_cache
+from app.image_cache import image_cache
 from app.key_manager import key_manager
-import tempfile
+from app.endpoint_matcher import normalize_endpoint
+from app.pagination import wants_all, stream_pages
+from app.projection import request_fields, project
+from app.admission import admission
+from app.upstream import admit, select_account, call_api, call_upstream, UpstreamUnavailable, error_response
+from urllib.parse import urlparse, quote
+import mimetypes
 import os
+import time
 
-def get_api():
-    """根据 API Key 的池限制获取账号"""
-    strategy = request.args.get("lb")
-    
-    # 获取当前请求的 API Key 值
-    key_value = getattr(g, 'api_key_value', None)
-    
-    if key_value:
-        # 获取该 Key 的池限制配置
-        pool_mode, allowed_accounts = key_manager.get_allowed_accounts(key_value)
-        if pool_mode:
-            account = pool.get_account_for_key(pool_mode, allowed_accounts, strategy)
-        else:
-            # Key 不存在，使用默认行为
-            account = pool.get_account(strategy)
-    else:
-        # 没有 API Key 上下文，使用默认行为
-        account = pool.get_account(strategy)
-    
-    if not account:
-        return None, None
-    return account.api, account.name
+# 图片下载：i.pximg.net 要求 Referer，按块流式转发
+DOWNLOAD_REFERER = "https://app-api.pixiv.net/"
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_PASSTHROUGH_HEADERS = (
+    "Content-Type",
+    "Content-Length",
+    "Content-Range",
+    "Content-Encoding",
+    "Accept-Ranges",
+    "Last-Modified",
+    "ETag",
+    "Cache-Control",
+)
 
 @api_bp.route("/illust/<int:illust_id>", methods=["GET"])
 @require_api_key
 def get_illust(illust_id):
     """获取插画详情"""
-    api, name = get_api()
-    if not api:
-        return jsonify({"error": "No available account"}), 503
     try:
-        result = api.illust_detail(illust_id)
-        return jsonify(result)
+        return cached_json(
+            "illust_detail",
+            {"illust_id": illust_id},
+            lambda: call_api("illust_detail", illust_id),
+            fields=request_fields(),
+        )
+    except UpstreamUnavailable as e:
+        return error_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@api_bp.route("/illusts", methods=["GET", "POST"])
+@require_api_key
+def get_illusts():
+    """
+    批量获取插画详情：GET ?ids=1,2,3 或 POST {"ids": [1, 2, 3]}
+    缓存命中直接返回，未命中的并发请求上游；results 按 ID 首次出现的顺序排列，
+    每项为 {"id": ..., "illust": ...} 或 {"id": ..., "error": ...}
+    API Key 的限流与配额按未命中缓存的 ID 数计费，额度不足时返回 429
+    API Key 的端点规则按 /api/illust/<id> 检查（端点规则不区分具体 ID），不允许时返回 403
+    """
+    settings = batch_settings()
+    if request.method == "POST":
+        body = request.get_json(silent=True)
+        raw = body.get("ids") if isinstance(body, dict) else body
+    else:
+        raw = request.args.get("ids", "")
+    try:
+        ids = parse_ids(raw, settings["max_ids"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # 批量接口不能绕过单个插画接口的端点规则
+    api_key = key_manager.get_key(g.api_key_value)
+    if api_key is None or not api_key.can_access(normalize_endpoint(f"/api/illust/{ids[0]}")):
+        return jsonify({"error": "Access denied to this endpoint"}), 403
+
+    # 工作线程没有请求上下文，API Key 和负载均衡策略显式传入
+    key_value = g.api_key_value
+    strategy = request.args.get("lb")
+    results = {}
+    misses = {}
+    for illust_id in ids:
+        key, ttl, entry = response_cache.lookup("illust_detail", {"illust_id": illust_id}, key_value)
+        if entry is not None:
+            results[illust_id] = entry.value
+        else:
+            misses[illust_id] = (key, ttl)
+
+    # 每个未命中的 ID 是一次上游调用：鉴权时已计 1 次，其余计入 API Key 的限流与配额
+    limited = check_key_limits(key_value, len(misses) - 1)
+    if limited:
+        error, status, headers = limited
+        return jsonify({"error": error}), status, headers
+
+    fetched = batch_executor.map(
+        list(misses),
+        lambda illust_id: call_upstream(key_value, strategy, "illust_detail", illust_id),
+        settings["concurrency"],
+        settings["workers"],
+    )
+    for illust_id, (key, ttl) in misses.items():
+        value = fetched[illust_id]
+        if not isinstance(value, Exception):
+            response_cache.store(key, value, ttl)
+        results[illust_id] = value
+
+    # 全部来自上游且都因没有可用账号 / 限流失败时，整体返回对应的错误状态
+    if misses and len(misses) == len(ids) and all(
+            isinstance(value, UpstreamUnavailable) for value in fetched.values()):
+        return error_response(fetched[ids[0]])
+
+    fields = request_fields()
+    items = []
+    for illust_id in ids:
+        value = results[illust_id]
+        if isinstance(value, Exception):
+            items.append({"id": illust_id, "error": str(value)})
+        else:
+            items.append({"id": illust_id, **project(value, fields)})
+    return jsonify({"results": items, "cached": len(ids) - len(misses)})
+
 @api_bp.route("/search", methods=["GET"])
 @require_api_key
 def search_illust():
-    """搜索插画"""
-    api, name = get_api()
-    if not api:
-        return jsonify({"error": "No available account"}), 503
+    """搜索插画（?all=true&limit=N 时遍历所有页，以 NDJSON 流式输出）"""
     word = request.args.get("word", "")
     offset = request.args.get("offset", 0, type=int)
     try:
-        result = api.search_illust(word, offset=offset)
-        return jsonify(result)
+        if wants_all(request.args.get("all")):
+            return stream_pages("search_illust", word, offset=offset)
+        return cached_json(
+            "search",
+            {"word": word, "offset": offset},
+            lambda: call_api("search_illust", word, offset=offset),
+            fields=request_fields(),
+        )
+    except UpstreamUnavailable as e:
+        return error_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -61,64 +140,149 @@ def search_illust():
 @api_bp.route("/ranking", methods=["GET"])
 @require_api_key
 def get_ranking():
-    """获取排行榜"""
-    api, name = get_api()
-    if not api:
-        return jsonify({"error": "No available account"}), 503
+    """获取排行榜（?all=true&limit=N 时遍历所有页，以 NDJSON 流式输出）"""
     mode = request.args.get("mode", "day")
     offset = request.args.get("offset", 0, type=int)
     try:
-        result = api.illust_ranking(mode=mode, offset=offset)
-        return jsonify(result)
+        if wants_all(request.args.get("all")):
+            return stream_pages("illust_ranking", mode=mode, offset=offset)
+        return cached_json(
+            "ranking",
+            {"mode": mode, "offset": offset},
+            lambda: call_api("illust_ranking", mode=mode, offset=offset),
+            fields=request_fields(),
+        )
+    except UpstreamUnavailable as e:
+        return error_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @api_bp.route("/recommended", methods=["GET"])
 @require_api_key
 def get_recommended():
-    """获取推荐插画"""
-    api, name = get_api()
-    if not api:
-        return jsonify({"error": "No available account"}), 503
+    """获取推荐插画（?all=true&limit=N 时遍历所有页，以 NDJSON 流式输出）"""
     offset = request.args.get("offset", 0, type=int)
     try:
-        result = api.illust_recommended(offset=offset)
-        return jsonify(result)
+        if wants_all(request.args.get("all")):
+            return stream_pages("illust_recommended", offset=offset)
+        result = call_api("illust_recommended", offset=offset)
+        return jsonify(project(result, request_fields()))
+    except UpstreamUnavailable as e:
+        return error_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @api_bp.route("/download", methods=["GET"])
 @require_api_key
 def download_image():
-    """下载图片"""
-    api, _ = get_api()
-    if not api:
-        return jsonify({"error": "No available account"}), 503
+    """
+    下载图片（流式转发上游响应，内存占用与图片大小无关）
+    启用磁盘缓存时，命中直接按文件路径发送，未命中则边转发边写入缓存
+    """
     url = request.args.get("url", "")
     if not url:
         return jsonify({"error": "url required"}), 400
+    filename = os.path.basename(urlparse(url).path)
+
+    if image_cache.enabled:
+        cached = image_cache.lookup(url)
+        if cached:
+            path, content_type = cached
+            try:
+                # send_file 打开文件后即使被其他 worker 淘汰删除也能发送完整内容
+                response = send_file(
+                    path,
+                    mimetype=content_type,
+                    as_attachment=False,
+                    download_name=filename,
+                    conditional=True,
+                )
+            except FileNotFoundError:
+                # 查找到发送之间文件被淘汰，按未命中处理
+                response = None
+            if response is not None:
+                response.headers["X-Cache"] = "HIT"
+                return response
+
+    # 与 API 调用一样经过准入控制，名额在响应发送完毕（或客户端断开）时归还
     try:
-        # 创建临时目录，不使用 with 语句以避免文件锁定问题
-        tmpdir = tempfile.mkdtemp()
-        api.download(url, path=tmpdir)
-        filename = os.path.basename(url)
-        filepath = os.path.join(tmpdir, filename)
-        
-        # 读取文件内容到内存，然后删除临时文件
-        with open(filepath, 'rb') as f:
-            file_data = f.read()
-        
-        # 清理临时文件
-        import shutil
-        shutil.rmtree(tmpdir, ignore_errors=True)
-        
-        # 从内存返回文件
-        from io import BytesIO
-        return send_file(
-            BytesIO(file_data),
-            mimetype="image/jpeg",
-            as_attachment=False,
-            download_name=filename
-        )
+        ticket = admit(g.api_key_value)
+    except UpstreamUnavailable as e:
+        return error_response(e)
+    try:
+        response = make_response(_stream_upstream(url, filename))
+    except BaseException:
+        admission.release(ticket)
+        raise
+    response.call_on_close(lambda: admission.release(ticket))
+    return response
+
+
+def _stream_upstream(url, filename):
+    """选择账号并流式转发上游图片，未命中缓存时边转发边写入"""
+    account = select_account()
+    if not account:
+        return jsonify({"error": "No available account"}), 503
+    headers = {"Referer": DOWNLOAD_REFERER}
+    for name in ("Range", "If-Range", "If-None-Match", "If-Modified-Since"):
+        if name in request.headers:
+            headers[name] = request.headers[name]
+    # 与 API 调用一样计入进行中请求数、延迟和熔断器（选中时占用的半开探测名额在 end_request 中归还）
+    account.begin_request()
+    start = time.perf_counter()
+    upstream = None
+    try:
+        upstream = account.api.requests_call("GET", url, headers=headers, stream=True)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    finally:
+        account.end_request(time.perf_counter() - start, upstream is not None and upstream.status_code < 500)
+
+    if upstream.status_code >= 400:
+        upstream.close()
+        return jsonify({"error": f"upstream returned HTTP {upstream.status_code}"}), upstream.status_code
+
+    response_headers = {
+        name: upstream.headers[name]
+        for name in DOWNLOAD_PASSTHROUGH_HEADERS
+        if name in upstream.headers
+    }
+    if "Content-Type" not in response_headers:
+        response_headers["Content-Type"] = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    response_headers["Content-Disposition"] = f"inline; filename={quote(filename)}"
+
+    # 仅缓存完整的未编码响应
+    cache_path = None
+    if (image_cache.enabled and upstream.status_code == 200
+            and "Content-Encoding" not in upstream.headers):
+        cache_path = image_cache.new_temp_path()
+        response_headers["X-Cache"] = "MISS"
+
+    def generate():
+        cache_file = open(cache_path, "wb") if cache_path else None
+        complete = False
+        try:
+            # 不解码 Content-Encoding，按原样转发以保证 Content-Length 一致
+            for chunk in upstream.raw.stream(DOWNLOAD_CHUNK_SIZE, decode_content=False):
+                if cache_file:
+                    cache_file.write(chunk)
+                yield chunk
+            complete = True
+        finally:
+            upstream.close()
+            if cache_file:
+                cache_file.close()
+                expected = upstream.headers.get("Content-Length")
+                if complete and (expected is None or int(expected) == os.path.getsize(cache_path)):
+                    image_cache.commit(url, cache_path, response_headers["Content-Type"])
+                else:
+                    image_cache.discard(cache_path)
+
+    response = Response(
+        stream_with_context(generate()),
+        status=upstream.status_code,
+        headers=response_headers,
+    )
+    # 客户端在开始接收前断开时生成器不会执行，上游连接由关闭回调释放
+    response.call_on_close(upstream.close)
+    return response
@@ -5,6 +5,7 @@ from flask import request, jsonify
 from app.routes import api_bp
 from app.auth import require_auth
 from app.key_manager import key_manager
+from app.key_limits import key_limiter
 from app.pool import pool
 
 
@@ -24,10 +25,17 @@ def list_keys():
                 "denied_endpoints": k.denied_endpoints,
                 "created_at": k.created_at,
                 "enabled": k.enabled,
-                "pool_restriction": k.pool_restriction.to_dict()
+                "pool_restriction": k.pool_restriction.to_dict(),
+                "rate_limit": k.rate_limit,
+                "burst": k.burst,
+                "daily_quota": k.daily_quota,
+                "weight": k.weight,
+                "priority": k.priority,
+                "usage_today": key_limiter.usage_today(k.name),
             }
             for k in keys
-        ]
+        ],
+        "reload": key_manager.reload_stats(),
     })
 
 
@@ -58,7 +66,12 @@ def create_key():
         allowed_endpoints=allowed_endpoints,
         denied_endpoints=denied_endpoints,
         pool_mode=pool_mode,
-        allowed_accounts=allowed_accounts
+        allowed_accounts=allowed_accounts,
+        rate_limit=data.get("rate_limit", 0),
+        burst=data.get("burst", 0),
+        daily_quota=data.get("daily_quota", 0),
+        weight=data.get("weight", 1.0),
+        priority=data.get("priority", 0),
     )
     
     if not api_key:
@@ -71,7 +84,12 @@ def create_key():
             "key": api_key.key,
             "access_mode": api_key.access_mode,
             "created_at": api_key.created_at,
-            "pool_restriction": api_key.pool_restriction.to_dict()
+            "pool_restriction": api_key.pool_restriction.to_dict(),
+            "rate_limit": api_key.rate_limit,
+            "burst": api_key.burst,
+            "daily_quota": api_key.daily_quota,
+            "weight": api_key.weight,
+            "priority": api_key.priority,
         }
     })
 
@@ -93,7 +111,12 @@ def update_key(name):
         denied_endpoints=data.get("denied_endpoints"),
         enabled=data.get("enabled"),
         pool_mode=data.get("pool_mode"),
-        allowed_accounts=data.get("allowed_accounts")
+        allowed_accounts=data.get("allowed_accounts"),
+        rate_limit=data.get("rate_limit"),
+        burst=data.get("burst"),
+        daily_quota=data.get("daily_quota"),
+        weight=data.get("weight"),
+        priority=data.get("priority"),
     )
     
     if not success:
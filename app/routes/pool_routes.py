@@ -3,6 +3,19 @@ from app.routes import api_bp
 from app.auth import require_auth
 from app.pool import pool
 from app.config import config
+from app.admission import admission
+from app.shared_state import shared_state
+
+
+def membership_locked():
+    """
+    多 worker 部署时账号列表由每个 worker 在启动时从 config.yaml 加载，
+    管理接口只能修改处理该请求的 worker，因此拒绝动态增删账号（修改 config.yaml 后重启生效）
+    """
+    if shared_state.enabled:
+        return jsonify({"error": "Adding or removing accounts at runtime is not supported with "
+                                 "multiple workers; edit config.yaml and restart"}), 409
+    return None
 
 @api_bp.route("/pool/status", methods=["GET"])
 @require_auth
@@ -10,13 +23,17 @@ def pool_status():
     """查看账号池状态"""
     return jsonify({
         "strategy": config.lb_strategy,
-        "accounts": pool.status()
+        "accounts": pool.status(),
+        "admission": admission.stats()
     })
 
 @api_bp.route("/pool/add", methods=["POST"])
 @require_auth
 def add_account():
     """动态添加账号"""
+    locked = membership_locked()
+    if locked:
+        return locked
     data = request.get_json() or {}
     token = data.get("refresh_token")
     name = data.get("name")
@@ -30,6 +47,9 @@ def add_account():
 @require_auth
 def remove_account():
     """移除账号"""
+    locked = membership_locked()
+    if locked:
+        return locked
     data = request.get_json() or {}
     name = data.get("name")
     if not name:
@@ -45,6 +65,18 @@ def reload_config():
         config.reload()
         # 更新代理设置
         pool.update_proxy()
+        # API Keys 在下次访问检查时重新加载
+        from app.key_manager import key_manager
+        key_manager.invalidate()
+        from app.cache import response_cache
+        response_cache.load_from_config()
+        from app.encoding import compressor
+        compressor.load_from_config()
+        admission.load_from_config()
+        from app.timing import timing
+        timing.load_from_config()
+        from app.profiler import profiler
+        profiler.load_from_config()
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -117,6 +149,9 @@ def gppt_login():
     from app.gppt_auth import gppt_auth, GPPT_AVAILABLE
     if not GPPT_AVAILABLE:
         return jsonify({"error": "gppt not installed, run: pip install gppt"}), 400
+    locked = membership_locked()
+    if locked:
+        return locked
     
     data = request.get_json() or {}
     name = data.get("name", "").strip()
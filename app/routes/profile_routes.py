@@ -0,0 +1,62 @@
+"""
+性能分析路由 - 仅管理员可访问（使用 Token 认证）
+多 worker 部署时只分析处理该请求的 worker 进程，进程号见 X-Worker-Pid 响应头
+"""
+import os
+from flask import request, jsonify, Response
+from app.routes import api_bp
+from app.auth import require_auth
+from app.profiler import profiler, ProfilerBusy, render_collapsed, render_stats, dump_stats
+
+SORT_KEYS = ("cumulative", "tottime", "ncalls", "filename")
+
+
+@api_bp.route("/admin/profile", methods=["POST"])
+@require_auth
+def profile():
+    """
+    按需性能分析，请求在分析结束后返回
+    mode=sample：采样 seconds 秒（间隔 interval_ms），返回折叠栈文本
+    mode=requests：分析接下来的 count 个请求（最多等待 timeout 秒），
+      format=text 返回按 sort 排序的 pstats 报告，format=pstats 返回 pstats.Stats 可加载的二进制转储
+      （ASGI 模式下不可用，返回 400）
+    """
+    if not profiler.enabled:
+        return jsonify({"error": "Profiling is disabled"}), 404
+
+    mode = request.args.get("mode", "sample")
+    try:
+        if mode == "sample":
+            seconds = request.args.get("seconds", 10, type=float)
+            interval = request.args.get("interval_ms", 10, type=float) / 1000.0
+            if not 0 < seconds <= profiler.max_seconds:
+                return jsonify({"error": f"seconds must be in (0, {profiler.max_seconds}]"}), 400
+            counts, rounds = profiler.sample(seconds, max(interval, 0.001))
+            return Response(render_collapsed(counts), mimetype="text/plain",
+                            headers={"X-Profile-Samples": str(rounds), "X-Worker-Pid": str(os.getpid())})
+
+        if mode == "requests":
+            if not profiler.requests_supported:
+                return jsonify({"error": "mode=requests is not supported in ASGI mode, use mode=sample"}), 400
+            count = request.args.get("count", 10, type=int)
+            timeout = request.args.get("timeout", 60, type=float)
+            fmt = request.args.get("format", "text")
+            sort = request.args.get("sort", "cumulative")
+            if not 0 < count <= profiler.max_requests:
+                return jsonify({"error": f"count must be in (0, {profiler.max_requests}]"}), 400
+            if not 0 < timeout <= profiler.max_seconds:
+                return jsonify({"error": f"timeout must be in (0, {profiler.max_seconds}]"}), 400
+            if fmt not in ("text", "pstats") or sort not in SORT_KEYS:
+                return jsonify({"error": f"format must be text or pstats, sort one of {', '.join(SORT_KEYS)}"}), 400
+            stats, profiled = profiler.profile_requests(count, timeout)
+            if stats is None:
+                return jsonify({"error": "No requests were profiled before timeout"}), 503
+            headers = {"X-Profiled-Requests": str(profiled), "X-Worker-Pid": str(os.getpid())}
+            if fmt == "pstats":
+                headers["Content-Disposition"] = f"attachment; filename=profile-{os.getpid()}.pstats"
+                return Response(dump_stats(stats), mimetype="application/octet-stream", headers=headers)
+            return Response(render_stats(stats, sort), mimetype="text/plain", headers=headers)
+    except ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+
+    return jsonify({"error": "mode must be sample or requests"}), 400
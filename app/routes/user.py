@@ -1,38 +1,38 @@
 from flask import request, jsonify
 from app.routes import api_bp
 from app.auth import require_api_key
-from app.pool import pool
-
-def get_api():
-    strategy = request.args.get("lb")
-    account = pool.get_account(strategy)
-    if not account:
-        return None, None
-    return account.api, account.name
+from app.cache import cached_json
+from app.pagination import wants_all, stream_pages
+from app.projection import request_fields, project
+from app.upstream import call_api, UpstreamUnavailable, error_response
 
 @api_bp.route("/user/<int:user_id>", methods=["GET"])
 @require_api_key
 def get_user_detail(user_id):
     """获取用户详情"""
-    api, name = get_api()
-    if not api:
-        return jsonify({"error": "No available account"}), 503
     try:
-        result = api.user_detail(user_id)
-        return jsonify(result)
+        return cached_json(
+            "user_detail",
+            {"user_id": user_id},
+            lambda: call_api("user_detail", user_id),
+            fields=request_fields(),
+        )
+    except UpstreamUnavailable as e:
+        return error_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @api_bp.route("/user/<int:user_id>/illusts", methods=["GET"])
 @require_api_key
 def get_user_illusts(user_id):
-    """获取用户作品"""
-    api, name = get_api()
-    if not api:
-        return jsonify({"error": "No available account"}), 503
+    """获取用户作品（?all=true&limit=N 时遍历所有页，以 NDJSON 流式输出）"""
     offset = request.args.get("offset", 0, type=int)
     try:
-        result = api.user_illusts(user_id, offset=offset)
-        return jsonify(result)
+        if wants_all(request.args.get("all")):
+            return stream_pages("user_illusts", user_id, offset=offset)
+        result = call_api("user_illusts", user_id, offset=offset)
+        return jsonify(project(result, request_fields()))
+    except UpstreamUnavailable as e:
+        return error_response(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,155 @@
+"""
+账号选择器 - 为每种池限制维护预建的账号视图，选择开销不随账号数线性增长
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+
+
+class AccountView:
+    """
+    一组账号（对应一种池限制）的选择视图
+    - least_used: 以 (request_count, 序号) 为键的最小堆，O(log n)；
+      账号可能被其他视图选中导致计数变化，出堆时发现计数过期则以新计数重新入堆（惰性更新）；
+      不可用的账号（冷却、熔断、令牌桶为空）移到按重新检查时间排序的暂停堆，PARK_SECONDS 后再放回，
+      不会一直停在堆顶让每次选择都弹出一遍
+    - round_robin: 无锁计数器取模
+    - least_cost: 随机两选一（power of two choices），按 EWMA 延迟与进行中请求数选择，无锁
+    每个视图有独立的锁，不同池限制的请求互不竞争
+    """
+
+    PARK_SECONDS = 0.1
+
+    def __init__(self, accounts):
+        self.accounts = tuple(accounts)
+        self.lock = threading.Lock()
+        self._heap = [(a.request_count, i, a) for i, a in enumerate(self.accounts)]
+        heapq.heapify(self._heap)
+        # (重新检查时间, 序号, 账号)
+        self._parked = []
+        self._rr = itertools.count()
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def least_used(self):
+        """选择请求数最少的可用账号"""
+        heap = self._heap
+        parked = self._parked
+        with self.lock:
+            now = time.monotonic()
+            while parked and parked[0][0] <= now:
+                _, seq, account = heapq.heappop(parked)
+                heapq.heappush(heap, (account.request_count, seq, account))
+
+            chosen = None
+            while heap:
+                count, seq, account = heapq.heappop(heap)
+                if count != account.request_count:
+                    heapq.heappush(heap, (account.request_count, seq, account))
+                    continue
+                if account.is_available():
+                    chosen = (seq, account)
+                    break
+                heapq.heappush(parked, (now + self.PARK_SECONDS, seq, account))
+
+            if chosen is None:
+                # 没有立即可用的账号时退回到正在刷新 token（旧 token 仍有效）的账号，只在这种情况下扫描暂停堆
+                fallback = [(account.request_count, i) for i, (_, _, account) in enumerate(parked)
+                            if account.can_serve()]
+                if fallback:
+                    _, i = min(fallback)
+                    _, seq, account = parked.pop(i)
+                    heapq.heapify(parked)
+                    chosen = (seq, account)
+
+            if chosen is not None:
+                seq, account = chosen
+                account.record_request()
+                heapq.heappush(heap, (account.request_count, seq, account))
+        return chosen[1] if chosen else None
+
+    def least_cost(self):
+        """
+        Power-of-two-choices：随机取两个可用账号，选择预期开销（EWMA 延迟 x 进行中请求数）较小者
+        慢或被限流的账号开销升高，自然分到更少的请求
+        """
+        accounts = self.accounts
+        n = len(accounts)
+        if n <= 2:
+            candidates = [a for a in accounts if a.is_available()]
+        else:
+            candidates = []
+            for _ in range(4):
+                i = random.randrange(n)
+                j = random.randrange(n - 1)
+                if j >= i:
+                    j += 1
+                candidates = [a for a in (accounts[i], accounts[j]) if a.is_available()]
+                if len(candidates) == 2:
+                    break
+        if not candidates:
+            return self.round_robin()
+        account = min(candidates, key=lambda a: a.expected_cost())
+        account.record_request()
+        return account
+
+    def round_robin(self):
+        """轮询选择可用账号"""
+        accounts = self.accounts
+        n = len(accounts)
+        if not n:
+            return None
+        start = next(self._rr)
+        fallback = None
+        for i in range(n):
+            account = accounts[(start + i) % n]
+            if account.is_available():
+                account.record_request()
+                return account
+            if fallback is None and account.can_serve():
+                fallback = account
+        if fallback is not None:
+            fallback.record_request()
+        return fallback
+
+
+class AccountSelector:
+    """按池限制缓存账号视图，账号列表变化时重建"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._views = {}
+        self._source = None
+
+    def invalidate(self):
+        """账号增删后调用，所有视图在下次使用时重建"""
+        with self.lock:
+            self._views = {}
+            self._source = None
+
+    def view(self, accounts, allowed_accounts=None):
+        """
+        获取视图
+        allowed_accounts 为 None 时返回全部账号的视图，否则只包含允许的账号
+        """
+        key = None if allowed_accounts is None else frozenset(allowed_accounts)
+        source = (id(accounts), len(accounts))
+        views = self._views
+        if self._source == source:
+            view = views.get(key)
+            if view is not None:
+                return view
+
+        with self.lock:
+            if self._source != source:
+                self._views = {}
+                self._source = source
+            view = self._views.get(key)
+            if view is None:
+                members = accounts if key is None else [a for a in accounts if a.name in key]
+                view = AccountView(members)
+                self._views[key] = view
+        return view
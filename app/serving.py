@@ -0,0 +1,295 @@
+"""
+生产模式服务 - 替代 Flask 开发服务器
+- 引擎：waitress（已安装时）或内置的线程池 WSGI 服务器；mode: asgi 时使用 uvicorn
+- workers > 1 时（仅 POSIX）预派生多个 worker 进程共享同一监听 socket，
+  主进程负责监控、重启意外退出的 worker 和优雅关闭
+- 多 worker 之间通过 app.shared_state 共享请求计数、token 与刷新租约
+"""
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+try:
+    from waitress.server import create_server as create_waitress_server
+    WAITRESS_AVAILABLE = True
+except ImportError:
+    WAITRESS_AVAILABLE = False
+
+try:
+    import uvicorn
+    UVICORN_AVAILABLE = True
+except ImportError:
+    UVICORN_AVAILABLE = False
+
+
+def serving_settings():
+    """从 config.yaml 的 server 段读取服务配置"""
+    from app.config import config
+
+    cfg = config.server
+    return {
+        "mode": cfg.get("mode", "production"),
+        "engine": cfg.get("engine", "auto"),
+        "workers": max(1, int(cfg.get("workers", 1))),
+        "threads": max(1, int(cfg.get("threads", 16))),
+        "backlog": int(cfg.get("backlog", 128)),
+        "keep_alive_timeout": cfg.get("keep_alive_timeout", 5),
+        "graceful_timeout": cfg.get("graceful_timeout", 30),
+        "state_dir": cfg.get("state_dir", "./run"),
+    }
+
+
+def create_listener(host, port, backlog):
+    """创建监听 socket；"::" 在支持的系统上同时接受 IPv4 和 IPv6"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.create_server((host, port), family=family, backlog=backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    固定大小线程池处理连接的 WSGI 服务器
+    与 werkzeug 的 ThreadedWSGIServer（每个连接一个新线程）不同，并发线程数有上限；
+    HTTP/1.1 keep-alive 连接空闲超过 keep_alive_timeout 秒后关闭，释放线程
+    """
+
+    multithread = True
+
+    def __init__(self, app, sock, threads, keep_alive_timeout):
+        handler = type("PooledRequestHandler", (WSGIRequestHandler,), {
+            "protocol_version": "HTTP/1.1",
+            "timeout": keep_alive_timeout,
+        })
+        host, port = sock.getsockname()[:2]
+        super().__init__(host, port, app, handler=handler, fd=sock.fileno())
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http")
+        self._futures = set()
+        self._futures_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        future = self.executor.submit(self._process_request, request, client_address)
+        with self._futures_lock:
+            self._futures.add(future)
+        future.add_done_callback(self._forget)
+
+    def _forget(self, future):
+        with self._futures_lock:
+            self._futures.discard(future)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def serve(self):
+        self.serve_forever()
+
+    def stop(self):
+        """停止接受新连接（可在信号处理函数中调用）"""
+        # shutdown() 会等待 serve_forever 退出，不能在运行它的线程中同步调用
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def drain(self, timeout):
+        """等待进行中的请求完成，返回未完成的数量"""
+        with self._futures_lock:
+            pending = list(self._futures)
+        _, not_done = wait(pending, timeout=timeout)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        return len(not_done)
+
+
+class WaitressServer:
+    """waitress 服务器的包装，提供与 PooledWSGIServer 相同的 serve/stop/drain 接口"""
+
+    def __init__(self, app, sock, threads, keep_alive_timeout, graceful_timeout):
+        self.server = create_waitress_server(
+            app,
+            sockets=[sock],
+            threads=threads,
+            channel_timeout=keep_alive_timeout,
+            ident="pixivpy3-server",
+        )
+        # waitress 关闭时等待工作线程的时间固定为 5 秒，改为 graceful_timeout
+        dispatcher = self.server.task_dispatcher
+        shutdown = dispatcher.shutdown
+        dispatcher.shutdown = lambda cancel_pending=True, timeout=5: shutdown(cancel_pending, graceful_timeout)
+
+    def serve(self):
+        self.server.run()
+
+    def stop(self):
+        # waitress 在 SystemExit 时关闭监听并等待工作线程完成
+        raise SystemExit
+
+    def drain(self, timeout):
+        return 0
+
+
+class UvicornServer:
+    """uvicorn 服务器的包装（ASGI 模式），优雅关闭由 uvicorn 自己处理"""
+
+    def __init__(self, app, sock, settings):
+        self.sock = sock
+        self.server = uvicorn.Server(uvicorn.Config(
+            app,
+            lifespan="on",
+            backlog=settings["backlog"],
+            timeout_keep_alive=settings["keep_alive_timeout"],
+            timeout_graceful_shutdown=settings["graceful_timeout"],
+            log_level="warning",
+        ))
+
+    def serve(self):
+        self.server.run(sockets=[self.sock])
+
+    def stop(self):
+        self.server.should_exit = True
+
+    def drain(self, timeout):
+        return 0
+
+
+def create_server(app, sock, settings):
+    if settings["mode"] == "asgi":
+        return UvicornServer(app, sock, settings)
+    engine = settings["engine"]
+    if engine == "waitress" and not WAITRESS_AVAILABLE:
+        print("[Serving] waitress not installed, run: pip install waitress; using builtin server")
+    if engine in ("auto", "waitress") and WAITRESS_AVAILABLE:
+        return WaitressServer(app, sock, settings["threads"], settings["keep_alive_timeout"],
+                              settings["graceful_timeout"])
+    return PooledWSGIServer(app, sock, settings["threads"], settings["keep_alive_timeout"])
+
+
+def run_worker(app, sock, settings):
+    """在当前进程中提供服务，收到 SIGTERM/SIGINT 后优雅退出"""
+    server = create_server(app, sock, settings)
+
+    def handle_signal(signum, frame):
+        print(f"[Serving] Worker {os.getpid()} received {signal.Signals(signum).name}, shutting down")
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        server.stop()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    print(f"[Serving] Worker {os.getpid()} serving with {type(server).__name__}, "
+          f"threads: {settings['threads']}")
+    server.serve()
+    pending = server.drain(settings["graceful_timeout"])
+    if pending:
+        print(f"[Serving] Worker {os.getpid()} exiting with {pending} unfinished requests")
+
+
+def serve(app, host, port, on_worker_start, settings=None):
+    """
+    生产模式入口
+    on_worker_start(shared): 每个 worker 开始服务前调用，用于启动后台任务；
+    shared 为 True 表示多 worker 部署，需要跨进程协调
+    """
+    settings = settings or serving_settings()
+    workers = settings["workers"]
+    if workers > 1 and not hasattr(os, "fork"):
+        print("[Serving] Multiple workers require fork(), falling back to a single worker")
+        workers = 1
+
+    sock = create_listener(host, port, settings["backlog"])
+    print(f"[Serving] Listening on {host}:{port}, workers: {workers}, threads: {settings['threads']}, "
+          f"backlog: {settings['backlog']}, keep-alive: {settings['keep_alive_timeout']}s")
+
+    if workers == 1:
+        on_worker_start(False)
+        run_worker(app, sock, settings)
+        sock.close()
+        return
+
+    Supervisor(app, sock, settings, workers, on_worker_start).run()
+
+
+class Supervisor:
+    """预派生 worker 的主进程：启动、监控并在退出时优雅关闭所有 worker"""
+
+    def __init__(self, app, sock, settings, workers, on_worker_start):
+        self.app = app
+        self.sock = sock
+        self.settings = settings
+        self.workers = workers
+        self.on_worker_start = on_worker_start
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                self.on_worker_start(True)
+                run_worker(self.app, self.sock, self.settings)
+            except BaseException as e:
+                print(f"[Serving] Worker {os.getpid()} crashed: {e!r}")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        self.children[pid] = time.time()
+        return pid
+
+    def handle_signal(self, signum, frame):
+        if self.stopping:
+            return
+        self.stopping = True
+        print(f"[Serving] Received {signal.Signals(signum).name}, stopping {len(self.children)} workers")
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        signal.signal(signal.SIGINT, self.handle_signal)
+        for _ in range(self.workers):
+            self.spawn()
+
+        deadline = None
+        while self.children:
+            if self.stopping and deadline is None:
+                deadline = time.time() + self.settings["graceful_timeout"] + 5
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                if deadline and time.time() > deadline:
+                    for child in list(self.children):
+                        print(f"[Serving] Worker {child} did not exit in time, killing")
+                        try:
+                            os.kill(child, signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass
+                    deadline = time.time() + 5
+                time.sleep(0.2)
+                continue
+
+            started = self.children.pop(pid, None)
+            if self.stopping or started is None:
+                continue
+            print(f"[Serving] Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+            # 启动即崩溃时避免高频重启
+            if time.time() - started < 1:
+                time.sleep(1)
+            self.spawn()
+
+        self.sock.close()
+        print("[Serving] All workers stopped")
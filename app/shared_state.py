@@ -0,0 +1,186 @@
+"""
+跨进程共享状态 - 多 worker 部署时共享账号请求计数、token 与刷新租约
+存储为 state_dir 下的 SQLite 数据库（WAL 模式），同一主机上的 worker 进程作为一个账号池工作
+"""
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    name TEXT PRIMARY KEY,
+    request_count INTEGER NOT NULL DEFAULT 0,
+    access_token TEXT,
+    refresh_token TEXT,
+    refreshed_at REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0
+)
+"""
+
+
+def _connect(path):
+    # 数据库保存 access / refresh token：目录创建为 0700，数据库文件为 0600
+    # （SQLite 创建 -wal / -shm 文件时沿用数据库文件的权限）
+    os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+    os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+    os.chmod(path, 0o600)
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(SCHEMA)
+    return conn
+
+
+class SharedState:
+    """
+    - 请求计数：各进程在本地累加，每 sync_interval 秒把增量写入数据库并读回全局总数，
+      least_used 等策略基于全局计数选择，请求路径不访问数据库
+    - token：刷新成功的 worker 写入，其他 worker 在到期前采用更新的 token，不再各自刷新
+    - 刷新租约：每个账号一行，同一时间只有一个 worker 能刷新该账号；持有者崩溃时租约在 lease_ttl 秒后过期
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.owner = str(os.getpid())
+        self.sync_interval = 1.0
+        self.lease_ttl = 120
+        self._local = threading.local()
+        self._thread = None
+
+    def open(self, path):
+        """在 worker 进程中打开共享状态（必须在 fork 之后调用，SQLite 连接不能跨进程使用）"""
+        from app.config import config
+
+        cfg = config.shared_state
+        self.sync_interval = cfg.get("sync_interval", self.sync_interval)
+        self.lease_ttl = cfg.get("lease_ttl", self.lease_ttl)
+        self.path = path
+        self.owner = str(os.getpid())
+        self._local = threading.local()
+        self._conn()
+        self.enabled = True
+        print(f"[Shared] Worker {self.owner} using shared state {path}")
+
+    @staticmethod
+    def reset(path):
+        """新一轮部署开始时由主进程调用：清空请求计数和遗留的租约，保留 token"""
+        conn = _connect(path)
+        try:
+            conn.execute("UPDATE accounts SET request_count = 0, lease_owner = NULL, lease_until = 0")
+        finally:
+            conn.close()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = _connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    # ---------- 请求计数 ----------
+
+    def add_counts(self, deltas):
+        """累加各账号的请求数，返回全部账号的全局请求数"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO accounts (name, request_count) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET request_count = request_count + excluded.request_count",
+                [(name, delta) for name, delta in deltas.items()],
+            )
+            totals = dict(conn.execute("SELECT name, request_count FROM accounts"))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return totals
+
+    def sync_counts(self, accounts):
+        """把本地新增的请求数写入数据库，并将账号计数更新为全局总数加上同步期间的本地新增"""
+        deltas = {}
+        for account in accounts:
+            with account.lock:
+                deltas[account.name] = account.request_count - account.synced_count
+                account.synced_count = account.request_count
+        totals = self.add_counts(deltas)
+        for account in accounts:
+            total = totals.get(account.name)
+            if total is None:
+                continue
+            with account.lock:
+                account.request_count = total + account.request_count - account.synced_count
+                account.synced_count = total
+
+    def start(self, pool):
+        """启动计数同步线程"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while True:
+                time.sleep(self.sync_interval)
+                try:
+                    self.sync_counts(list(pool.accounts))
+                except sqlite3.Error as e:
+                    print(f"[Shared] Count sync failed: {e}")
+
+        self._thread = threading.Thread(target=run, name="shared-state-sync", daemon=True)
+        self._thread.start()
+
+    # ---------- token ----------
+
+    def load_tokens(self, name):
+        """返回 (access_token, refresh_token, refreshed_at)，没有记录时返回 None"""
+        row = self._conn().execute(
+            "SELECT access_token, refresh_token, refreshed_at FROM accounts "
+            "WHERE name = ? AND access_token IS NOT NULL",
+            (name,),
+        ).fetchone()
+        return row
+
+    @staticmethod
+    def saved_refresh_tokens(path):
+        """主进程启动时调用：读取上次运行中刷新得到的 refresh_token，返回 {账号名: refresh_token}"""
+        if not os.path.exists(path):
+            return {}
+        conn = _connect(path)
+        try:
+            return dict(conn.execute(
+                "SELECT name, refresh_token FROM accounts WHERE refresh_token IS NOT NULL"))
+        finally:
+            conn.close()
+
+    def store_tokens(self, name, access_token, refresh_token, refreshed_at):
+        self._conn().execute(
+            "INSERT INTO accounts (name, access_token, refresh_token, refreshed_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET access_token = excluded.access_token, "
+            "refresh_token = excluded.refresh_token, refreshed_at = excluded.refreshed_at",
+            (name, access_token, refresh_token, refreshed_at),
+        )
+
+    # ---------- 刷新租约 ----------
+
+    def acquire_lease(self, name):
+        """尝试获取账号的刷新租约，已持有、无人持有或已过期时成功"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR IGNORE INTO accounts (name) VALUES (?)", (name,))
+        cur = conn.execute(
+            "UPDATE accounts SET lease_owner = ?, lease_until = ? "
+            "WHERE name = ? AND (lease_owner IS NULL OR lease_owner = ? OR lease_until < ?)",
+            (self.owner, now + self.lease_ttl, name, self.owner, now),
+        )
+        return cur.rowcount == 1
+
+    def release_lease(self, name):
+        self._conn().execute(
+            "UPDATE accounts SET lease_owner = NULL, lease_until = 0 WHERE name = ? AND lease_owner = ?",
+            (name, self.owner),
+        )
+
+
+shared_state = SharedState()
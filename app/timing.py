@@ -0,0 +1,170 @@
+"""
+请求耗时分解 - 记录每个请求在各阶段花费的时间
+- 阶段：auth（API Key 校验与限流）、queue（准入排队）、select（选择账号）、refresh（同步刷新 token）、
+  pixiv（上游调用，含重试）、coalesced（等待合并的同一上游调用）、serialize（JSON 序列化）、compress（压缩）
+- timing.server_timing 开启时以 Server-Timing 响应头输出
+- 超过 slow_threshold_ms 的请求写入按大小轮转的慢请求日志，附带账号名和 Key 名
+当前请求的记录放在 ContextVar 中，批量请求的工作线程和 ASGI 协程同样记录到所属请求
+"""
+import logging
+import os
+import time
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+
+PHASES = ("auth", "queue", "select", "refresh", "pixiv", "coalesced", "serialize", "compress")
+
+_current = ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    """一个请求的阶段耗时，spans 为 (阶段, 秒) 列表（list.append 在多线程下是安全的）"""
+
+    __slots__ = ("start", "spans", "accounts")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+        self.accounts = []
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def phases(self):
+        """按 PHASES 顺序汇总各阶段耗时（秒），同一阶段多次记录（重试、批量请求）时相加"""
+        totals = {}
+        for phase, duration in list(self.spans):
+            totals[phase] = totals.get(phase, 0.0) + duration
+        return {phase: totals[phase] for phase in PHASES if phase in totals}
+
+    def header(self, total=None):
+        """Server-Timing 头的值，单位毫秒"""
+        total = self.elapsed() if total is None else total
+        parts = [f"{phase};dur={duration * 1000:.1f}" for phase, duration in self.phases().items()]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def record_phase(phase, duration, account=None):
+    """记录当前请求某个阶段的耗时（秒），不在请求中或未开启时什么都不做"""
+    timing = _current.get()
+    if timing is not None:
+        timing.spans.append((phase, duration))
+        if account is not None and account not in timing.accounts:
+            timing.accounts.append(account)
+
+
+class Timing:
+
+    def __init__(self):
+        self.enabled = True
+        self.server_timing = False
+        self.slow_threshold = 1.0
+        self.slow_log = "./logs/slow.log"
+        self.max_bytes = 10 * 1024 * 1024
+        self.backup_count = 5
+        self.workers = 1
+        self._logger = None
+
+    def load_from_config(self):
+        """从 config.yaml 加载耗时分解配置"""
+        from app.config import config
+
+        cfg = config.timing
+        self.enabled = cfg.get("enabled", True)
+        self.server_timing = cfg.get("server_timing", False)
+        self.slow_threshold = (cfg.get("slow_threshold_ms", 1000) or 0) / 1000.0
+        self.max_bytes = cfg.get("max_bytes", self.max_bytes)
+        self.backup_count = cfg.get("backup_count", self.backup_count)
+        slow_log = cfg.get("slow_log", self.slow_log)
+        if slow_log != self.slow_log:
+            self.close()
+            self.slow_log = slow_log
+        if self.enabled and self.slow_threshold:
+            print(f"[Timing] Slow requests over {self.slow_threshold * 1000:.0f}ms logged to {self.slow_log}")
+
+    def start(self, workers=1):
+        """在 worker 进程中调用；多 worker 时每个进程写自己的日志文件，避免轮转时互相覆盖"""
+        self.workers = max(1, workers)
+        self.close()
+
+    def begin(self):
+        """开始记录当前请求，返回 end() 需要的令牌，未开启时返回 None"""
+        if not self.enabled:
+            return None
+        return _current.set(RequestTiming())
+
+    def end(self, token):
+        if token is not None:
+            _current.reset(token)
+
+    def current(self):
+        return _current.get()
+
+    def finish(self, timing, method, path, status, key_value=None):
+        """请求结束：超过阈值时写入慢请求日志"""
+        total = timing.elapsed()
+        if not self.slow_threshold or total < self.slow_threshold:
+            return
+        key_name = "-"
+        if key_value:
+            from app.key_manager import key_manager
+            api_key = key_manager.get_key(key_value)
+            key_name = api_key.name if api_key else "-"
+        phases = " ".join(f"{phase}={duration * 1000:.1f}ms" for phase, duration in timing.phases().items())
+        try:
+            self._get_logger().warning(
+                "%.1fms %s %s %s key=%s account=%s %s", total * 1000, method, path, status,
+                key_name, ",".join(timing.accounts) or "-", phases)
+        except OSError as e:
+            print(f"[Timing] Slow log write failed: {e}")
+
+    def _get_logger(self):
+        if self._logger is None:
+            path = self.slow_log
+            if self.workers > 1:
+                path = f"{path}.{os.getpid()}"
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=self.max_bytes, backupCount=self.backup_count,
+                                          encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger = logging.getLogger("pixiv.slow")
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            logger.addHandler(handler)
+            self._logger = logger
+        return self._logger
+
+    def close(self):
+        if self._logger is not None:
+            for handler in list(self._logger.handlers):
+                self._logger.removeHandler(handler)
+                handler.close()
+            self._logger = None
+
+
+def install_timing(app):
+    """Flask 请求的耗时分解：before_request 开始记录，after_request 输出 Server-Timing 并检查慢请求"""
+    from flask import g, request
+
+    @app.before_request
+    def begin_timing():
+        g.timing_token = timing.begin()
+
+    @app.after_request
+    def finish_timing(response):
+        current = timing.current()
+        if current is None:
+            return response
+        if timing.server_timing:
+            response.headers["Server-Timing"] = current.header()
+        timing.finish(current, request.method, request.full_path.rstrip("?"), response.status_code,
+                      g.get("api_key_value"))
+        return response
+
+    @app.teardown_request
+    def end_timing(exc=None):
+        timing.end(g.pop("timing_token", None))
+
+
+timing = Timing()
@@ -0,0 +1,98 @@
+"""
+上游 HTTP 传输 - 为每个账号的 pixivpy3 会话配置连接池、超时、keep-alive 与重试
+"""
+from urllib3.util.retry import Retry
+
+DEFAULT_SETTINGS = {
+    "pool_connections": 4,  # 缓存的主机连接池数（app-api / oauth / i.pximg）
+    "pool_maxsize": 16,  # 每个主机保持的最大连接数
+    "pool_block": False,  # 连接用尽时等待而不是新建临时连接
+    "connect_timeout": 5,
+    "read_timeout": 30,
+    "keep_alive": True,
+    "retries": 2,  # 连接错误与 5xx 的重试次数（仅幂等方法）
+    "backoff": 0.3,
+}
+
+
+def transport_settings(account_name=None):
+    """全局 http 配置，叠加 pixiv_accounts 中该账号的 http 覆盖项"""
+    from app.config import config
+
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(config.http)
+    if account_name:
+        for acc in config.pixiv_accounts:
+            if acc.get("name") == account_name:
+                settings.update(acc.get("http") or {})
+                break
+    return settings
+
+
+def configure_session(api, settings):
+    """
+    按 settings 重新挂载会话的 HTTPAdapter，并设置超时与 keep-alive
+    pixivpy3 使用 cloudscraper 会话，https 适配器为 CipherSuiteAdapter（自定义 TLS 指纹），
+    这里沿用原适配器的类型和 SSL 上下文，只替换连接池与重试参数
+    """
+    retry = Retry(
+        total=settings["retries"],
+        connect=settings["retries"],
+        read=settings["retries"],
+        status=settings["retries"],
+        backoff_factor=settings["backoff"],
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        raise_on_status=False,
+    )
+    session = api.requests
+    for prefix, old in list(session.adapters.items()):
+        kwargs = {}
+        if hasattr(old, "ssl_context"):
+            kwargs["ssl_context"] = old.ssl_context
+            kwargs["source_address"] = getattr(old, "source_address", None)
+        adapter = type(old)(
+            pool_connections=settings["pool_connections"],
+            pool_maxsize=settings["pool_maxsize"],
+            pool_block=settings["pool_block"],
+            max_retries=retry,
+            **kwargs,
+        )
+        old.close()
+        session.mount(prefix, adapter)
+
+    api.requests_kwargs["timeout"] = (settings["connect_timeout"], settings["read_timeout"])
+    if settings["keep_alive"]:
+        api.additional_headers.pop("Connection", None)
+    else:
+        api.additional_headers["Connection"] = "close"
+
+
+def _connection_pools(session):
+    for adapter in session.adapters.values():
+        managers = [getattr(adapter, "poolmanager", None)]
+        managers.extend(getattr(adapter, "proxy_manager", {}).values())
+        for manager in managers:
+            if manager is None:
+                continue
+            for key in manager.pools.keys():
+                pool = manager.pools.get(key)
+                if pool is not None:
+                    yield pool
+
+
+def connection_stats(session):
+    """
+    连接复用统计：requests 为经连接池发出的请求数，new_connections 为新建连接（含 TLS 握手）数，
+    reused 为复用已有连接的请求数；被 LRU 淘汰的主机连接池不再计入
+    """
+    new_connections = requests = 0
+    for pool in _connection_pools(session):
+        new_connections += pool.num_connections
+        requests += pool.num_requests
+    return {
+        "requests": requests,
+        "new_connections": new_connections,
+        "reused": max(requests - new_connections, 0),
+        "reuse_ratio": round(1 - new_connections / requests, 3) if requests else 0.0,
+    }
@@ -0,0 +1,262 @@
+"""
+上游调用 - 按 API Key 的池限制选择账号并调用 pixivpy3 方法
+"""
+import math
+import time
+from flask import request, g, jsonify
+from app.config import config
+from app.pool import pool
+from app.key_manager import key_manager
+from app.singleflight import singleflight
+from app.admission import admission
+from app.metrics import metrics
+from app.timing import record_phase
+
+
+class UpstreamUnavailable(Exception):
+    """上游暂时无法处理请求，路由使用 error_response() 转换为响应"""
+
+    status = 503
+    default_message = "Upstream unavailable"
+
+    def __init__(self, message=None, retry_after=None):
+        super().__init__(message or self.default_message)
+        self.retry_after = retry_after
+
+
+class NoAvailableAccount(UpstreamUnavailable):
+    """没有可用的 Pixiv 账号"""
+
+    default_message = "No available account"
+
+
+class UpstreamRateLimited(UpstreamUnavailable):
+    """重试预算内所有尝试的账号都被 Pixiv 限流"""
+
+    status = 429
+    default_message = "Upstream rate limited"
+
+
+class Overloaded(UpstreamUnavailable):
+    """准入控制拒绝：等待上游并发名额的队列已满或等待超时"""
+
+    default_message = "Server overloaded, retry later"
+
+
+def error_response(e):
+    """将 UpstreamUnavailable 转换为 JSON 错误响应，带 Retry-After 头"""
+    response = jsonify({"error": str(e)})
+    response.status_code = e.status
+    if e.retry_after:
+        response.headers["Retry-After"] = str(int(math.ceil(e.retry_after)))
+    return response
+
+
+def is_rate_limited(result=None, error=None):
+    """判断上游结果或异常是否为 Pixiv 限流（HTTP 429 / "Rate Limit" 错误）"""
+    if error is not None:
+        text = str(error)
+        return "Rate Limit" in text or "Too Many Requests" in text or "HTTP 429" in text
+    if isinstance(result, dict) and isinstance(result.get("error"), dict):
+        err = result["error"]
+        text = f"{err.get('message') or ''} {err.get('user_message') or ''}"
+        return "Rate Limit" in text
+    return False
+
+
+def is_account_failure(result):
+    """上游结果是否表明账号本身出错（access token 失效等 OAuth 错误），计入熔断器"""
+    if isinstance(result, dict) and isinstance(result.get("error"), dict):
+        err = result["error"]
+        text = f"{err.get('message') or ''} {err.get('reason') or ''}"
+        return "OAuth" in text or "invalid_grant" in text
+    return False
+
+
+def pool_restriction(key_value):
+    """API Key 的池限制，返回 (mode, allowed_accounts)；无 Key 时 mode 为 None"""
+    if not key_value:
+        return None, []
+    return key_manager.get_allowed_accounts(key_value)
+
+
+def choose_account(key_value, strategy=None):
+    """按 API Key 的池限制和负载均衡策略选择账号（不依赖请求上下文）"""
+    pool_mode, allowed_accounts = pool_restriction(key_value)
+    if pool_mode:
+        return pool.get_account_for_key(pool_mode, allowed_accounts, strategy)
+    # 没有 API Key 上下文或 Key 不存在，使用默认行为
+    return pool.get_account(strategy)
+
+
+def select_account():
+    """根据当前请求 API Key 的池限制和 ?lb= 参数选择账号"""
+    return choose_account(getattr(g, 'api_key_value', None), request.args.get("lb"))
+
+
+def flight_key(key_value, method, args, kwargs):
+    """single-flight 键：同一方法、参数和池限制的调用可以合并"""
+    pool_mode, allowed_accounts = pool_restriction(key_value)
+    return (
+        method,
+        args,
+        # next_url 解析出的数组参数（如 viewed[]）为 list，转为 tuple 以便哈希
+        tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in kwargs.items())),
+        pool_mode,
+        tuple(sorted(allowed_accounts)) if pool_mode == "specific" else (),
+    )
+
+
+def classify(result=None, error=None):
+    """单次上游调用的结果：ok / throttled（被 Pixiv 限流）/ failed（账号故障，计入熔断器）"""
+    if error is not None:
+        return "throttled" if is_rate_limited(error=error) else "failed"
+    if is_rate_limited(result=result):
+        return "throttled"
+    if is_account_failure(result):
+        return "failed"
+    return "ok"
+
+
+class Attempts:
+    """
+    一次上游调用的重试过程，call_upstream 与 AsyncPixivClient.call_api 共用，只有实际发出请求的方式不同：
+    迭代得到每次尝试选中的账号（没有账号可选时抛出），record() 记录结果并决定是否结束，
+    重试用尽后抛出 exhausted()
+    被限流的账号进入冷却期、熔断的账号被移出轮换，重试自然落到其他账号
+    """
+
+    def __init__(self, key_value, strategy, method):
+        rate_cfg = config.rate_limit
+        self.retries = rate_cfg.get("retries", 2)
+        self.cooldown = rate_cfg.get("cooldown", 60)
+        self.key_value = key_value
+        self.strategy = strategy
+        self.method = method
+        self.attempt = 0
+        self.start = 0.0
+        self.last_error = None
+
+    def __iter__(self):
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            account = choose_account(self.key_value, self.strategy)
+            record_phase("select", time.perf_counter() - start)
+            if not account:
+                raise no_account_error(self.last_error)
+            # 记录进行中请求数和延迟，供 ewma 策略使用
+            self.attempt = attempt
+            self.last_error = None
+            account.begin_request()
+            self.start = time.perf_counter()
+            yield account
+
+    def record(self, account, result=None, error=None):
+        """记录一次尝试的结果（计入熔断器，限流不算账号故障），返回 True 表示应返回 result"""
+        self.last_error = error
+        outcome = classify(result, error)
+        latency = time.perf_counter() - self.start
+        account.end_request(latency, outcome != "failed")
+        metrics.observe("pixiv_upstream_request_duration_seconds", (self.method, outcome), latency)
+        record_phase("pixiv", latency, account.name)
+
+        if outcome == "ok":
+            return True
+        if outcome == "throttled":
+            account.mark_throttled(self.cooldown)
+            self.last_error = None
+            return False
+        # 重试用尽时原样返回 Pixiv 的错误结果
+        return error is None and self.attempt == self.retries
+
+    def exhausted(self):
+        """所有尝试都失败时应抛出的异常"""
+        if self.last_error is not None:
+            return self.last_error
+        return UpstreamRateLimited(retry_after=self.cooldown)
+
+
+def admission_identity(key_value):
+    """准入控制中的 (Key 名称, 权重, 优先级)，无 Key 的请求共用一个默认份额"""
+    api_key = key_manager.get_key(key_value) if key_value else None
+    if api_key is None:
+        return "", 1.0, 0
+    return api_key.name, api_key.weight, api_key.priority
+
+
+def no_account_error(last_error):
+    """没有账号可选时应抛出的异常"""
+    if last_error is not None:
+        return last_error
+    # 账号都在限流冷却期或令牌桶已空时告知客户端何时重试
+    remaining = pool.cooldown_remaining()
+    if remaining:
+        return UpstreamRateLimited(retry_after=remaining)
+    return NoAvailableAccount()
+
+
+def admit(key_value):
+    """
+    准入控制：账号池饱和时按 Key 公平排队，被拒绝时抛出 Overloaded
+    返回交给 admission.release 的凭据（call_upstream 和图片下载共用）
+    """
+    start = time.perf_counter()
+    ticket = admission.acquire(*admission_identity(key_value))
+    if admission.enabled:
+        record_phase("queue", time.perf_counter() - start)
+    if not ticket:
+        raise Overloaded(retry_after=1)
+    return ticket
+
+
+async def admit_async(key_value):
+    """admit 的 asyncio 版本，等待期间不占用线程"""
+    start = time.perf_counter()
+    ticket = await admission.acquire_async(*admission_identity(key_value))
+    if admission.enabled:
+        record_phase("queue", time.perf_counter() - start)
+    if not ticket:
+        raise Overloaded(retry_after=1)
+    return ticket
+
+
+def call_api(method, *args, **kwargs):
+    """
+    获取账号并调用 pixivpy3 方法，没有可用账号时抛出 NoAvailableAccount
+    并发的相同调用（同一方法、参数和池限制）通过 single-flight 合并为一次上游请求
+    """
+    return call_upstream(getattr(g, 'api_key_value', None), request.args.get("lb"), method, *args, **kwargs)
+
+
+def call_upstream(key_value, strategy, method, *args, **kwargs):
+    """call_api 的无请求上下文版本，API Key 与负载均衡策略显式传入（可在工作线程中调用）"""
+
+    def fetch():
+        executed.append(True)
+        # 只有真正访问上游的请求（single-flight 的执行者）占用准入名额
+        ticket = admit(key_value)
+        try:
+            return fetch_with_retries()
+        finally:
+            admission.release(ticket)
+
+    def fetch_with_retries():
+        attempts = Attempts(key_value, strategy, method)
+        for account in attempts:
+            result = error = None
+            try:
+                result = getattr(account.api, method)(*args, **kwargs)
+            except Exception as e:
+                error = e
+            if attempts.record(account, result, error):
+                return result
+        raise attempts.exhausted()
+
+    # fetch 未被执行说明合并到了其他请求正在进行的调用，等待时间记为 coalesced
+    executed = []
+    start = time.perf_counter()
+    try:
+        return singleflight.do(flight_key(key_value, method, args, kwargs), fetch)
+    finally:
+        if not executed:
+            record_phase("coalesced", time.perf_counter() - start)
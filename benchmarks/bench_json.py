@@ -0,0 +1,86 @@
+"""
+JSON 响应微基准：Flask 默认 provider vs orjson provider，以及各压缩算法的耗时与压缩率
+
+用法:
+    python benchmarks/bench_json.py [--items 30] [--rounds 2000]
+
+负载模拟一页排行榜结果（--items 个带 tags / meta_pages 的插画）
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from app.encoding import ENCODERS, DEFAULT_LEVELS, ORJSON_AVAILABLE
+
+
+def build_page(n):
+    return {
+        "illusts": [
+            {
+                "id": 100000000 + i,
+                "title": f"作品タイトル {i}",
+                "type": "illust",
+                "image_urls": {
+                    size: f"https://i.pximg.net/c/{size}/img-master/img/2024/01/01/00/00/00/{100000000 + i}_p0.jpg"
+                    for size in ("square_medium", "medium", "large")
+                },
+                "caption": "説明文 " * 20,
+                "user": {"id": 1000 + i, "name": f"user{i}", "account": f"account{i}", "is_followed": False},
+                "tags": [{"name": f"タグ{j}", "translated_name": f"tag{j}"} for j in range(8)],
+                "meta_pages": [{"image_urls": {"original": f"https://i.pximg.net/img-original/{i}_p{p}.png"}}
+                               for p in range(3)],
+                "total_view": 12345 + i,
+                "total_bookmarks": 678 + i,
+                "create_date": "2024-01-01T00:00:00+09:00",
+            }
+            for i in range(n)
+        ],
+        "next_url": "https://app-api.pixiv.net/v1/illust/ranking?mode=day&filter=for_ios&offset=30",
+    }
+
+
+def bench(label, fn, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {elapsed / rounds * 1e6:9.1f} us/op")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=30)
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    page = build_page(args.items)
+    app = Flask(__name__)
+    providers = [("stdlib", DefaultJSONProvider(app))]
+    if ORJSON_AVAILABLE:
+        from app.encoding import OrjsonProvider
+        providers.append(("orjson", OrjsonProvider(app)))
+    else:
+        print("orjson not installed, skipping orjson provider")
+
+    body = None
+    with app.app_context():
+        for name, provider in providers:
+            body = bench(f"dumps[{name}]", lambda: provider.dumps(page, separators=(",", ":")), args.rounds)
+    body = body.encode("utf-8")
+    print(f"body: {len(body)} bytes")
+
+    for name, encode in ENCODERS.items():
+        level = DEFAULT_LEVELS[name]
+        compressed = bench(f"compress[{name}:{level}]", lambda: encode(body, level), max(1, args.rounds // 10))
+        print(f"{'':<24} {len(compressed)} bytes ({len(compressed) / len(body):.1%})")
+
+
+if __name__ == "__main__":
+    main()
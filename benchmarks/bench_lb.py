@@ -0,0 +1,120 @@
+"""
+负载均衡策略模拟：部分账号变慢（代理拥塞或被限流）时各策略的尾延迟
+
+用法:
+    python benchmarks/bench_lb.py [--accounts 8] [--slow 2] [--requests 2000] [--threads 16]
+
+每个账号的“上游延迟”用 sleep 模拟：正常账号约 5ms，慢账号约 50ms，
+并发请求越多延迟越高（模拟单账号排队）。
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.selector import AccountView
+
+# 尚无延迟样本时的估计，与 load_balance.default_latency_ms 的默认值一致
+DEFAULT_LATENCY = 0.5
+
+
+class SimAccount:
+    def __init__(self, name, base_latency, alpha=0.3):
+        self.name = name
+        self.base_latency = base_latency
+        self.alpha = alpha
+        self.request_count = 0
+        self.inflight = 0
+        self.ewma_latency = 0.0
+        self.authenticated = True
+        self.refreshing = False
+        self.lock = threading.Lock()
+
+    def can_serve(self):
+        return True
+
+    def is_available(self):
+        return True
+
+    def record_request(self):
+        with self.lock:
+            self.request_count += 1
+
+    def expected_cost(self):
+        return (self.ewma_latency or DEFAULT_LATENCY) * (self.inflight + 1)
+
+    def call(self):
+        with self.lock:
+            self.inflight += 1
+            queued = self.inflight
+        start = time.perf_counter()
+        time.sleep(self.base_latency * (1 + 0.25 * (queued - 1)) * random.uniform(0.8, 1.2))
+        latency = time.perf_counter() - start
+        with self.lock:
+            self.inflight -= 1
+            if self.ewma_latency:
+                self.ewma_latency = self.alpha * latency + (1 - self.alpha) * self.ewma_latency
+            else:
+                self.ewma_latency = latency
+        return latency
+
+
+def simulate(strategy, args):
+    accounts = [
+        SimAccount(f"a{i}", 0.05 if i < args.slow else 0.005)
+        for i in range(args.accounts)
+    ]
+    view = AccountView(accounts)
+    select = {
+        "round_robin": view.round_robin,
+        "least_used": view.least_used,
+        "ewma": view.least_cost,
+    }[strategy]
+    latencies = []
+    lock = threading.Lock()
+    per_thread = args.requests // args.threads
+
+    def worker():
+        local = []
+        for _ in range(per_thread):
+            local.append(select().call())
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    slow_share = sum(a.request_count for a in accounts[:args.slow]) / len(latencies)
+    return latencies, slow_share
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=8)
+    parser.add_argument("--slow", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"accounts: {args.accounts} ({args.slow} slow), requests: {args.requests}, threads: {args.threads}")
+    for strategy in ("round_robin", "least_used", "ewma"):
+        latencies, slow_share = simulate(strategy, args)
+        print(f"{strategy:11}  p50 {percentile(latencies, 0.5) * 1000:6.1f} ms  "
+              f"p99 {percentile(latencies, 0.99) * 1000:6.1f} ms  "
+              f"slow-account share {slow_share:5.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+账号选择微基准：索引视图 (app.selector) vs 原实现（每次请求过滤列表 + 全局锁下 min()）
+
+用法:
+    python benchmarks/bench_selector.py [--accounts 500] [--requests 200000] [--threads 8]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.selector import AccountSelector
+
+
+class StubAccount:
+    def __init__(self, name):
+        self.name = name
+        self.request_count = 0
+        self.authenticated = True
+        self.refreshing = False
+        self.lock = threading.Lock()
+
+    def can_serve(self):
+        return self.authenticated
+
+    def is_available(self):
+        return self.can_serve() and not self.refreshing
+
+    def record_request(self):
+        with self.lock:
+            self.request_count += 1
+
+
+class LegacyPool:
+    """原 AccountPool.get_account_for_key 的选择逻辑"""
+
+    def __init__(self, accounts):
+        self.accounts = accounts
+        self.lock = threading.Lock()
+        self.index = 0
+
+    def get_account_for_key(self, pool_mode, allowed_accounts, strategy):
+        if pool_mode == "all":
+            available = [a for a in self.accounts if a.authenticated]
+        else:
+            available = [a for a in self.accounts if a.authenticated and a.name in allowed_accounts]
+        if not available:
+            return None
+        if strategy == "least_used":
+            with self.lock:
+                account = min(available, key=lambda a: a.request_count)
+        else:
+            with self.lock:
+                account = available[self.index % len(available)]
+                self.index += 1
+        account.record_request()
+        return account
+
+
+class IndexedPool:
+    def __init__(self, accounts):
+        self.accounts = accounts
+        self.selector = AccountSelector()
+
+    def get_account_for_key(self, pool_mode, allowed_accounts, strategy):
+        if pool_mode == "all":
+            view = self.selector.view(self.accounts)
+        else:
+            view = self.selector.view(self.accounts, allowed_accounts)
+        if strategy == "least_used":
+            return view.least_used()
+        return view.round_robin()
+
+
+def run(pool, pool_mode, allowed, strategy, requests, threads):
+    per_thread = requests // threads
+
+    def worker():
+        for _ in range(per_thread):
+            pool.get_account_for_key(pool_mode, allowed, strategy)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    names = [f"account_{i}" for i in range(args.accounts)]
+    allowed = names[: max(1, args.accounts // 4)]
+
+    print(f"accounts: {args.accounts}, requests: {args.requests}, threads: {args.threads}")
+    for pool_mode, allowed_accounts in (("all", []), ("specific", allowed)):
+        for strategy in ("least_used", "round_robin"):
+            results = {}
+            for label, cls in (("legacy", LegacyPool), ("indexed", IndexedPool)):
+                pool = cls([StubAccount(n) for n in names])
+                results[label] = run(pool, pool_mode, allowed_accounts, strategy, args.requests, args.threads)
+            legacy, indexed = results["legacy"], results["indexed"]
+            print(f"{pool_mode:8} {strategy:11}  legacy {legacy / args.requests * 1e6:7.2f} us/req  "
+                  f"indexed {indexed / args.requests * 1e6:6.2f} us/req  speedup {legacy / indexed:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
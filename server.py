@@ -4,12 +4,24 @@ from werkzeug.middleware.proxy_fix import ProxyFix
 from app.config import config
 from app.pool import pool
 from app.key_manager import key_manager
+from app.cache import response_cache
+from app.image_cache import image_cache
+from app.encoding import compressor, install_json_provider
+from app.refresher import refresher
+from app.key_limits import key_limiter
+from app.admission import admission
+from app.metrics import install_metrics, metrics, Metrics
+from app.timing import install_timing, timing
+from app.profiler import install_profiler, profiler
+from app.shared_state import shared_state, SharedState
+from app.serving import serve, serving_settings
 from app.routes import api_bp
 from app.routes.ui import ui_bp
 
 def create_app():
     app = Flask(__name__, template_folder="templates")
     app.secret_key = os.getenv("SECRET_KEY", "pixiv-api-secret-key-change-me")
+    install_json_provider(app)
     
     # 支持 nginx 反向代理，正确处理 X-Forwarded-* 头
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
@@ -18,10 +30,22 @@ def create_app():
     app.register_blueprint(api_bp)
     app.register_blueprint(ui_bp)
     
+    # 请求耗时指标与 /metrics
+    install_metrics(app)
+    # 请求耗时分解（Server-Timing）与慢请求日志
+    install_timing(app)
+    # 按需性能分析（/api/admin/profile?mode=requests）
+    install_profiler(app)
+    
     # 健康检查
     @app.route("/health", methods=["GET"])
     def health():
-        return jsonify({"status": "ok", "accounts": len(pool.accounts)})
+        return jsonify({
+            "status": "ok",
+            "accounts": len(pool.accounts),
+            "startup": pool.startup_status(),
+            "worker": {"pid": os.getpid(), "refresher": refresher.role}
+        })
     
     # 根路径重定向到 UI
     @app.route("/")
@@ -30,15 +54,43 @@ def create_app():
     
     return app
 
+def start_background(state_dir=None, workers=1):
+    """
+    启动后台任务，每个 worker 进程调用一次
+    state_dir: 多 worker 部署时的共享状态目录
+    workers: worker 进程数，API Key 的每秒请求数限制在各 worker 间平分
+    """
+    key_limiter.start(workers)
+    timing.start(workers)
+    if state_dir:
+        # fork 前建立的上游连接不能在父子进程间共用
+        pool.reset_connections()
+        # 请求计数、token 和刷新租约在 worker 间共享，每个 token 只由一个 worker 刷新
+        shared_state.open(os.path.join(state_dir, "state.db"))
+        shared_state.start(pool)
+        # 每个 worker 写入自己的指标文件，/metrics 合并所有 worker
+        metrics.start_multiprocess(os.path.join(state_dir, "metrics"),
+                                   config.metrics.get("flush_interval", 5))
+    # 启动后台 token 刷新调度（默认每个账号约50分钟刷新一次，Pixiv token 有效期约1小时）
+    pool.start_auto_refresh()
+
 def main():
-    # 加载账号池
-    pool.load_from_config()
+    settings = serving_settings()
+    state_path = os.path.join(settings["state_dir"], "state.db")
+    
+    # 加载账号池（多 worker 部署时刷新得到的 token 只保存在共享状态中，启动时优先使用）
+    pool.load_from_config(SharedState.saved_refresh_tokens(state_path) if settings["workers"] > 1 else None)
     
     # 加载 API Keys
     key_manager.load_from_config(config.api_keys)
     
-    # 启动自动刷新（每50分钟刷新一次，Pixiv token 有效期约1小时）
-    pool.start_auto_refresh(interval=3000)
+    # 加载响应缓存配置
+    response_cache.load_from_config()
+    image_cache.load_from_config()
+    compressor.load_from_config()
+    admission.load_from_config()
+    timing.load_from_config()
+    profiler.load_from_config()
     
     # 创建应用
     app = create_app()
@@ -63,7 +115,30 @@ def main():
     if host == "0.0.0.0" and config.server.get("ipv6", False):
         host = "::"
     
-    app.run(host=host, port=port, debug=debug)
+    # debug 或 mode: development 时使用 Flask 开发服务器
+    if debug or config.server.get("mode", "production") == "development":
+        start_background()
+        app.run(host=host, port=port, debug=debug)
+        return
+    
+    if settings["mode"] == "asgi":
+        from app.asgi import create_asgi_app
+        from app.async_client import HTTPX_AVAILABLE
+        from app.serving import UVICORN_AVAILABLE
+        if HTTPX_AVAILABLE and UVICORN_AVAILABLE:
+            app = create_asgi_app(app)
+        else:
+            print("[Serving] ASGI mode requires: pip install httpx uvicorn a2wsgi; using WSGI server")
+            settings["mode"] = "production"
+    if settings["workers"] > 1:
+        # 所有账号认证完成后再 fork，worker 继承已认证的账号
+        pool.wait_startup()
+        SharedState.reset(state_path)
+        Metrics.reset_multiprocess(os.path.join(settings["state_dir"], "metrics"))
+    serve(app, host, port,
+          lambda shared: start_background(settings["state_dir"] if shared else None,
+                                          settings["workers"] if shared else 1),
+          settings)
 
 if __name__ == "__main__":
     main()
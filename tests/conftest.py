@@ -0,0 +1,56 @@
+"""
+测试共用的 fixture：挂载 API 蓝图的 Flask 应用、通过鉴权的客户端、API Key 和管理 Token
+"""
+import pytest
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from app.key_limits import KeyLimiter
+from app.key_manager import APIKey, key_manager
+
+
+@pytest.fixture
+def api_app():
+    """挂载 /api 蓝图的 Flask 应用"""
+    from app.routes import api_bp
+
+    app = Flask(__name__)
+    app.register_blueprint(api_bp, url_prefix="/api")
+    return app
+
+
+@pytest.fixture
+def api_key(monkeypatch):
+    """Key 值为 "k" 的 API Key，测试可直接修改其限流、配额和端点规则"""
+    key = APIKey(name="test", key="k")
+    monkeypatch.setattr(key_manager, "get_key", lambda key_value: key if key_value == "k" else None)
+    return key
+
+
+@pytest.fixture
+def client(api_app, monkeypatch):
+    """任何请求都以 API Key "k" 通过鉴权的测试客户端"""
+    monkeypatch.setattr("app.auth.authorize_api_key", lambda header, path: ("k", None, None))
+    return api_app.test_client()
+
+
+@pytest.fixture
+def admin_headers():
+    """管理接口的 Token 鉴权头"""
+    from app.config import config
+
+    return {"Authorization": f"Bearer {config.auth_token}"}
+
+
+@pytest.fixture
+def key_limiter(monkeypatch):
+    """独立的 API Key 限流器，不受其他测试的用量影响"""
+    limiter = KeyLimiter()
+    monkeypatch.setattr("app.key_limits.key_limiter", limiter)
+    monkeypatch.setattr("app.pagination.key_limiter", limiter)
+    return limiter
@@ -0,0 +1,151 @@
+"""
+准入控制（按 API Key 公平排队）单元测试
+"""
+import asyncio
+import pytest
+import sys
+import os
+import threading
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.admission import AdmissionController, BYPASS, SLOT
+
+
+def make_controller(capacity=1, **kwargs):
+    controller = AdmissionController()
+    controller.enabled = True
+    controller.max_concurrent = capacity
+    for name, value in kwargs.items():
+        setattr(controller, name, value)
+    return controller
+
+
+def wait_queued(controller, n):
+    deadline = time.time() + 2
+    while controller.stats()["queued"] < n and time.time() < deadline:
+        time.sleep(0.005)
+
+
+def queue_in_order(controller, requests):
+    """依次让每个 (key, weight, priority) 排队，返回获得名额的顺序"""
+    order = []
+    threads = []
+    for i, (key, weight, priority) in enumerate(requests):
+        def run(key=key, weight=weight, priority=priority):
+            ticket = controller.acquire(key, weight, priority)
+            assert ticket
+            order.append(key)
+            controller.release(ticket)
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+        wait_queued(controller, i + 1)
+    return order, threads
+
+
+class TestAdmissionController:
+    def test_disabled_admits_everything(self):
+        controller = AdmissionController()
+        assert all(controller.acquire() for _ in range(100))
+
+    def test_weighted_fair_order(self):
+        """持有名额期间排队：权重 2 的 Key 每轮获得两倍名额，排队多的 Key 不会挤占其他 Key"""
+        controller = make_controller(queue_timeout=5)
+        holder = controller.acquire("holder")
+        order, threads = queue_in_order(
+            controller, [("noisy", 1, 0)] * 4 + [("heavy", 2, 0)] * 4)
+        controller.release(holder)
+        for thread in threads:
+            thread.join()
+        # 虚拟完成时间：heavy 0.5, 1, 1.5, 2；noisy 1, 2, 3, 4
+        assert order == ["heavy", "noisy", "heavy", "heavy", "noisy", "heavy", "noisy", "noisy"]
+
+    def test_priority_first(self):
+        controller = make_controller(queue_timeout=5)
+        holder = controller.acquire("holder")
+        order, threads = queue_in_order(controller, [("low", 1, 0), ("low", 1, 0), ("high", 1, 5)])
+        controller.release(holder)
+        for thread in threads:
+            thread.join()
+        assert order[0] == "high"
+
+    def test_bounded_queue_sheds(self):
+        controller = make_controller(max_queue_per_key=1, queue_timeout=0.3)
+        assert controller.acquire("a")
+        results = []
+        thread = threading.Thread(target=lambda: results.append(controller.acquire("b")))
+        thread.start()
+        wait_queued(controller, 1)
+        # b 的队列已满，立即拒绝
+        start = time.time()
+        assert controller.acquire("b") is False
+        assert time.time() - start < 0.1
+        # 排队者等待超时后被拒绝
+        thread.join()
+        assert results == [False]
+        stats = controller.stats()
+        assert (stats["shed"], stats["timeouts"], stats["queued"]) == (1, 1, 0)
+
+    def test_async_waiter_granted_on_release(self):
+        controller = make_controller(queue_timeout=2)
+        holder = controller.acquire("a")
+
+        async def go():
+            waiter = asyncio.ensure_future(controller.acquire_async("b"))
+            await asyncio.sleep(0.05)
+            assert not waiter.done()
+            threading.Timer(0.05, controller.release, (holder,)).start()
+            return await waiter
+
+        assert asyncio.run(go()) == SLOT
+        assert controller.stats()["in_flight"] == 1
+
+
+    def test_reload_disable_while_in_flight(self, monkeypatch):
+        """运行中关闭准入控制：已占用的名额仍然归还，排队中的请求立即放行，重新开启后容量完整"""
+        from app.config import config
+
+        controller = make_controller()
+        monkeypatch.setitem(config._data, "admission", {"enabled": True, "max_concurrent": 1, "queue_timeout": 5})
+        controller.load_from_config()
+        holder = controller.acquire("a")
+        results = []
+        thread = threading.Thread(target=lambda: results.append(controller.acquire("b")))
+        thread.start()
+        wait_queued(controller, 1)
+
+        monkeypatch.setitem(config._data, "admission", {"enabled": False})
+        controller.load_from_config()
+        thread.join(1)
+        assert results == [SLOT]
+        assert controller.acquire("c") == BYPASS
+        controller.release(holder)
+        controller.release(results[0])
+
+        monkeypatch.setitem(config._data, "admission", {"enabled": True, "max_concurrent": 1})
+        controller.load_from_config()
+        assert controller.stats()["in_flight"] == 0
+        assert controller.acquire("d") == SLOT
+
+
+class TestOverloadedResponse:
+    def test_call_upstream_sheds_with_503(self, monkeypatch):
+        from flask import Flask
+        from app.upstream import Overloaded, call_upstream, error_response
+
+        controller = make_controller(max_queue=0)
+        assert controller.acquire("holder")
+        monkeypatch.setattr("app.upstream.admission", controller)
+        with pytest.raises(Overloaded) as e:
+            call_upstream(None, None, "illust_detail", 1)
+        with Flask(__name__).app_context():
+            response = error_response(e.value)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
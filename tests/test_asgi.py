@@ -0,0 +1,233 @@
+"""
+ASGI 模式单元测试（上游使用 httpx.MockTransport 模拟）
+"""
+import asyncio
+import pytest
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+httpx = pytest.importorskip("httpx")
+
+from flask import Flask
+
+from app.asgi import AsgiApp
+from app.async_client import async_client
+from app.cache import response_cache
+
+
+class FakeAccount:
+    """模拟 PixivAccount 中 ASGI 路径用到的部分"""
+
+    def __init__(self, name):
+        self.name = name
+        self.api = type("API", (), {"access_token": f"token-{name}", "additional_headers": {}})()
+        self.throttled = 0
+        self.outcomes = []
+
+    def begin_request(self):
+        pass
+
+    def end_request(self, latency, success=True):
+        self.outcomes.append(success)
+
+    def mark_throttled(self, cooldown):
+        self.throttled += 1
+
+
+class TestAsgiApp:
+    @pytest.fixture
+    def setup(self, monkeypatch):
+        accounts = [FakeAccount("a"), FakeAccount("b")]
+        picks = iter(range(1000))
+        monkeypatch.setattr("app.upstream.choose_account",
+                            lambda key_value, strategy: accounts[next(picks) % len(accounts)])
+        monkeypatch.setattr("app.asgi.authorize_api_key",
+                            lambda header, path: ("k", None, None) if header == "Bearer good" else (None, "API key required", 401))
+        monkeypatch.setattr(response_cache, "enabled", True)
+        monkeypatch.setattr(response_cache, "ttls", {"illust_detail": 60})
+        response_cache.clear()
+        upstream = {"calls": 0, "handler": None}
+
+        async def handler(request):
+            upstream["calls"] += 1
+            return await upstream["handler"](request)
+
+        async_client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        app = AsgiApp(Flask(__name__))
+        yield app, accounts, upstream
+        async_client._client = None
+        response_cache.clear()
+
+    def run(self, app, *paths, headers=None):
+        async def go():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await asyncio.gather(*(client.get(p, headers=headers) for p in paths))
+        return asyncio.run(go())
+
+    def test_requires_api_key(self, setup):
+        app, _, _ = setup
+        [r] = self.run(app, "/api/illust/1")
+        assert r.status_code == 401
+
+    def test_illust_detail_cached(self, setup):
+        app, _, upstream = setup
+
+        async def handler(request):
+            assert request.url.path == "/v1/illust/detail"
+            assert request.headers["Authorization"].startswith("Bearer token-")
+            return httpx.Response(200, json={"illust": {"id": int(request.url.params["illust_id"])}})
+
+        upstream["handler"] = handler
+        headers = {"Authorization": "Bearer good"}
+        [first] = self.run(app, "/api/illust/7", headers=headers)
+        [second] = self.run(app, "/api/illust/7", headers=headers)
+        assert first.json() == {"illust": {"id": 7}}
+        assert (first.headers["X-Cache"], second.headers["X-Cache"]) == ("MISS", "HIT")
+        assert upstream["calls"] == 1
+
+    def test_server_timing_header(self, setup, monkeypatch):
+        app, _, upstream = setup
+        monkeypatch.setattr("app.asgi.timing.server_timing", True)
+
+        async def handler(request):
+            return httpx.Response(200, json={"illust": {"id": 7}})
+
+        upstream["handler"] = handler
+        [r] = self.run(app, "/api/illust/7", headers={"Authorization": "Bearer good"})
+        phases = [part.split(";")[0] for part in r.headers["Server-Timing"].split(", ")]
+        assert phases[:3] == ["auth", "select", "pixiv"]
+        assert phases[-1] == "total"
+
+    def test_fields_projection(self, setup):
+        app, _, upstream = setup
+
+        async def handler(request):
+            return httpx.Response(200, json={"illust": {"id": 7, "title": "t", "tags": [{"name": "a"}]}})
+
+        upstream["handler"] = handler
+        headers = {"Authorization": "Bearer good"}
+        [first] = self.run(app, "/api/illust/7?fields=id", headers=headers)
+        [second] = self.run(app, "/api/illust/7?fields=tags.name", headers=headers)
+        assert first.json() == {"illust": {"id": 7}}
+        assert second.json() == {"illust": {"tags": [{"name": "a"}]}}
+        assert upstream["calls"] == 1
+
+    def test_many_requests_in_flight(self, setup):
+        """上游等待期间不占用线程：200 个并发请求的耗时接近单次上游延迟"""
+        app, _, upstream = setup
+
+        async def handler(request):
+            await asyncio.sleep(0.2)
+            return httpx.Response(200, json={"user": {"id": int(request.url.params["user_id"])}})
+
+        upstream["handler"] = handler
+        loop_time = []
+
+        async def timed():
+            start = asyncio.get_running_loop().time()
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                responses = await asyncio.gather(*(
+                    client.get(f"/api/user/{i}", headers={"Authorization": "Bearer good"}) for i in range(200)
+                ))
+            loop_time.append(asyncio.get_running_loop().time() - start)
+            return responses
+
+        responses = asyncio.run(timed())
+        assert all(r.status_code == 200 for r in responses)
+        assert upstream["calls"] == 200
+        assert loop_time[0] < 2
+
+    def test_rate_limited_account_retried(self, setup):
+        app, accounts, upstream = setup
+
+        async def handler(request):
+            if request.headers["Authorization"] == "Bearer token-a":
+                return httpx.Response(403, json={"error": {"message": "Rate Limit"}})
+            return httpx.Response(200, json={"illusts": []})
+
+        upstream["handler"] = handler
+        [r] = self.run(app, "/api/recommended", headers={"Authorization": "Bearer good"})
+        assert r.status_code == 200
+        assert accounts[0].throttled == 1
+
+    def test_download_streams_upstream(self, setup, monkeypatch):
+        app, accounts, upstream = setup
+        monkeypatch.setattr("app.asgi.choose_account", lambda key_value, strategy: accounts[0])
+        body = os.urandom(200 * 1024)
+
+        async def handler(request):
+            assert request.headers["Referer"] == "https://app-api.pixiv.net/"
+            return httpx.Response(200, stream=httpx.ByteStream(body), headers={"Content-Type": "image/jpeg"})
+
+        upstream["handler"] = handler
+        [r] = self.run(app, "/api/download?url=https://i.pximg.net/img/1_p0.jpg",
+                       headers={"Authorization": "Bearer good"})
+        assert r.status_code == 200
+        assert r.content == body
+        assert r.headers["Content-Type"] == "image/jpeg"
+        assert "1_p0.jpg" in r.headers["Content-Disposition"]
+        # 下载同样计入账号的熔断器
+        assert accounts[0].outcomes == [True]
+
+    def test_download_gated_by_admission(self, setup, monkeypatch):
+        from app.admission import AdmissionController
+
+        app, accounts, upstream = setup
+        monkeypatch.setattr("app.asgi.choose_account", lambda key_value, strategy: accounts[0])
+        controller = AdmissionController()
+        controller.enabled = True
+        controller.max_concurrent = 1
+        controller.max_queue = 0
+        monkeypatch.setattr("app.upstream.admission", controller)
+        monkeypatch.setattr("app.asgi.admission", controller)
+
+        async def handler(request):
+            return httpx.Response(200, stream=httpx.ByteStream(b"image"), headers={"Content-Type": "image/jpeg"})
+
+        upstream["handler"] = handler
+        url = "/api/download?url=https://i.pximg.net/img/1_p0.jpg"
+        holder = controller.acquire("other")
+        [r] = self.run(app, url, headers={"Authorization": "Bearer good"})
+        assert r.status_code == 503
+        controller.release(holder)
+        [r] = self.run(app, url, headers={"Authorization": "Bearer good"})
+        assert r.content == b"image"
+        assert controller.stats()["in_flight"] == 0
+
+    def test_download_cache_routing(self, setup, monkeypatch, tmp_path):
+        """未命中时边转发边写入缓存；命中的请求交给 Flask，路由判断不计入命中统计"""
+        from app.image_cache import image_cache
+
+        app, accounts, upstream = setup
+        monkeypatch.setattr("app.asgi.choose_account", lambda key_value, strategy: accounts[0])
+        monkeypatch.setattr(image_cache, "enabled", True)
+        monkeypatch.setattr(image_cache, "root", tmp_path)
+        monkeypatch.setattr(image_cache, "max_bytes", 1024)
+        monkeypatch.setattr(image_cache, "hits", 0)
+        monkeypatch.setattr(image_cache, "misses", 0)
+        (tmp_path / "tmp").mkdir()
+
+        async def handler(request):
+            return httpx.Response(200, stream=httpx.ByteStream(b"image"), headers={"Content-Type": "image/jpeg"})
+
+        upstream["handler"] = handler
+        url = "/api/download?url=https://i.pximg.net/img/1_p0.jpg"
+        [r] = self.run(app, url, headers={"Authorization": "Bearer good"})
+        assert r.headers["X-Cache"] == "MISS"
+        assert image_cache.exists("https://i.pximg.net/img/1_p0.jpg")
+
+        # 测试用的 Flask 应用没有注册下载路由，命中的请求由 Flask 返回 404
+        [r] = self.run(app, url, headers={"Authorization": "Bearer good"})
+        assert r.status_code == 404
+        assert upstream["calls"] == 1
+        stats = image_cache.stats()
+        assert (stats["hits"], stats["misses"], stats["entries"]) == (0, 0, 1)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
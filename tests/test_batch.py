@@ -0,0 +1,127 @@
+"""
+批量插画详情接口单元测试
+"""
+import pytest
+import sys
+import os
+import threading
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.batch import BatchExecutor, parse_ids
+from app.cache import MemoryCacheBackend, response_cache
+from app.upstream import NoAvailableAccount
+
+
+class TestParseIds:
+    def test_dedupes_in_order(self):
+        assert parse_ids("3, 1,3,2,1", 10) == [3, 1, 2]
+        assert parse_ids([5, "5", 6], 10) == [5, 6]
+
+    def test_rejects_bad_input(self):
+        for raw in ("", "1,abc", [1, -2], [True], {"ids": 1}, "1,2,3"):
+            with pytest.raises(ValueError):
+                parse_ids(raw, 2)
+
+
+class TestBatchExecutor:
+    def test_concurrency_limit(self):
+        """单个请求同时进行的调用不超过 concurrency，异常按项返回"""
+        executor = BatchExecutor()
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0}
+
+        def fn(item):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.02)
+            with lock:
+                state["active"] -= 1
+            if item == 3:
+                raise RuntimeError("boom")
+            return item * 10
+
+        results = executor.map(list(range(12)), fn, concurrency=4, workers=8)
+        assert state["peak"] == 4
+        assert isinstance(results[3], RuntimeError)
+        assert results[5] == 50
+
+
+class TestIllustsRoute:
+    @pytest.fixture
+    def calls(self, monkeypatch):
+        """伪造上游调用，返回记录被请求插画 ID 的列表"""
+        response_cache.backend = MemoryCacheBackend()
+        response_cache.enabled = True
+        response_cache.ttls = {"illust_detail": 60}
+        calls = []
+
+        def fake_upstream(key_value, strategy, method, illust_id):
+            calls.append(illust_id)
+            if illust_id == 404:
+                return {"error": {"message": "not found"}}
+            if illust_id == 500:
+                raise RuntimeError("boom")
+            return {"illust": {"id": illust_id}}
+
+        monkeypatch.setattr("app.routes.illust.call_upstream", fake_upstream)
+        yield calls
+        response_cache.clear()
+
+    def test_results_in_order_with_cache(self, client, api_key, calls):
+        client.get("/api/illusts?ids=1")
+        r = client.post("/api/illusts", json={"ids": [2, 1, 404, 2, 500]})
+        assert r.status_code == 200
+        data = r.get_json()
+        assert data["cached"] == 1
+        assert data["results"] == [
+            {"id": 2, "illust": {"id": 2}},
+            {"id": 1, "illust": {"id": 1}},
+            {"id": 404, "error": {"message": "not found"}},
+            {"id": 500, "error": "boom"},
+        ]
+        assert sorted(calls) == [1, 2, 404, 500]
+
+    def test_all_unavailable(self, client, api_key, calls, monkeypatch):
+        def unavailable(*args):
+            raise NoAvailableAccount()
+
+        monkeypatch.setattr("app.routes.illust.call_upstream", unavailable)
+        r = client.get("/api/illusts?ids=7,8")
+        assert r.status_code == 503
+
+    def test_endpoint_rules_apply(self, client, api_key, calls):
+        """黑名单禁止 /api/illust/* 的 Key 不能通过批量接口获取插画详情"""
+        api_key.denied_endpoints = ["/api/illust/*"]
+        api_key.compile_rules()
+        assert client.get("/api/illusts?ids=5,6").status_code == 403
+
+        # 白名单只允许批量接口本身同样不够
+        api_key.access_mode = "whitelist"
+        api_key.allowed_endpoints = ["/api/illusts"]
+        api_key.compile_rules()
+        assert client.get("/api/illusts?ids=5").status_code == 403
+        assert calls == []
+
+    def test_charged_per_cache_miss(self, client, api_key, calls, key_limiter):
+        """每个未命中缓存的 ID 计一次上游调用，额度不足时整体返回 429 且不请求上游"""
+        api_key.daily_quota = 4
+        assert client.get("/api/illusts?ids=1,2,3").status_code == 200
+
+        # 缓存命中不计费：1、2 命中，只有 4 未命中，请求本身计 1 次
+        assert client.get("/api/illusts?ids=1,2,4").status_code == 200
+        r = client.get("/api/illusts?ids=5,6")
+        assert r.status_code == 429
+        assert "quota" in r.get_json()["error"]
+        assert "Retry-After" in r.headers
+        assert sorted(calls) == [1, 2, 3, 4]
+
+    def test_invalid_ids(self, client, api_key):
+        assert client.get("/api/illusts?ids=a").status_code == 400
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,275 @@
+"""
+响应缓存单元测试
+"""
+import pytest
+import sys
+import os
+import threading
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from app.cache import CacheEntry, MemoryCacheBackend, ResponseCache, cached_json, response_cache
+from app.image_cache import ImageCache
+from app.singleflight import SingleFlight
+
+
+class TestMemoryCacheBackend:
+    """测试 LRU 缓存后端"""
+
+    def test_lru_eviction(self):
+        """超出容量时淘汰最久未使用的条目"""
+        backend = MemoryCacheBackend(max_entries=2)
+        backend.set("a", CacheEntry(1, b"1", float("inf")))
+        backend.set("b", CacheEntry(2, b"2", float("inf")))
+        assert backend.get("a") is not None  # a 变为最近使用
+        backend.set("c", CacheEntry(3, b"3", float("inf")))
+        assert backend.get("b") is None
+        assert backend.get("a") is not None
+        assert backend.get("c") is not None
+        assert backend.evictions == 1
+
+    def test_expired_entry_is_miss(self):
+        """过期条目视为未命中"""
+        backend = MemoryCacheBackend()
+        backend.set("a", CacheEntry(1, b"1", 0))
+        assert backend.get("a") is None
+        stats = backend.stats()
+        assert stats["misses"] == 1
+        assert stats["expirations"] == 1
+        assert stats["entries"] == 0
+
+
+class TestResponseCache:
+    """测试响应缓存"""
+
+    def test_make_key_normalizes_params(self):
+        """参数顺序不影响缓存键"""
+        a = ResponseCache.make_key("ranking", {"mode": "day", "offset": 0})
+        b = ResponseCache.make_key("ranking", {"offset": 0, "mode": "day"})
+        assert a == b
+        assert a != ResponseCache.make_key("ranking", {"mode": "week", "offset": 0})
+
+
+class TestCachedJson:
+    """测试缓存路由辅助函数"""
+
+    @pytest.fixture
+    def app(self):
+        response_cache.backend = MemoryCacheBackend()
+        response_cache.enabled = True
+        response_cache.ttls = {"illust_detail": 60}
+        return Flask(__name__)
+
+    def test_hit_and_miss(self, app):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return {"illust": {"id": 1}}
+
+        with app.test_request_context("/api/illust/1"):
+            first = cached_json("illust_detail", {"illust_id": 1}, fetch)
+            second = cached_json("illust_detail", {"illust_id": 1}, fetch)
+
+        assert first.headers["X-Cache"] == "MISS"
+        assert second.headers["X-Cache"] == "HIT"
+        assert second.get_json() == {"illust": {"id": 1}}
+        assert len(calls) == 1
+
+    def test_error_result_not_cached(self, app):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return {"error": {"message": "not found"}}
+
+        with app.test_request_context("/api/illust/2"):
+            cached_json("illust_detail", {"illust_id": 2}, fetch)
+            second = cached_json("illust_detail", {"illust_id": 2}, fetch)
+
+        assert second.headers["X-Cache"] == "MISS"
+        assert len(calls) == 2
+
+    def test_endpoint_without_ttl_not_cached(self, app):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return {"illusts": []}
+
+        with app.test_request_context("/api/search"):
+            cached_json("search", {"word": "a"}, fetch)
+            cached_json("search", {"word": "a"}, fetch)
+
+        assert len(calls) == 2
+
+    def test_keyed_by_pool_restriction(self, app, monkeypatch):
+        """限定账号的 Key 不读取其他账号取得的缓存；使用全部账号的 Key 之间共享"""
+        from flask import g
+
+        restrictions = {
+            "all1": ("all", []), "all2": ("all", []),
+            "ab": ("specific", ["b", "a"]), "ba": ("specific", ["a", "b"]), "c": ("specific", ["c"]),
+        }
+        monkeypatch.setattr("app.upstream.key_manager.get_allowed_accounts", lambda key: restrictions[key])
+        calls = []
+
+        def fetch():
+            calls.append(g.api_key_value)
+            return {"illust": {"id": 1}}
+
+        statuses = []
+        for key_value in ("all1", "all2", "ab", "ba", "c"):
+            with app.test_request_context("/api/illust/1"):
+                g.api_key_value = key_value
+                statuses.append(cached_json("illust_detail", {"illust_id": 1}, fetch).headers["X-Cache"])
+
+        assert statuses == ["MISS", "HIT", "MISS", "HIT", "MISS"]
+        assert calls == ["all1", "ab", "c"]
+
+
+class TestSingleFlight:
+    """测试并发请求合并"""
+
+    def test_concurrent_calls_coalesced(self):
+        """并发的相同调用只执行一次"""
+        sf = SingleFlight()
+        calls = []
+        results = []
+        gate = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            gate.wait(1)
+            return {"id": 1}
+
+        threads = [threading.Thread(target=lambda: results.append(sf.do("k", fetch))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        # 等待所有线程进入等待状态
+        deadline = time.time() + 1
+        while sf.coalesced < 7 and time.time() < deadline:
+            time.sleep(0.005)
+        gate.set()
+        for t in threads:
+            t.join()
+
+        assert len(calls) == 1
+        assert results == [{"id": 1}] * 8
+        assert sf.stats() == {"in_flight": 0, "executed": 1, "coalesced": 7}
+
+    def test_error_propagates_to_waiters(self):
+        """调用异常传递给所有等待者，之后的调用重新执行"""
+        sf = SingleFlight()
+        gate = threading.Event()
+        errors = []
+
+        def failing():
+            gate.wait(1)
+            raise ValueError("upstream")
+
+        def worker():
+            try:
+                sf.do("k", failing)
+            except ValueError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=worker) for _ in range(3)]
+        for t in threads:
+            t.start()
+        deadline = time.time() + 1
+        while sf.coalesced < 2 and time.time() < deadline:
+            time.sleep(0.005)
+        gate.set()
+        for t in threads:
+            t.join()
+
+        assert errors == ["upstream"] * 3
+        assert sf.do("k", lambda: "ok") == "ok"
+
+
+class TestImageCache:
+    """测试图片磁盘缓存"""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        cache = ImageCache()
+        cache.enabled = True
+        cache.root = tmp_path
+        cache.max_bytes = 250
+        (tmp_path / "tmp").mkdir()
+        return cache
+
+    def _store(self, cache, url, size):
+        tmp = cache.new_temp_path()
+        tmp.write_bytes(b"x" * size)
+        cache.commit(url, tmp, "image/png")
+
+    def test_commit_and_lookup(self, cache):
+        url = "https://i.pximg.net/img-original/1_p0.png"
+        assert cache.lookup(url) is None
+        self._store(cache, url, 100)
+        path, content_type = cache.lookup(url)
+        assert path.read_bytes() == b"x" * 100
+        assert path.suffix == ".png"
+        assert content_type == "image/png"
+
+    def test_lru_eviction_by_size(self, cache):
+        self._store(cache, "u1", 100)
+        self._store(cache, "u2", 100)
+        cache.lookup("u1")  # u1 变为最近使用
+        self._store(cache, "u3", 100)
+        assert cache.lookup("u2") is None
+        assert cache.lookup("u1") is not None
+        stats = cache.stats()
+        assert stats["evictions"] == 1
+        assert stats["bytes_stored"] == 200
+
+    def test_index_survives_restart(self, cache, tmp_path):
+        self._store(cache, "u1", 100)
+        cache.save_index(force=True)
+
+        restarted = ImageCache()
+        restarted.enabled = True
+        restarted.root = tmp_path
+        restarted.max_bytes = 250
+        restarted._load_index()
+        assert restarted.lookup("u1") is not None
+        assert restarted.total_bytes == 100
+
+    def test_workers_share_index_and_limit(self, cache, tmp_path):
+        """多个 worker 共用同一个索引，容量上限按整个缓存目录计算"""
+        other = ImageCache()
+        other.enabled = True
+        other.root = tmp_path
+        other.max_bytes = 250
+        self._store(cache, "u1", 100)
+        self._store(other, "u2", 100)
+        assert other.lookup("u1") is not None
+        other.save_index(force=True)
+        self._store(cache, "u3", 100)
+        # u2 最久未使用，由另一个进程淘汰
+        assert cache.lookup("u2") is None
+        assert other.lookup("u1") is not None
+        assert cache.total_bytes == other.total_bytes == 200
+
+    def test_legacy_index_migrated(self, cache, tmp_path):
+        import json
+
+        (tmp_path / "ab" / "cd").mkdir(parents=True)
+        (tmp_path / "ab" / "cd" / "abcd.png").write_bytes(b"x" * 10)
+        (tmp_path / "index.json").write_text(json.dumps([
+            ["abcd", {"path": "ab/cd/abcd.png", "size": 10, "content_type": "image/png", "atime": 1}],
+            ["gone", {"path": "ab/cd/gone.png", "size": 10, "content_type": "image/png", "atime": 2}],
+        ]))
+        cache._load_index()
+        assert cache.stats()["entries"] == 1
+        assert not (tmp_path / "index.json").exists()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
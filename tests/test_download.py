@@ -0,0 +1,177 @@
+"""
+图片下载接口单元测试
+"""
+import pytest
+import sys
+import os
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.image_cache import image_cache
+from app.pool import PixivAccount, pool
+
+
+class FakeRaw:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.decode_content = None
+        self.sent = 0
+
+    def stream(self, size, decode_content=False):
+        self.decode_content = decode_content
+        for chunk in self.chunks:
+            self.sent += 1
+            yield chunk
+
+
+class FakeUpstream:
+    def __init__(self, status_code=200, chunks=(b"image",), headers=None):
+        self.status_code = status_code
+        self.headers = {"Content-Type": "image/jpeg", **(headers or {})}
+        self.raw = FakeRaw(list(chunks))
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestDownload:
+    @pytest.fixture
+    def setup(self, client, monkeypatch):
+        account = PixivAccount("dl")
+        account.authenticated = True
+        calls = []
+        responses = []
+
+        def requests_call(method, url, headers=None, stream=False):
+            calls.append(headers)
+            return responses.pop(0)
+
+        account.api.requests_call = requests_call
+        monkeypatch.setattr(pool, "accounts", [account])
+        pool.selector.invalidate()
+        monkeypatch.setattr(image_cache, "enabled", False)
+        yield client, account, responses, calls
+        pool.selector.invalidate()
+
+    def get(self, client, headers=None):
+        return client.get("/api/download?url=https://i.pximg.net/img/1_p0.jpg", headers=headers or {})
+
+    def test_half_open_probe_released(self, setup):
+        """熔断打开的账号超时后被下载请求选中，探测结果计入熔断器，不会一直停在 half_open"""
+        client, account, responses, _ = setup
+        account.breaker._open()
+        account.breaker.opened_at = time.time() - account.breaker.reset_timeout - 1
+
+        responses.append(FakeUpstream(500))
+        assert self.get(client).status_code == 500
+        assert (account.breaker.state, account.breaker.probes_inflight) == ("open", 0)
+
+        account.breaker.opened_at = time.time() - account.breaker.reset_timeout - 1
+        responses.append(FakeUpstream(200))
+        r = self.get(client)
+        assert r.data == b"image"
+        assert (account.breaker.state, account.breaker.probes_inflight) == ("closed", 0)
+        assert account.inflight == 0
+
+    def test_admission_gates_downloads(self, setup, monkeypatch):
+        """下载经过准入控制：池饱和时返回 503，名额在响应关闭后归还"""
+        from app.admission import AdmissionController
+
+        client, _, responses, _ = setup
+        controller = AdmissionController()
+        controller.enabled = True
+        controller.max_concurrent = 1
+        controller.max_queue = 0
+        monkeypatch.setattr("app.upstream.admission", controller)
+        monkeypatch.setattr("app.routes.illust.admission", controller)
+
+        holder = controller.acquire("other")
+        r = self.get(client)
+        assert r.status_code == 503
+        assert r.headers["Retry-After"] == "1"
+        controller.release(holder)
+
+        responses.append(FakeUpstream(200))
+        r = self.get(client)
+        assert controller.stats()["in_flight"] == 1
+        assert r.data == b"image"
+        r.close()
+        assert controller.stats()["in_flight"] == 0
+
+    def test_cached_file_evicted_before_send(self, setup, monkeypatch, tmp_path):
+        """查找命中后文件被其他 worker 淘汰时，回退到上游下载而不是返回 500"""
+        client, _, responses, _ = setup
+        monkeypatch.setattr(image_cache, "enabled", True)
+        monkeypatch.setattr(image_cache, "lookup", lambda url: (tmp_path / "gone.jpg", "image/jpeg"))
+        monkeypatch.setattr(image_cache, "new_temp_path", lambda: tmp_path / "dl.part")
+        monkeypatch.setattr(image_cache, "commit", lambda url, path, content_type: None)
+
+        responses.append(FakeUpstream(200))
+        r = self.get(client)
+        assert r.status_code == 200
+        assert r.data == b"image"
+        assert r.headers["X-Cache"] == "MISS"
+
+    def test_chunks_passed_through(self, setup):
+        """按块转发：不解码 Content-Encoding，头部原样透传，上游请求带 Referer"""
+        client, _, responses, calls = setup
+        upstream = FakeUpstream(200, [b"ab", b"cd", b"ef"], {
+            "Content-Length": "6", "Content-Encoding": "gzip", "ETag": '"v1"', "X-Internal": "x"})
+        responses.append(upstream)
+        r = client.get("/api/download?url=https://i.pximg.net/img/1_p0.jpg", buffered=False)
+        assert next(r.response) == b"ab"
+        assert upstream.raw.sent == 1
+        assert b"".join(r.response) == b"cdef"
+        r.close()
+        assert upstream.raw.decode_content is False
+        assert (r.headers["Content-Encoding"], r.headers["ETag"]) == ("gzip", '"v1"')
+        assert r.headers["Content-Length"] == "6"
+        assert "X-Internal" not in r.headers
+        assert calls[0]["Referer"] == "https://app-api.pixiv.net/"
+        assert upstream.closed
+
+    def test_range_request(self, setup, monkeypatch):
+        """Range 请求透传给上游，206 部分响应原样返回且不写入缓存"""
+        client, _, responses, calls = setup
+        monkeypatch.setattr(image_cache, "enabled", True)
+        monkeypatch.setattr(image_cache, "lookup", lambda url: None)
+        monkeypatch.setattr(image_cache, "new_temp_path", lambda: pytest.fail("partial content cached"))
+        responses.append(FakeUpstream(206, [b"ima"], {"Content-Range": "bytes 0-2/5", "Content-Length": "3"}))
+        r = self.get(client, {"Range": "bytes=0-2", "If-Range": '"v1"'})
+        assert r.status_code == 206
+        assert r.data == b"ima"
+        assert r.headers["Content-Range"] == "bytes 0-2/5"
+        assert "X-Cache" not in r.headers
+        assert (calls[0]["Range"], calls[0]["If-Range"]) == ("bytes=0-2", '"v1"')
+
+    def test_client_disconnect_closes_upstream(self, setup, monkeypatch, tmp_path):
+        """客户端中途断开：关闭上游连接，不完整的缓存文件被丢弃"""
+        client, account, responses, _ = setup
+        committed = []
+        monkeypatch.setattr(image_cache, "enabled", True)
+        monkeypatch.setattr(image_cache, "lookup", lambda url: None)
+        monkeypatch.setattr(image_cache, "new_temp_path", lambda: tmp_path / "dl.part")
+        monkeypatch.setattr(image_cache, "commit", lambda *args: committed.append(args))
+        upstream = FakeUpstream(200, [b"a"] * 10)
+        responses.append(upstream)
+        r = client.get("/api/download?url=https://i.pximg.net/img/1_p0.jpg", buffered=False)
+        assert next(r.response) == b"a"
+        r.close()
+        assert upstream.closed
+        assert upstream.raw.sent == 1
+        assert committed == []
+        assert not (tmp_path / "dl.part").exists()
+        assert account.inflight == 0
+
+        # 响应体开始之前断开，同样释放上游连接
+        upstream = FakeUpstream(200, [b"a"])
+        responses.append(upstream)
+        client.get("/api/download?url=https://i.pximg.net/img/1_p0.jpg", buffered=False).close()
+        assert upstream.closed
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
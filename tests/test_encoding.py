@@ -0,0 +1,106 @@
+"""
+JSON 序列化与响应压缩单元测试
+"""
+import gzip
+import json
+import pytest
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+
+from app.cache import MemoryCacheBackend, cached_json, response_cache
+from app.encoding import ENCODERS, Compressor, compress_response, compressor
+
+PAGE = {"illusts": [{"id": i, "title": f"作品 {i}", "tags": [{"name": "タグ"}]} for i in range(100)]}
+
+
+class TestOrjsonProvider:
+    @pytest.fixture
+    def app(self):
+        pytest.importorskip("orjson")
+        from app.encoding import OrjsonProvider
+
+        app = Flask(__name__)
+        app.json = OrjsonProvider(app)
+        return app
+
+    def test_matches_stdlib(self, app):
+        value = {"b": [1, 2.5, None, True], "a": {"1": "作品"}}
+        with app.app_context():
+            body = app.json.dumps(value)
+            assert json.loads(body) == value
+            assert body.startswith('{"a"')  # 与 Flask 默认一样按键排序
+            assert app.json.response(value).get_json() == value
+
+    def test_falls_back_for_unsupported_values(self, app):
+        with app.app_context():
+            assert json.loads(app.json.dumps({"n": 2 ** 70})) == {"n": 2 ** 70}
+            assert "\n  " in app.json.dumps({"a": 1}, indent=2)
+
+
+class TestCompressor:
+    def test_negotiate(self):
+        c = Compressor()
+        assert c.negotiate("gzip, deflate") == "gzip"
+        assert c.negotiate("identity") is None
+        assert c.negotiate("gzip;q=0") is None
+        assert c.negotiate("*") in ENCODERS
+        assert c.negotiate("") is None
+
+    def test_threshold_and_memo(self, monkeypatch):
+        c = Compressor()
+        assert c.encode(b"x" * 10, "gzip") == (b"x" * 10, None)
+        calls = []
+        monkeypatch.setitem(ENCODERS, "gzip", lambda data, level: calls.append(1) or gzip.compress(data))
+        memo = {}
+        first = c.encode(b"x" * 4096, "gzip", memo)
+        second = c.encode(b"x" * 4096, "gzip", memo)
+        assert first == second
+        assert gzip.decompress(first[0]) == b"x" * 4096
+        assert len(calls) == 1
+
+
+class TestCompressedResponses:
+    @pytest.fixture
+    def app(self, monkeypatch):
+        monkeypatch.setattr(compressor, "enabled", True)
+        monkeypatch.setattr(compressor, "min_size", 1024)
+        response_cache.backend = MemoryCacheBackend()
+        response_cache.enabled = True
+        response_cache.ttls = {"ranking": 60}
+        app = Flask(__name__)
+        app.after_request(compress_response)
+
+        @app.route("/page")
+        def page():
+            return jsonify(PAGE)
+
+        @app.route("/cached")
+        def cached():
+            return cached_json("ranking", {"mode": "day"}, lambda: PAGE)
+
+        return app
+
+    def test_jsonify_compressed(self, app):
+        client = app.test_client()
+        r = client.get("/page", headers={"Accept-Encoding": "gzip"})
+        assert r.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in r.headers["Vary"]
+        assert json.loads(gzip.decompress(r.data)) == PAGE
+        assert "Content-Encoding" not in client.get("/page").headers
+
+    def test_cache_hit_reuses_compressed_body(self, app, monkeypatch):
+        client = app.test_client()
+        client.get("/cached", headers={"Accept-Encoding": "gzip"})
+        monkeypatch.setitem(ENCODERS, "gzip", lambda data, level: pytest.fail("recompressed"))
+        r = client.get("/cached", headers={"Accept-Encoding": "gzip"})
+        assert r.headers["X-Cache"] == "HIT"
+        assert json.loads(gzip.decompress(r.data)) == PAGE
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
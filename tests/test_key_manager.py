@@ -4,11 +4,14 @@ API Key Manager 单元测试
 import pytest
 import sys
 import os
+import time
 
 # 添加项目根目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.key_manager import APIKey, KeyManager
+from app.key_limits import KeyLimiter, KeyLimitExceeded, QUOTA_EXCEEDED, RATE_LIMIT_EXCEEDED
+from app.endpoint_matcher import EndpointMatcher, normalize_endpoint
 
 
 class TestAPIKey:
@@ -236,6 +239,216 @@ class TestAccessControl:
         allowed, error = manager.check_access(key.key, "/api/illust/12345")
         assert allowed is True
 
+    def test_wildcard_requires_segment_boundary(self, manager):
+        """测试通配符仅匹配以前缀开头的路径"""
+        key, _ = manager.create_key(
+            "test",
+            access_mode="whitelist",
+            allowed_endpoints=["/api/user/*"]
+        )
+        assert manager.check_access(key.key, "/api/user/123/illusts")[0] is True
+        assert manager.check_access(key.key, "/api/users")[0] is False
+        assert manager.check_access(key.key, "/api/user")[0] is False
+
+    def test_update_key_recompiles_rules(self, manager):
+        """测试更新端点列表后匹配器重新编译"""
+        key, _ = manager.create_key(
+            "test",
+            access_mode="blacklist",
+            denied_endpoints=["/api/download"]
+        )
+        manager.update_key("test", denied_endpoints=["/api/search"])
+        assert manager.check_access(key.key, "/api/download")[0] is True
+        assert manager.check_access(key.key, "/api/search")[0] is False
+
+
+class TestEndpointMatcher:
+    """测试预编译端点匹配器"""
+
+    def test_exact_and_wildcard(self):
+        matcher = EndpointMatcher(["/api/search", "/api/pool/*"])
+        assert matcher.match("/api/search")
+        assert matcher.match("/api/pool/status")
+        assert matcher.match("/api/pool/")
+        assert not matcher.match("/api/pool")
+        assert not matcher.match("/api/searchx")
+
+    def test_root_wildcard(self):
+        matcher = EndpointMatcher(["/*"])
+        assert matcher.match("/api/illust/<id>")
+
+    def test_normalize_endpoint(self):
+        assert normalize_endpoint("/api/user/42/illusts") == "/api/user/<id>/illusts"
+        assert normalize_endpoint("/api/search?word=1") == "/api/search"
+
+
+class TestConfigReload:
+    """测试基于文件签名的按需重新加载"""
+
+    @pytest.fixture
+    def manager(self, tmp_path, monkeypatch):
+        """使用临时配置文件的 KeyManager"""
+        from app.config import config
+
+        config_path = tmp_path / "config.yaml"
+        config_path.write_text(
+            "api_keys:\n"
+            "- name: first\n"
+            "  key: pk_first\n",
+            encoding="utf-8",
+        )
+        monkeypatch.setattr(config, "_config_path", str(config_path))
+        config.reload()
+
+        KeyManager._instance = None
+        km = KeyManager()
+        km.load_from_config(config.api_keys)
+        return km, config_path
+
+    def test_no_reload_when_unchanged(self, manager):
+        """配置文件未变化时不重新解析"""
+        km, _ = manager
+        for _ in range(100):
+            allowed, _ = km.check_access("pk_first", "/api/search")
+            assert allowed is True
+        assert km.reload_count == 0
+
+    def test_reload_when_file_changes(self, manager, api_app, admin_headers, monkeypatch):
+        """配置文件变化后重新加载一次"""
+        km, config_path = manager
+        config_path.write_text(
+            "api_keys:\n"
+            "- name: second\n"
+            "  key: pk_second_key\n",
+            encoding="utf-8",
+        )
+        allowed, _ = km.check_access("pk_second_key", "/api/search")
+        assert allowed is True
+        allowed, error = km.check_access("pk_first", "/api/search")
+        assert allowed is False
+        assert "Invalid" in error
+        assert km.reload_count == 1
+        assert km.get_key_by_name("second").key == "pk_second_key"
+
+        # 管理接口展示热加载次数和时间
+        monkeypatch.setattr("app.routes.key_routes.key_manager", km)
+        r = api_app.test_client().get("/api/keys", headers=admin_headers)
+        reload = r.get_json()["reload"]
+        assert reload["count"] == 1
+        assert time.time() - 5 < reload["last_reload_at"] <= time.time()
+
+    def test_invalidate_forces_reload(self, manager):
+        """invalidate 后下次检查强制重新加载"""
+        km, _ = manager
+        km.invalidate()
+        km.check_access("pk_first", "/api/search")
+        km.check_access("pk_first", "/api/search")
+        assert km.reload_count == 1
+
+    def test_own_save_does_not_reload(self, manager):
+        """自身保存的变更不会触发重新加载"""
+        km, _ = manager
+        key, _ = km.create_key("created")
+        allowed, _ = km.check_access(key.key, "/api/search")
+        assert allowed is True
+        assert km.reload_count == 0
+
+
+class TestKeyLimits:
+    """测试每个 Key 的限流与每日配额"""
+
+    def test_limits_roundtrip(self):
+        key = APIKey.from_dict({"name": "a", "key": "pk_a", "rate_limit": 5, "burst": 10, "daily_quota": 100})
+        assert (key.rate_limit, key.burst, key.daily_quota) == (5, 10, 100)
+        assert APIKey.from_dict(key.to_dict()).daily_quota == 100
+
+    def test_invalid_limits_rejected(self):
+        KeyManager._instance = None
+        km = KeyManager()
+        km._keys = []
+        km._save_to_config = lambda: None
+        key, error = km.create_key("a", rate_limit=-1)
+        assert key is None and "rate_limit" in error
+
+    def test_rate_limit_with_burst(self):
+        limiter = KeyLimiter()
+        key = APIKey(name="a", key="pk_a", rate_limit=1, burst=3)
+        assert [limiter.check(key) for _ in range(3)] == [None, None, None]
+        error, retry_after = limiter.check(key)
+        assert "rate limit" in error
+        assert 0 < retry_after <= 1
+
+    def test_daily_quota(self):
+        limiter = KeyLimiter()
+        key = APIKey(name="a", key="pk_a", daily_quota=2)
+        assert limiter.check(key) is None
+        assert limiter.check(key) is None
+        error, retry_after = limiter.check(key)
+        assert "quota" in error
+        assert 0 < retry_after <= 86400
+        assert limiter.usage_today("a") == 2
+
+    def test_cost_charged(self):
+        """按上游调用次数计费：cost 超过剩余令牌时限流，超出每日配额时拒绝且不计入"""
+        limiter = KeyLimiter()
+        key = APIKey(name="a", key="pk_a", rate_limit=1, burst=4, daily_quota=10)
+        assert limiter.check(key, cost=3) is None
+        error, retry_after = limiter.check(key, cost=2)
+        assert error == RATE_LIMIT_EXCEEDED
+        assert 0 < retry_after <= 1
+
+        key.rate_limit = 0
+        assert limiter.check(key, cost=6) is None
+        assert limiter.check(key, cost=2)[0] == QUOTA_EXCEEDED
+        assert limiter.usage_today("a") == 9
+        assert limiter.check(key) is None
+
+    def test_cost_over_burst_overdraws(self):
+        """cost 超过突发容量时要求令牌桶已满，透支部分由之后的请求等待补充"""
+        limiter = KeyLimiter()
+        key = APIKey(name="a", key="pk_a", rate_limit=2, burst=2)
+        assert limiter.check(key, cost=5) is None
+        error, retry_after = limiter.check(key)
+        assert error == RATE_LIMIT_EXCEEDED
+        assert retry_after > 1.5
+
+    def test_charge_blocking(self, monkeypatch):
+        """后台线程计费：限流时等待，超出配额时抛出 KeyLimitExceeded"""
+        limiter = KeyLimiter()
+        key = APIKey(name="a", key="pk_a", rate_limit=1, burst=1, daily_quota=2)
+        sleeps = []
+
+        def sleep(seconds):
+            # 代替等待：直接补充令牌
+            sleeps.append(seconds)
+            limiter.buckets["a"][1].consume(-1)
+
+        monkeypatch.setattr("app.key_limits.time.sleep", sleep)
+        limiter.charge_blocking(key)
+        limiter.charge_blocking(key)
+        assert len(sleeps) == 1
+        with pytest.raises(KeyLimitExceeded):
+            limiter.charge_blocking(key)
+
+    def test_usage_flushed_in_batches_and_shared(self, tmp_path, monkeypatch):
+        """多个 worker 写入同一数据库，flush 后各自看到合计用量"""
+        from app.config import config
+
+        monkeypatch.setitem(config._data, "key_limits", {"usage_db": str(tmp_path / "usage.db")})
+        monkeypatch.setattr("threading.Thread.start", lambda self: None)
+        key = APIKey(name="a", key="pk_a", daily_quota=5)
+        first, second = KeyLimiter(), KeyLimiter()
+        first.start()
+        second.start()
+        for _ in range(3):
+            first.check(key)
+        first.flush()
+        second.flush()
+        assert second.usage_today("a") == 3
+        assert second.check(key) is None
+        assert second.check(key) is None
+        assert second.check(key) is not None
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,111 @@
+"""
+Prometheus 指标单元测试
+"""
+import pytest
+import sys
+import os
+import threading
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.metrics import BUCKETS, Metrics
+
+
+class TestMetrics:
+    def test_threads_merged_and_retired(self):
+        """各线程写入自己的分片，抓取时合并；退出线程的数据保留"""
+        m = Metrics()
+
+        def work():
+            for _ in range(100):
+                m.observe("pixiv_upstream_request_duration_seconds", ("illust_detail", "ok"), 0.02)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        m.observe("pixiv_upstream_request_duration_seconds", ("illust_detail", "ok"), 100)
+
+        for _ in range(2):
+            series = m.snapshot()[("pixiv_upstream_request_duration_seconds", ("illust_detail", "ok"))]
+            assert series[BUCKETS.index(0.025)] == 400
+            assert series[len(BUCKETS)] == 1  # +Inf
+            assert series[-1] == pytest.approx(108)
+        assert len(m._shards) == 1
+
+    def test_render_cumulative_buckets(self, monkeypatch):
+        monkeypatch.setattr("app.metrics.collect_state", lambda: [
+            ("pixiv_account_inflight", "gauge", "In flight", [([("account", 'a"b')], 2)]),
+        ])
+        m = Metrics()
+        m.observe("pixiv_key_check_duration_seconds", ("allowed",), 0.0005)
+        m.observe("pixiv_key_check_duration_seconds", ("allowed",), 0.003)
+        text = m.render()
+        assert 'pixiv_key_check_duration_seconds_bucket{result="allowed",le="0.001"} 1' in text
+        assert 'pixiv_key_check_duration_seconds_bucket{result="allowed",le="0.005"} 2' in text
+        assert 'pixiv_key_check_duration_seconds_bucket{result="allowed",le="+Inf"} 2' in text
+        assert 'pixiv_key_check_duration_seconds_count{result="allowed"} 2' in text
+        assert "# TYPE pixiv_token_refresh_duration_seconds histogram" in text
+        assert 'pixiv_account_inflight{account="a\\"b"} 2' in text
+
+    def test_observe_is_cheap(self):
+        m = Metrics()
+        labels = ("/api/illust/<int:illust_id>", "GET", "200")
+        m.observe("pixiv_http_request_duration_seconds", labels, 0.01)
+        start = time.perf_counter()
+        for _ in range(10000):
+            m.observe("pixiv_http_request_duration_seconds", labels, 0.01)
+        assert (time.perf_counter() - start) / 10000 < 20e-6
+
+    def test_multiprocess_merge(self, monkeypatch, tmp_path):
+        """多 worker：直方图跨 worker 相加（含已退出的 worker），状态值只输出存活 worker 并带 worker 标签"""
+        import json
+
+        monkeypatch.setattr("app.metrics.collect_state", lambda: [
+            ("pixiv_account_inflight", "gauge", "In flight", [([("account", "a")], 1)]),
+        ])
+        labels = ["illust_detail", "ok"]
+        series = [0] * (len(BUCKETS) + 1) + [0.5]
+        series[BUCKETS.index(0.5)] = 1
+        dead = 2 ** 22 + 1
+        for pid in (os.getppid(), dead):
+            (tmp_path / f"{pid}.json").write_text(json.dumps({
+                "pid": pid,
+                "histograms": [["pixiv_upstream_request_duration_seconds", labels, series]],
+                "state": [["pixiv_account_inflight", "gauge", "In flight", [[[["account", "a"]], 3]]]],
+            }))
+        m = Metrics()
+        m.multiprocess_dir = str(tmp_path)
+        m.observe("pixiv_upstream_request_duration_seconds", ("illust_detail", "ok"), 0.5)
+        text = m.render()
+        assert 'pixiv_upstream_request_duration_seconds_count{method="illust_detail",outcome="ok"} 3' in text
+        assert f'pixiv_account_inflight{{worker="{os.getpid()}",account="a"}} 1' in text
+        assert f'pixiv_account_inflight{{worker="{os.getppid()}",account="a"}} 3' in text
+        assert f'worker="{dead}"' not in text
+        assert text.count("# TYPE pixiv_account_inflight gauge") == 1
+
+        Metrics.reset_multiprocess(str(tmp_path))
+        assert os.listdir(tmp_path) == []
+
+
+    def test_requires_admin_token(self, admin_headers, monkeypatch):
+        from flask import Flask
+        from app.config import config
+        from app.metrics import install_metrics
+
+        monkeypatch.setitem(config._data, "metrics", {"enabled": True, "require_auth": True})
+        monkeypatch.setattr("app.metrics.collect_state", lambda: [])
+        app = Flask(__name__)
+        install_metrics(app)
+        client = app.test_client()
+        assert client.get("/metrics").status_code == 401
+        r = client.get("/metrics", headers=admin_headers)
+        assert r.status_code == 200
+        assert 'route="/metrics",method="GET",status="401"' in r.data.decode()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,99 @@
+"""
+分页遍历（?all=true）单元测试
+"""
+import json
+import pytest
+import sys
+import os
+import threading
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.key_limits import QUOTA_EXCEEDED
+from app.pagination import walk
+
+
+def make_page(offset, size=3, last=None):
+    """构造一页结果，next_url 指向下一个 offset"""
+    page = {"illusts": [{"id": offset + i} for i in range(size)], "next_url": None}
+    if last is None or offset + size < last:
+        page["next_url"] = f"https://app-api.pixiv.net/v1/search/illust?word=a&offset={offset + size}"
+    return page
+
+
+class TestWalk:
+    def test_follows_next_url_until_limit(self):
+        calls = []
+
+        def fetch(kwargs):
+            calls.append(kwargs)
+            return make_page(int(kwargs["offset"]))
+
+        items = list(walk(make_page(0), fetch, limit=7))
+        assert [item["id"] for item in items] == list(range(7))
+        assert calls[0] == {"word": "a", "offset": "3"}
+        assert len(calls) == 2
+
+    def test_stops_at_last_page(self):
+        items = list(walk(make_page(0, last=6), lambda kwargs: make_page(int(kwargs["offset"]), last=6), 100))
+        assert len(items) == 6
+
+    def test_error_ends_stream(self):
+        def fetch(kwargs):
+            raise RuntimeError("boom")
+
+        items = list(walk(make_page(0), fetch, 100))
+        assert items[-1] == {"error": "boom"}
+        assert len(items) == 4
+
+    def test_prefetch_bounded_and_stops_on_close(self):
+        """消费端暂停时最多预取一页，关闭后预取线程退出"""
+        calls = []
+
+        def fetch(kwargs):
+            calls.append(kwargs)
+            return make_page(int(kwargs["offset"]))
+
+        before = threading.active_count()
+        stream = walk(make_page(0), fetch, 10 ** 6)
+        next(stream)
+        time.sleep(0.2)
+        assert len(calls) <= 2
+        stream.close()
+        time.sleep(0.7)
+        assert threading.active_count() == before
+
+
+class TestStreamRoute:
+    def test_ndjson_response(self, client, monkeypatch):
+        def fake_upstream(key_value, strategy, method, *args, **kwargs):
+            return make_page(int(kwargs.get("offset") or 0), last=9)
+
+        monkeypatch.setattr("app.pagination.call_upstream", fake_upstream)
+        r = client.get("/api/search?word=a&all=true&limit=8")
+        assert r.mimetype == "application/x-ndjson"
+        lines = [json.loads(line) for line in r.data.decode().splitlines()]
+        assert [line["id"] for line in lines] == list(range(8))
+
+    def test_pages_charged_to_key(self, client, api_key, key_limiter, monkeypatch):
+        """后续每一页计入 API Key 的配额，超出时输出错误行并结束"""
+        api_key.daily_quota = 2
+        calls = []
+
+        def fake_upstream(key_value, strategy, method, *args, **kwargs):
+            calls.append(kwargs)
+            return make_page(int(kwargs.get("offset") or 0))
+
+        monkeypatch.setattr("app.pagination.call_upstream", fake_upstream)
+        r = client.get("/api/search?word=a&all=true&limit=30")
+        lines = [json.loads(line) for line in r.data.decode().splitlines()]
+        assert [line["id"] for line in lines[:-1]] == list(range(6))
+        assert lines[-1] == {"error": QUOTA_EXCEEDED}
+        assert len(calls) == 2
+        assert key_limiter.usage_today("test") == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,643 @@
+"""
+账号池选择逻辑单元测试
+"""
+import pytest
+import sys
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ratelimit import TokenBucket
+from app.circuit import CircuitBreaker
+from app.shared_state import SharedState
+from app.transport import DEFAULT_SETTINGS, configure_session, connection_stats
+from app.selector import AccountSelector, AccountView
+
+
+class StubAccount:
+    """模拟 PixivAccount 中与选择相关的部分"""
+
+    def __init__(self, name, request_count=0, authenticated=True, refreshing=False):
+        self.name = name
+        self.request_count = request_count
+        self.authenticated = authenticated
+        self.refreshing = refreshing
+        self.inflight = 0
+        self.ewma_latency = 0.0
+
+    def can_serve(self):
+        return self.authenticated
+
+    def is_available(self):
+        return self.can_serve() and not self.refreshing
+
+    def record_request(self):
+        self.request_count += 1
+
+    def expected_cost(self):
+        return self.ewma_latency * (self.inflight + 1) if self.ewma_latency else self.inflight
+
+
+class TestAccountView:
+    """测试账号视图"""
+
+    def test_least_used_picks_min(self):
+        accounts = [StubAccount("a", 5), StubAccount("b", 1), StubAccount("c", 3)]
+        view = AccountView(accounts)
+        assert [view.least_used().name for _ in range(4)] == ["b", "b", "b", "c"]
+        counts = {a.name: a.request_count for a in accounts}
+        assert counts == {"a": 5, "b": 4, "c": 4}
+
+    def test_least_used_balances(self):
+        accounts = [StubAccount(str(i)) for i in range(10)]
+        view = AccountView(accounts)
+        for _ in range(1000):
+            view.least_used()
+        assert {a.request_count for a in accounts} == {100}
+
+    def test_least_used_sees_external_updates(self):
+        """其他视图选中账号后计数变化，本视图惰性更新"""
+        a, b = StubAccount("a"), StubAccount("b")
+        view = AccountView([a, b])
+        a.request_count = 10
+        assert view.least_used() is b
+
+    def test_skips_unavailable(self):
+        accounts = [
+            StubAccount("a", 0, authenticated=False),
+            StubAccount("b", 0, refreshing=True),
+            StubAccount("c", 50),
+        ]
+        view = AccountView(accounts)
+        assert view.least_used().name == "c"
+        assert view.round_robin().name == "c"
+
+    def test_unavailable_accounts_parked(self, monkeypatch):
+        """不可用的账号移出堆，之后的选择不再逐个检查；暂停期满后重新参与选择"""
+        accounts = [StubAccount(str(i), authenticated=False) for i in range(100)] + [StubAccount("ok", 1000)]
+        checks = []
+        for account in accounts:
+            account.is_available = lambda a=account: checks.append(a.name) or a.can_serve()
+        view = AccountView(accounts)
+        now = [1000.0]
+        monkeypatch.setattr("app.selector.time.monotonic", lambda: now[0])
+
+        assert view.least_used().name == "ok"
+        checks.clear()
+        for _ in range(10):
+            assert view.least_used().name == "ok"
+        assert checks == ["ok"] * 10
+
+        accounts[0].authenticated = True
+        assert view.least_used().name == "ok"
+        now[0] += view.PARK_SECONDS
+        assert view.least_used().name == "0"
+
+    def test_falls_back_to_refreshing(self):
+        accounts = [StubAccount("a", authenticated=False), StubAccount("b", refreshing=True)]
+        view = AccountView(accounts)
+        assert view.least_used().name == "b"
+        assert view.round_robin().name == "b"
+
+    def test_no_authenticated_account(self):
+        view = AccountView([StubAccount("a", authenticated=False)])
+        assert view.least_used() is None
+        assert view.round_robin() is None
+        assert AccountView([]).round_robin() is None
+
+    def test_least_cost_prefers_fast_account(self):
+        fast, slow = StubAccount("fast"), StubAccount("slow")
+        fast.ewma_latency, slow.ewma_latency = 0.1, 2.0
+        view = AccountView([fast, slow])
+        assert all(view.least_cost() is fast for _ in range(10))
+        # 进行中请求过多时转向另一个账号
+        fast.inflight = 30
+        assert view.least_cost() is slow
+
+    def test_least_cost_avoids_slow_accounts(self):
+        accounts = [StubAccount(str(i)) for i in range(10)]
+        for a in accounts:
+            a.ewma_latency = 0.1
+        accounts[0].ewma_latency = 5.0
+        view = AccountView(accounts)
+        for _ in range(1000):
+            view.least_cost()
+        assert accounts[0].request_count == 0
+
+    def test_round_robin_cycles(self):
+        accounts = [StubAccount(str(i)) for i in range(3)]
+        view = AccountView(accounts)
+        assert [view.round_robin().name for _ in range(6)] == ["0", "1", "2", "0", "1", "2"]
+
+
+class TestExpectedCost:
+    """没有延迟样本的账号按池的延迟估计计算开销，与有样本的账号单位一致"""
+
+    def test_prior_from_pool_median(self, monkeypatch):
+        from app.config import config
+        from app.pool import PixivAccount, pool
+
+        accounts = [PixivAccount(name) for name in ("a", "b", "c", "new")]
+        for account, latency in zip(accounts, (0.1, 0.3, 2.0, 0.0)):
+            account.ewma_latency = latency
+        monkeypatch.setattr(pool, "accounts", accounts)
+        monkeypatch.setattr(pool, "_latency_prior", None)
+        new = accounts[3]
+        assert new.expected_cost() == pytest.approx(0.3)
+        # 进行中请求数按同一延迟尺度放大，不会被当作秒数直接比较
+        new.inflight = 3
+        assert new.expected_cost() == pytest.approx(1.2)
+
+        monkeypatch.setitem(config._data, "load_balance", {"default_latency_ms": 200})
+        monkeypatch.setattr(pool, "accounts", [new])
+        monkeypatch.setattr(pool, "_latency_prior", None)
+        assert new.expected_cost() == pytest.approx(0.8)
+
+
+class TestAccountSelector:
+    """测试视图缓存"""
+
+    def test_specific_view_filters(self):
+        accounts = [StubAccount("a"), StubAccount("b"), StubAccount("c")]
+        selector = AccountSelector()
+        view = selector.view(accounts, ["b", "c"])
+        assert [a.name for a in view.accounts] == ["b", "c"]
+        assert selector.view(accounts, ["c", "b"]) is view
+        assert len(selector.view(accounts)) == 3
+
+    def test_rebuild_on_account_change(self):
+        accounts = [StubAccount("a")]
+        selector = AccountSelector()
+        view = selector.view(accounts)
+        accounts.append(StubAccount("b"))
+        assert selector.view(accounts) is not view
+        assert len(selector.view(accounts)) == 2
+
+
+class TestTokenBucket:
+    """测试令牌桶"""
+
+    def test_burst_then_empty(self):
+        bucket = TokenBucket(rate=1, burst=3)
+        assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+        assert 0 < bucket.retry_after() <= 1
+
+    def test_refill(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr("app.ratelimit.time.monotonic", lambda: now[0])
+        bucket = TokenBucket(rate=10, burst=5)
+        for _ in range(5):
+            bucket.consume()
+        assert not bucket.available()
+        now[0] += 0.25
+        assert bucket.try_acquire(2)
+        assert not bucket.try_acquire()
+
+    def test_consume_can_overdraw(self):
+        bucket = TokenBucket(rate=1, burst=1)
+        bucket.consume()
+        bucket.consume()
+        assert bucket.retry_after() > 1
+
+
+class TestCircuitBreaker:
+    """测试熔断器"""
+
+    def test_opens_on_consecutive_failures(self):
+        breaker = CircuitBreaker(consecutive_failures=3, min_requests=100)
+        breaker.record(False)
+        breaker.record(False)
+        assert breaker.state == CircuitBreaker.CLOSED
+        breaker.record(False)
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.available()
+        assert breaker.health() == 0
+
+    def test_opens_on_error_rate(self):
+        breaker = CircuitBreaker(window=10, min_requests=10, error_rate=0.5, consecutive_failures=100)
+        for _ in range(5):
+            breaker.record(True)
+            breaker.record(False)
+        assert breaker.state == CircuitBreaker.OPEN
+
+    def test_health_reflects_error_rate(self):
+        breaker = CircuitBreaker(window=4, min_requests=10)
+        for ok in (True, True, True, False):
+            breaker.record(ok)
+        assert breaker.health() == 0.75
+        breaker.record(True)  # 窗口滑动，最早的成功移出
+        assert breaker.health() == 0.75
+
+    def test_half_open_probe_recovers(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr("app.circuit.time.time", lambda: now[0])
+        breaker = CircuitBreaker(consecutive_failures=1, reset_timeout=30, probes=1)
+        breaker.record(False)
+        assert not breaker.available()
+        now[0] += 30
+        assert breaker.available()
+        breaker.on_selected()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        # 探测名额已被占用
+        assert not breaker.available()
+        breaker.record(True)
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.health() == 1.0
+
+    def test_half_open_probe_failure_reopens(self, monkeypatch):
+        now = [1000.0]
+        monkeypatch.setattr("app.circuit.time.time", lambda: now[0])
+        breaker = CircuitBreaker(consecutive_failures=1, reset_timeout=30)
+        breaker.record(False)
+        now[0] += 30
+        breaker.on_selected()
+        breaker.record(False)
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.available()
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTransport:
+    """测试上游 HTTP 传输配置"""
+
+    @pytest.fixture
+    def server_url(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield f"http://127.0.0.1:{server.server_port}/"
+        server.shutdown()
+        server.server_close()
+
+    def make_api(self, **overrides):
+        from pixivpy3 import AppPixivAPI
+
+        api = AppPixivAPI()
+        configure_session(api, {**DEFAULT_SETTINGS, **overrides})
+        return api
+
+    def test_adapters_keep_type_and_use_settings(self):
+        from pixivpy3 import AppPixivAPI
+
+        original = type(AppPixivAPI().requests.adapters["https://"])
+        api = self.make_api(pool_maxsize=32, retries=3, connect_timeout=2, read_timeout=9)
+        adapter = api.requests.adapters["https://"]
+        assert type(adapter) is original
+        assert adapter._pool_maxsize == 32
+        assert adapter.max_retries.total == 3
+        assert api.requests_kwargs["timeout"] == (2, 9)
+
+    def test_keep_alive_disabled(self):
+        api = self.make_api(keep_alive=False)
+        assert api.additional_headers["Connection"] == "close"
+
+    def test_connection_reuse_stats(self, server_url):
+        api = self.make_api()
+        for _ in range(3):
+            api.requests_call("GET", server_url).content
+        stats = connection_stats(api.requests)
+        assert stats["requests"] == 3
+        assert stats["new_connections"] == 1
+        assert stats["reused"] == 2
+
+
+class _SharedAccount:
+    """模拟 PixivAccount 中与共享状态相关的部分"""
+
+    def __init__(self, name):
+        self.name = name
+        self.request_count = 0
+        self.synced_count = 0
+        self.lock = threading.Lock()
+
+
+class TestSharedState:
+    """测试多 worker 共享状态（两个 SharedState 实例模拟两个 worker 进程）"""
+
+    def make_worker(self, path, owner):
+        state = SharedState()
+        state.path = str(path)
+        state.owner = owner
+        state.enabled = True
+        return state
+
+    def test_counts_are_global(self, tmp_path):
+        db = tmp_path / "state.db"
+        w1, w2 = self.make_worker(db, "1"), self.make_worker(db, "2")
+        a1, b1 = _SharedAccount("a"), _SharedAccount("b")
+        a2, b2 = _SharedAccount("a"), _SharedAccount("b")
+        a1.request_count = 5
+        w1.sync_counts([a1, b1])
+        a2.request_count, b2.request_count = 1, 2
+        w2.sync_counts([a2, b2])
+        assert (a2.request_count, b2.request_count) == (6, 2)
+        w1.sync_counts([a1, b1])
+        assert (a1.request_count, b1.request_count) == (6, 2)
+        # 同步后继续在本地累加
+        a1.request_count += 1
+        w1.sync_counts([a1, b1])
+        assert a1.request_count == 7
+
+    def test_refresh_lease_is_exclusive(self, tmp_path, monkeypatch):
+        db = tmp_path / "state.db"
+        w1, w2 = self.make_worker(db, "1"), self.make_worker(db, "2")
+        assert w1.acquire_lease("a")
+        assert w1.acquire_lease("a")
+        assert not w2.acquire_lease("a")
+        assert w2.acquire_lease("b")
+        w1.release_lease("a")
+        assert w2.acquire_lease("a")
+        # 持有者崩溃未释放时，租约过期后可被接替
+        now = time.time()
+        monkeypatch.setattr("app.shared_state.time.time", lambda: now + w2.lease_ttl + 1)
+        assert w1.acquire_lease("a")
+
+    def test_tokens_and_reset(self, tmp_path):
+        db = tmp_path / "state.db"
+        w1 = self.make_worker(db, "1")
+        assert w1.load_tokens("a") is None
+        w1.store_tokens("a", "access", "refresh", 100.0)
+        w1.add_counts({"a": 3})
+        w1.acquire_lease("a")
+        SharedState.reset(str(db))
+        w2 = self.make_worker(db, "2")
+        assert w2.load_tokens("a") == ("access", "refresh", 100.0)
+        assert w2.add_counts({}) == {"a": 0}
+        assert w2.acquire_lease("a")
+
+    def test_state_files_private(self, tmp_path):
+        db = tmp_path / "state" / "state.db"
+        SharedState.reset(str(db))
+        worker = self.make_worker(db, "1")
+        worker.store_tokens("a", "access", "refresh", 100.0)
+        assert (db.parent.stat().st_mode & 0o777) == 0o700
+        for path in (db, tmp_path / "state" / "state.db-wal", tmp_path / "state" / "state.db-shm"):
+            assert (path.stat().st_mode & 0o777) == 0o600
+
+    def test_refreshed_tokens_not_written_to_config(self, tmp_path, monkeypatch):
+        """多 worker 时刷新得到的 token 只写入共享状态，下次启动时优先使用"""
+        from app.config import config
+        from app.refresher import refresher
+
+        db = tmp_path / "state.db"
+        assert SharedState.saved_refresh_tokens(str(db)) == {}
+        worker = self.make_worker(db, "1")
+        monkeypatch.setattr("app.refresher.shared_state", worker)
+        monkeypatch.setattr(config, "add_account", lambda *args: pytest.fail("config.yaml rewritten"))
+        account = _SharedAccount("a")
+        account.api = type("API", (), {"access_token": "access"})()
+        account.refresh_token = "rotated"
+        account.username = None
+        account.last_refresh_time = 100.0
+        refresher.refreshed(account)
+        assert SharedState.saved_refresh_tokens(str(db)) == {"a": "rotated"}
+
+
+class _RefreshAccount:
+    """模拟 PixivAccount 中与后台刷新相关的部分"""
+
+    def __init__(self, name, ok=True, delay=0.0):
+        self.name = name
+        self.username = None
+        self.refresh_token = f"token-{name}"
+        self.last_refresh_time = 0.0
+        # 已到期
+        self.next_refresh_time = 1.0
+        self.refreshing = False
+        self.ok = ok
+        self.delay = delay
+        self.calls = 0
+
+    def refresh(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.ok:
+            self.last_refresh_time = time.time()
+        return self.ok
+
+
+class TestTokenRefresher:
+    """后台 token 刷新调度"""
+
+    @pytest.fixture
+    def refresher(self, monkeypatch):
+        from concurrent.futures import ThreadPoolExecutor
+        from app.config import config
+        from app.refresher import TokenRefresher
+
+        monkeypatch.setattr(config, "add_account", lambda *args: None)
+        refresher = TokenRefresher()
+        refresher.interval, refresher.jitter, refresher.retry_delay = 100, 10, 30
+        refresher.pool = type("Pool", (), {"accounts": []})()
+        refresher._executor = ThreadPoolExecutor(max_workers=4)
+        yield refresher
+        refresher._executor.shutdown(wait=True)
+
+    def test_schedule_jitter(self, refresher, monkeypatch):
+        bounds = []
+        monkeypatch.setattr("app.refresher.random.uniform", lambda a, b: bounds.append((a, b)) or b)
+        account = _RefreshAccount("a")
+        account.last_refresh_time = 1000.0
+        refresher.schedule(account)
+        assert bounds == [(0, 10)]
+        assert account.next_refresh_time == 1090.0
+
+    def test_failed_refresh_retried_after_delay(self, refresher):
+        account = _RefreshAccount("a", ok=False)
+        refresher.pool.accounts = [account]
+        refresher._tick()
+        refresher._executor.shutdown(wait=True)
+        assert account.calls == 1
+        assert account.next_refresh_time == pytest.approx(time.time() + 30, abs=1)
+
+    def test_refreshing_account_skipped(self, refresher):
+        account = _RefreshAccount("a")
+        account.refreshing = True
+        refresher.pool.accounts = [account]
+        assert refresher._tick() <= time.time() + 1
+        refresher._executor.shutdown(wait=True)
+        assert account.calls == 0
+
+    def test_due_accounts_refreshed_concurrently(self, refresher):
+        accounts = [_RefreshAccount(str(i), delay=0.2) for i in range(4)]
+        refresher.pool.accounts = accounts
+        start = time.time()
+        refresher._tick()
+        # 已派发、尚未完成的账号不会被重复派发
+        refresher._tick()
+        refresher._executor.shutdown(wait=True)
+        assert time.time() - start < 0.6
+        assert [a.calls for a in accounts] == [1] * 4
+        assert all(a.next_refresh_time > start + 80 for a in accounts)
+
+
+class TestStartupAuth:
+    """启动时并发认证：名称和顺序与配置一致，与认证完成顺序无关"""
+
+    @pytest.fixture
+    def load(self, monkeypatch):
+        from app.config import config
+        from app.pool import PixivAccount, pool
+
+        delays = {"slow": 0.15, "mid": 0.05, "fast": 0.0}
+
+        def fake_auth(self, auto_gppt=False):
+            time.sleep(delays.get(self.refresh_token, 0))
+            self.authenticated = self.refresh_token != "bad"
+            return self.authenticated
+
+        monkeypatch.setattr(PixivAccount, "auth", fake_auth)
+        monkeypatch.setattr(pool, "accounts", [])
+        monkeypatch.setattr(pool, "startup", {})
+
+        def load(entries, **startup):
+            monkeypatch.setitem(config._data, "pixiv_accounts", entries)
+            monkeypatch.setitem(config._data, "startup", startup)
+            monkeypatch.setitem(config._data, "gppt", {})
+            pool.load_from_config()
+            return pool
+
+        yield load
+        pool.selector.invalidate()
+
+    def test_names_and_order_follow_config(self, load):
+        pool = load([
+            {"refresh_token": "slow"},
+            {"name": "b", "refresh_token": "fast"},
+            {"refresh_token": "bad"},
+            {"refresh_token": "mid"},
+        ], auth_workers=4)
+        assert [a.name for a in pool.accounts] == ["account_0", "b", "account_3"]
+        status = pool.startup_status()
+        assert (status["ready"], status["failed"], status["done"]) == (3, 1, True)
+        assert sorted(status["accounts"]) == ["account_0", "account_2", "account_3", "b"]
+
+    def test_ready_accounts_then_background(self, load):
+        pool = load([
+            {"name": "a", "refresh_token": "slow"},
+            {"name": "b", "refresh_token": "mid"},
+            {"name": "c", "refresh_token": "fast"},
+        ], auth_workers=3, ready_accounts=1)
+        names = [a.name for a in pool.accounts]
+        assert "a" not in names and names[-1] == "c"
+        assert pool.wait_startup(2)
+        assert [a.name for a in pool.accounts] == ["a", "b", "c"]
+
+    def test_saved_tokens_preferred(self, load):
+        pool = load([{"name": "a", "refresh_token": "bad"}, {"name": "b", "refresh_token": "fast"}],
+                    ready_accounts=0)
+        assert [a.name for a in pool.accounts] == ["b"]
+        pool.accounts.clear()
+        pool.load_from_config({"a": "fast"})
+        assert [(a.name, a.refresh_token) for a in pool.accounts] == [("a", "fast"), ("b", "fast")]
+
+
+class TestUpstreamRetry:
+    """Flask 路由的限流重试：被限流的账号进入冷却期，请求落到其他账号"""
+
+    @pytest.fixture
+    def setup(self, client, monkeypatch):
+        from app.cache import response_cache
+        from app.config import config
+        from app.pool import PixivAccount, pool
+
+        accounts = [PixivAccount("a"), PixivAccount("b")]
+        calls = []
+        results = []
+        for account in accounts:
+            account.authenticated = True
+
+            def illust_detail(illust_id, name=account.name):
+                calls.append(name)
+                return results.pop(0) if results else {"illust": {"id": illust_id, "by": name}}
+
+            account.api.illust_detail = illust_detail
+        monkeypatch.setattr(pool, "accounts", accounts)
+        monkeypatch.setitem(config._data, "rate_limit", {"retries": 2, "cooldown": 30})
+        monkeypatch.setattr(response_cache, "enabled", False)
+        pool.selector.invalidate()
+        yield client, accounts, calls, results
+        pool.selector.invalidate()
+
+    def test_throttled_account_fails_over(self, setup):
+        client, accounts, calls, results = setup
+        results.append({"error": {"message": "Rate Limit"}})
+        r = client.get("/api/illust/1")
+        assert r.status_code == 200
+        assert len(calls) == 2 and calls[0] != calls[1]
+        assert r.get_json()["illust"]["by"] == calls[1]
+        throttled = next(a for a in accounts if a.name == calls[0])
+        assert throttled.throttle_count == 1 and throttled.cooldown_until > time.time()
+
+    def test_retries_exhausted(self, setup):
+        client, accounts, calls, results = setup
+        results.extend([{"error": {"message": "Rate Limit"}}] * 3)
+        r = client.get("/api/illust/1")
+        # 两个账号都进入冷却期，第三次尝试没有账号可选，按冷却期返回 Retry-After
+        assert r.status_code == 429
+        assert len(calls) == 2
+        assert 29 <= int(r.headers["Retry-After"]) <= 30
+
+    def test_empty_buckets_retry_after(self, setup):
+        from app.ratelimit import TokenBucket
+
+        client, accounts, calls, _ = setup
+        for account in accounts:
+            account.bucket = TokenBucket(0.5, 1)
+            account.bucket.consume()
+        r = client.get("/api/illust/1")
+        assert r.status_code == 429
+        assert r.headers["Retry-After"] == "2"
+        assert calls == []
+
+
+class TestPoolMembership:
+    def test_add_remove_rejected_with_multiple_workers(self, api_app, admin_headers, monkeypatch):
+        """多 worker 部署时账号增删只会作用于单个 worker，管理接口返回 409"""
+        from app.pool import pool
+        from app.shared_state import shared_state
+
+        removed = []
+        monkeypatch.setattr(pool, "remove_account", removed.append)
+        client = api_app.test_client()
+
+        monkeypatch.setattr(shared_state, "enabled", True)
+        assert client.post("/api/pool/add", json={"refresh_token": "t"}, headers=admin_headers).status_code == 409
+        assert client.post("/api/pool/remove", json={"name": "a"}, headers=admin_headers).status_code == 409
+        assert removed == []
+
+        monkeypatch.setattr(shared_state, "enabled", False)
+        assert client.post("/api/pool/remove", json={"name": "a"}, headers=admin_headers).status_code == 200
+        assert removed == ["a"]
+
+
+class TestHealth:
+    def test_health_before_accounts_loaded(self, monkeypatch):
+        import server
+        from app.pool import pool
+
+        monkeypatch.setattr(pool, "startup", {})
+
+        r = server.create_app().test_client().get("/health")
+        assert r.status_code == 200
+        assert r.get_json()["startup"] == {}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
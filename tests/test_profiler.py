@@ -0,0 +1,101 @@
+"""
+按需性能分析单元测试
+"""
+import pytest
+import sys
+import os
+import threading
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+
+from app.profiler import Profiler, ProfilerBusy, install_profiler, render_collapsed, render_stats
+
+
+def spin(stop):
+    while not stop.is_set():
+        sum(range(100))
+
+
+class TestSampling:
+    def test_collapsed_stacks(self):
+        profiler = Profiler()
+        stop = threading.Event()
+        thread = threading.Thread(target=spin, args=(stop,), name="spinner")
+        thread.start()
+        try:
+            counts, rounds = profiler.sample(0.2, 0.005)
+        finally:
+            stop.set()
+            thread.join()
+        assert rounds > 5
+        lines = [line for line in render_collapsed(counts).splitlines() if line.startswith("spinner;")]
+        assert lines
+        stack, count = lines[0].rsplit(" ", 1)
+        leaf = stack.split(";")[-1]
+        assert leaf.startswith("spin (") and "test_profiler.py:" in leaf
+        assert int(count) > 0
+
+    def test_one_session_at_a_time(self):
+        profiler = Profiler()
+        thread = threading.Thread(target=profiler.sample, args=(0.3,))
+        thread.start()
+        time.sleep(0.05)
+        with pytest.raises(ProfilerBusy):
+            profiler.profile_requests(1, 1)
+        thread.join()
+        assert not profiler.busy
+
+
+class TestRequestProfiling:
+    @pytest.fixture
+    def app(self, monkeypatch):
+        profiler = Profiler()
+        monkeypatch.setattr("app.profiler.profiler", profiler)
+        app = Flask(__name__)
+        install_profiler(app)
+
+        @app.route("/work")
+        def work():
+            return jsonify({"total": sum(range(1000))})
+
+        return app, profiler
+
+    def test_next_requests_profiled(self, app):
+        app, profiler = app
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(zip(("stats", "n"), profiler.profile_requests(2, 5))))
+        thread.start()
+        while not profiler.armed:
+            time.sleep(0.005)
+        client = app.test_client()
+        for _ in range(3):
+            assert client.get("/work").status_code == 200
+        thread.join()
+
+        assert result["n"] == 2
+        assert not profiler.armed
+        assert "work" in render_stats(result["stats"], "tottime")
+
+    def test_requests_mode_rejected_under_asgi(self, api_app, admin_headers, monkeypatch):
+        """ASGI 模式下异步路由不经过请求钩子，requests 模式返回 400"""
+        profiler = Profiler()
+        profiler.requests_supported = False
+        monkeypatch.setattr("app.routes.profile_routes.profiler", profiler)
+        r = api_app.test_client().post("/api/admin/profile?mode=requests&count=1", headers=admin_headers)
+        assert r.status_code == 400
+        assert "ASGI" in r.get_json()["error"]
+        assert not profiler.busy
+
+    def test_idle_requests_untouched(self, app):
+        app, profiler = app
+        assert app.test_client().get("/work").status_code == 200
+        stats, profiled = profiler.profile_requests(1, 0.05)
+        assert (stats, profiled) == (None, 0)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,109 @@
+"""
+字段投影单元测试
+"""
+import pytest
+import sys
+import os
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from app.cache import MemoryCacheBackend, cached_json, response_cache
+from app.projection import parse_fields
+
+ILLUST = {
+    "id": 1,
+    "title": "t",
+    "image_urls": {"medium": "m", "large": "l"},
+    "user": {"id": 2, "name": "u"},
+    "tags": [{"name": "a", "translated_name": None}, {"name": "b", "translated_name": "B"}],
+}
+
+
+class TestFields:
+    def test_nested_paths_and_lists(self):
+        fields = parse_fields("id, image_urls.medium,user.id,tags.name,missing")
+        assert fields.record(ILLUST) == {
+            "id": 1,
+            "image_urls": {"medium": "m"},
+            "user": {"id": 2},
+            "tags": [{"name": "a"}, {"name": "b"}],
+        }
+
+    def test_whole_field_wins(self):
+        assert parse_fields("user.id,user").record(ILLUST)["user"] == ILLUST["user"]
+        assert parse_fields("user,user.id").record(ILLUST)["user"] == ILLUST["user"]
+
+    def test_key_is_normalized(self):
+        assert parse_fields("title,id").key == parse_fields("id,,title,id").key
+        assert parse_fields("") is None
+        assert parse_fields(" , ") is None
+
+    def test_apply_to_results(self):
+        fields = parse_fields("id")
+        page = {"illusts": [ILLUST, ILLUST], "next_url": "n", "search_span_limit": 1}
+        assert fields.apply(page) == {"illusts": [{"id": 1}, {"id": 1}], "next_url": "n"}
+        assert fields.apply({"illust": ILLUST}) == {"illust": {"id": 1}}
+        error = {"error": {"message": "not found"}}
+        assert fields.apply(error) is error
+
+
+class TestCachedProjection:
+    @pytest.fixture
+    def app(self):
+        response_cache.backend = MemoryCacheBackend()
+        response_cache.enabled = True
+        response_cache.ttls = {"illust_detail": 60}
+        return Flask(__name__)
+
+    def test_views_share_full_entry(self, app):
+        """不同字段组合从同一个完整结果投影，只请求一次上游"""
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return {"illust": ILLUST}
+
+        with app.test_request_context("/api/illust/1"):
+            first = cached_json("illust_detail", {"illust_id": 1}, fetch, parse_fields("id"))
+            second = cached_json("illust_detail", {"illust_id": 1}, fetch, parse_fields("title"))
+            third = cached_json("illust_detail", {"illust_id": 1}, fetch, parse_fields("id"))
+            full = cached_json("illust_detail", {"illust_id": 1}, fetch)
+
+        assert first.get_json() == {"illust": {"id": 1}}
+        assert second.get_json() == {"illust": {"title": "t"}}
+        assert [r.headers["X-Cache"] for r in (first, second, third, full)] == ["MISS", "HIT", "HIT", "HIT"]
+        assert full.get_json() == {"illust": ILLUST}
+        assert len(calls) == 1
+
+    def test_stats_count_one_lookup_per_request(self, app):
+        """投影请求先查视图，视图命中、完整结果命中和未命中各只计一次"""
+        backend = response_cache.backend
+
+        def get(illust_id, fields=None):
+            return cached_json("illust_detail", {"illust_id": illust_id}, lambda: {"illust": ILLUST}, fields)
+
+        with app.test_request_context("/api/illust/1"):
+            get(1)
+            backend.hits = backend.misses = 0
+            get(1, parse_fields("id"))
+            assert (backend.hits, backend.misses) == (1, 0)
+
+            backend.hits = 0
+            assert get(1, parse_fields("id")).headers["X-Cache"] == "HIT"
+            assert (backend.hits, backend.misses) == (1, 0)
+
+            get(2, parse_fields("id"))
+            assert (backend.hits, backend.misses) == (1, 1)
+
+    def test_uncached_endpoint_projected(self, app):
+        with app.test_request_context("/api/search"):
+            r = cached_json("search", {"word": "a"}, lambda: {"illusts": [ILLUST]}, parse_fields("id"))
+        assert r.get_json() == {"illusts": [{"id": 1}]}
+        assert response_cache.stats()["entries"] == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,76 @@
+"""
+请求耗时分解与慢请求日志单元测试
+"""
+import pytest
+import sys
+import os
+import time
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+
+from app.timing import RequestTiming, Timing, install_timing, record_phase
+
+
+class TestRequestTiming:
+    def test_phases_summed_in_order(self):
+        timing = RequestTiming()
+        timing.spans += [("pixiv", 0.2), ("select", 0.001), ("pixiv", 0.3), ("auth", 0.0005)]
+        assert list(timing.phases()) == ["auth", "select", "pixiv"]
+        assert timing.phases()["pixiv"] == pytest.approx(0.5)
+        assert timing.header(total=0.6) == "auth;dur=0.5, select;dur=1.0, pixiv;dur=500.0, total;dur=600.0"
+
+    def test_record_outside_request_is_noop(self):
+        record_phase("pixiv", 1.0, "a")
+
+
+class TestFlaskTiming:
+    @pytest.fixture
+    def app(self, monkeypatch, tmp_path):
+        timing = Timing()
+        timing.server_timing = True
+        timing.slow_threshold = 0.05
+        timing.slow_log = str(tmp_path / "logs" / "slow.log")
+        monkeypatch.setattr("app.timing.timing", timing)
+        app = Flask(__name__)
+        install_timing(app)
+
+        @app.route("/slow")
+        def slow():
+            record_phase("auth", 0.001)
+            time.sleep(0.06)
+            record_phase("pixiv", 0.06, "acc1")
+            return jsonify({"ok": True})
+
+        @app.route("/fast")
+        def fast():
+            return jsonify({"ok": True})
+
+        yield app, timing
+        timing.close()
+
+    def test_server_timing_and_slow_log(self, app):
+        app, timing = app
+        client = app.test_client()
+        fast = client.get("/fast")
+        slow = client.get("/slow?x=1")
+        assert fast.headers["Server-Timing"].startswith("total;dur=")
+        assert slow.headers["Server-Timing"].startswith("auth;dur=1.0, pixiv;dur=60.0, total;dur=")
+
+        with open(timing.slow_log, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert len(lines) == 1
+        assert "GET /slow?x=1 200 key=- account=acc1 auth=1.0ms pixiv=60.0ms" in lines[0]
+
+    def test_disabled_records_nothing(self, app):
+        app, timing = app
+        timing.enabled = False
+        r = app.test_client().get("/slow")
+        assert "Server-Timing" not in r.headers
+        assert not os.path.exists(timing.slow_log)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])